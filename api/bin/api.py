@@ -1,5 +1,47 @@
 #!/usr/bin/env python
 
-import service
+import os
+import shutil
 
-service.build().run(host='0.0.0.0', port=80)
+import gunicorn.app.base
+
+WORKERS = int(os.environ.get("WORKERS", 4))
+THREADS = int(os.environ.get("THREADS", 8))
+METRICS = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Metrics from the last run would otherwise be added to this one's
+
+if METRICS:
+    shutil.rmtree(METRICS, ignore_errors=True)
+    os.makedirs(METRICS)
+
+import service # pylint: disable=wrong-import-position
+
+class API(gunicorn.app.base.BaseApplication): # pylint: disable=abstract-method
+    """
+    Serves the app across processes and threads, each worker building its own
+    """
+
+    def load_config(self):
+
+        self.cfg.set("bind", "0.0.0.0:80")
+        self.cfg.set("workers", WORKERS)
+        self.cfg.set("threads", THREADS)
+        self.cfg.set("child_exit", self.child_exit)
+
+    @staticmethod
+    def child_exit(server, worker): # pylint: disable=unused-argument
+
+        if METRICS:
+            service.metrics.mark_process_dead_on_child_exit(worker.pid)
+
+    def load(self):
+
+        return service.build()
+
+# No workers runs in this process, like when debugging
+
+if WORKERS:
+    API().run()
+else:
+    service.build().run(host='0.0.0.0', port=80)
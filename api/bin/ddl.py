@@ -1,9 +1,14 @@
 #!/usr/bin/env python
 
+import time
+import datetime
+
 import relations
 import relations_pymysql
 
 import ledger
+import partition
+import search
 
 source = relations_pymysql.Source("ledger", schema="ledger", connection=False)
 
@@ -11,3 +16,20 @@ migrations = relations.Migrations()
 
 migrations.generate(relations.models(ledger, ledger.Base))
 migrations.convert("ledger")
+
+# relations doesn't know partitions, so add them on after
+
+partition.ddl(
+    "ddl/ledger/mysql",
+    relations.models(ledger, ledger.Base),
+    time.time(),
+    datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S-%f')
+)
+
+# nor FULLTEXT, which can't be on partitioned tables anyway
+
+search.ddl(
+    "ddl/ledger/mysql",
+    relations.models(ledger, ledger.Base),
+    datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S-%f')
+)
@@ -0,0 +1,93 @@
+CREATE TABLE IF NOT EXISTS `ledger`.`blob` (
+  `id` BIGINT AUTO_INCREMENT,
+  `who` VARCHAR(255) NOT NULL,
+  `size` BIGINT,
+  `data` JSON NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE `who` (`who`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`claim` (
+  `id` BIGINT AUTO_INCREMENT,
+  `witness_id` BIGINT,
+  `who` VARCHAR(255) NOT NULL,
+  `when` BIGINT,
+  `token` VARCHAR(255),
+  PRIMARY KEY (`id`),
+  UNIQUE `witness_id_who` (`witness_id`,`who`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`entity` (
+  `id` BIGINT AUTO_INCREMENT,
+  `unum_id` BIGINT,
+  `who` VARCHAR(255) NOT NULL,
+  `meta` JSON NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE `unum_id_who` (`unum_id`,`who`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`fact` (
+  `id` BIGINT AUTO_INCREMENT,
+  `witness_id` BIGINT,
+  `who` VARCHAR(255) NOT NULL,
+  `when` BIGINT NOT NULL,
+  `what` JSON NOT NULL,
+  `meta` JSON NOT NULL,
+  PRIMARY KEY (`id`),
+  INDEX `when` (`when`),
+  INDEX `witness_id_when_id` (`witness_id`,`when`,`id`),
+  UNIQUE `witness_id_who` (`witness_id`,`who`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`origin` (
+  `id` BIGINT AUTO_INCREMENT,
+  `who` VARCHAR(255) NOT NULL,
+  `meta` JSON NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE `who` (`who`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`rollup` (
+  `id` BIGINT AUTO_INCREMENT,
+  `witness_id` BIGINT,
+  `entity_id` BIGINT,
+  `unum_id` BIGINT,
+  `origin_id` BIGINT,
+  `period` VARCHAR(255) NOT NULL DEFAULT 'hour',
+  `bucket` BIGINT,
+  `count` BIGINT,
+  PRIMARY KEY (`id`),
+  INDEX `entity_id_period_bucket` (`entity_id`,`period`,`bucket`),
+  INDEX `origin_id_period_bucket` (`origin_id`,`period`,`bucket`),
+  INDEX `unum_id_period_bucket` (`unum_id`,`period`,`bucket`),
+  UNIQUE `witness_id_period_bucket` (`witness_id`,`period`,`bucket`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`text` (
+  `id` BIGINT AUTO_INCREMENT,
+  `fact_id` BIGINT,
+  `witness_id` BIGINT,
+  `when` BIGINT,
+  `text` VARCHAR(255) NOT NULL,
+  PRIMARY KEY (`id`),
+  INDEX `witness_id_when` (`witness_id`,`when`),
+  UNIQUE `fact_id` (`fact_id`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`unum` (
+  `id` BIGINT AUTO_INCREMENT,
+  `who` VARCHAR(255) NOT NULL,
+  `meta` JSON NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE `who` (`who`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`witness` (
+  `id` BIGINT AUTO_INCREMENT,
+  `entity_id` BIGINT,
+  `origin_id` BIGINT,
+  `who` VARCHAR(255) NOT NULL,
+  `meta` JSON NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE `entity_id_origin_id_who` (`entity_id`,`origin_id`,`who`)
+);
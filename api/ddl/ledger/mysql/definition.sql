@@ -1,3 +1,25 @@
+CREATE TABLE IF NOT EXISTS `ledger`.`blob` (
+  `id` BIGINT AUTO_INCREMENT,
+  `who` VARCHAR(255) NOT NULL,
+  `size` BIGINT,
+  `data` JSON NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE `who` (`who`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`claim` (
+  `id` BIGINT AUTO_INCREMENT,
+  `witness_id` BIGINT,
+  `who` VARCHAR(255) NOT NULL,
+  `when` BIGINT,
+  `token` VARCHAR(255),
+  PRIMARY KEY (`id`,`when`),
+  UNIQUE `witness_id_who` (`witness_id`,`who`,`when`)
+)
+PARTITION BY RANGE (`when`) (
+  PARTITION `future` VALUES LESS THAN MAXVALUE
+);
+
 CREATE TABLE IF NOT EXISTS `ledger`.`entity` (
   `id` BIGINT AUTO_INCREMENT,
   `unum_id` BIGINT,
@@ -11,12 +33,16 @@ CREATE TABLE IF NOT EXISTS `ledger`.`fact` (
   `id` BIGINT AUTO_INCREMENT,
   `witness_id` BIGINT,
   `who` VARCHAR(255) NOT NULL,
-  `when` BIGINT,
+  `when` BIGINT NOT NULL,
   `what` JSON NOT NULL,
   `meta` JSON NOT NULL,
-  PRIMARY KEY (`id`),
+  PRIMARY KEY (`id`,`when`),
   INDEX `when` (`when`),
-  UNIQUE `witness_id_who` (`witness_id`,`who`)
+  INDEX `witness_id_when_id` (`witness_id`,`when`,`id`),
+  UNIQUE `witness_id_who` (`witness_id`,`who`,`when`)
+)
+PARTITION BY RANGE (`when`) (
+  PARTITION `future` VALUES LESS THAN MAXVALUE
 );
 
 CREATE TABLE IF NOT EXISTS `ledger`.`origin` (
@@ -27,6 +53,34 @@ CREATE TABLE IF NOT EXISTS `ledger`.`origin` (
   UNIQUE `who` (`who`)
 );
 
+CREATE TABLE IF NOT EXISTS `ledger`.`rollup` (
+  `id` BIGINT AUTO_INCREMENT,
+  `witness_id` BIGINT,
+  `entity_id` BIGINT,
+  `unum_id` BIGINT,
+  `origin_id` BIGINT,
+  `period` VARCHAR(255) NOT NULL DEFAULT 'hour',
+  `bucket` BIGINT,
+  `count` BIGINT,
+  PRIMARY KEY (`id`),
+  INDEX `entity_id_period_bucket` (`entity_id`,`period`,`bucket`),
+  INDEX `origin_id_period_bucket` (`origin_id`,`period`,`bucket`),
+  INDEX `unum_id_period_bucket` (`unum_id`,`period`,`bucket`),
+  UNIQUE `witness_id_period_bucket` (`witness_id`,`period`,`bucket`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`text` (
+  `id` BIGINT AUTO_INCREMENT,
+  `fact_id` BIGINT,
+  `witness_id` BIGINT,
+  `when` BIGINT,
+  `text` MEDIUMTEXT NOT NULL,
+  PRIMARY KEY (`id`),
+  INDEX `witness_id_when` (`witness_id`,`when`),
+  UNIQUE `fact_id` (`fact_id`),
+  FULLTEXT `text` (`text`)
+);
+
 CREATE TABLE IF NOT EXISTS `ledger`.`unum` (
   `id` BIGINT AUTO_INCREMENT,
   `who` VARCHAR(255) NOT NULL,
@@ -0,0 +1,2 @@
+ALTER TABLE `ledger`.`fact`
+  ADD INDEX `witness_id_when_id` (`witness_id`,`when`,`id`);
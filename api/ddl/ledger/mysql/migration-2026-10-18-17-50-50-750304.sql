@@ -0,0 +1,2 @@
+ALTER TABLE `ledger`.`fact`
+  CHANGE `when` `when` BIGINT NOT NULL;
@@ -0,0 +1,10 @@
+ALTER TABLE `ledger`.`fact`
+  DROP PRIMARY KEY,
+  DROP INDEX `witness_id_who`,
+  ADD UNIQUE `witness_id_who` (`witness_id`,`who`,`when`),
+  ADD PRIMARY KEY (`id`,`when`);
+ALTER TABLE `ledger`.`fact`
+  PARTITION BY RANGE (`when`) (
+    PARTITION `past` VALUES LESS THAN (1790812800),
+    PARTITION `future` VALUES LESS THAN MAXVALUE
+  );
\ No newline at end of file
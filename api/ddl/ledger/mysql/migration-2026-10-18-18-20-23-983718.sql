@@ -0,0 +1,3 @@
+ALTER TABLE `ledger`.`text`
+  MODIFY `text` MEDIUMTEXT NOT NULL,
+  ADD FULLTEXT `text` (`text`);
\ No newline at end of file
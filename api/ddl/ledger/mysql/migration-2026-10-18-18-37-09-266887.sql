@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS `ledger`.`claim` (
+  `id` BIGINT AUTO_INCREMENT,
+  `witness_id` BIGINT,
+  `who` VARCHAR(255) NOT NULL,
+  `when` BIGINT,
+  `token` VARCHAR(255),
+  PRIMARY KEY (`id`),
+  INDEX `when` (`when`),
+  UNIQUE `witness_id_who` (`witness_id`,`who`)
+);
@@ -0,0 +1,2 @@
+INSERT IGNORE INTO `ledger`.`claim` (`witness_id`,`who`,`when`,`token`)
+  SELECT `witness_id`,`who`,MIN(`when`),'' FROM `ledger`.`fact` GROUP BY `witness_id`,`who`;
@@ -0,0 +1,2 @@
+ALTER TABLE `ledger`.`claim`
+  DROP INDEX `when`;
@@ -0,0 +1,12 @@
+SET time_zone = '+00:00';
+UPDATE `ledger`.`claim` SET `when` = UNIX_TIMESTAMP(DATE_FORMAT(FROM_UNIXTIME(`when`), '%Y-%m-01'));
+ALTER TABLE `ledger`.`claim`
+  DROP PRIMARY KEY,
+  DROP INDEX `witness_id_who`,
+  ADD UNIQUE `witness_id_who` (`witness_id`,`who`,`when`),
+  ADD PRIMARY KEY (`id`,`when`);
+ALTER TABLE `ledger`.`claim`
+  PARTITION BY RANGE (`when`) (
+    PARTITION `past` VALUES LESS THAN (1790812800),
+    PARTITION `future` VALUES LESS THAN MAXVALUE
+  );
\ No newline at end of file
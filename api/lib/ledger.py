@@ -63,11 +63,85 @@ class Fact(Base):
     id = int
     witness_id = int    # Witness this is referencing
     who = str           # unique way to identity this witness, event id, etc
-    when = int          # Epech time this happened
+    when = int, False   # Epech time this happened, required as facts are partitioned by it
     what = dict         # playlof of the entire fact from the Origin
     meta = dict         # any special weird data
 
-    INDEX = "when"
+    INDEX = {
+        "when": ["when"],
+        "witness_id-when-id": ["witness_id", "when", "id"] # Keyset paging a witness newest first
+    }
     ORDER = "-when"
+    PARTITION = "when"  # Partitioned by month, see partition.py, so Claims keep witness_id/who unique
 
 relations.OneToMany(Witness, Fact)
+
+class Claim(Base):
+    """
+    Claim, a witness's who taken by a fact in a month, kept apart from facts as they're partitioned by when
+    """
+
+    id = int
+    witness_id = int    # Witness of the fact
+    who = str           # Who of the fact
+    when = int          # Start of the month the fact happened in, so claims drop with their facts' partitions
+    token = str         # The create that claimed it, so it knows its own
+
+    UNIQUE = {
+        "witness_id-who": ["witness_id", "who"]
+    }
+    PARTITION = "when"  # Partitioned by month like Fact, so the month's part of the unique key
+
+class Blob(Base):
+    """
+    Blob, a large what stored once by its content, compressed, that Facts reference in meta
+    """
+
+    id = int
+    who = str   # sha256 of the what's JSON, unique way to identify
+    size = int  # bytes of the what's JSON before compressing
+    data = dict # the what's JSON compressed, {"zlib": base64}
+
+class Text(Base):
+    """
+    Text, what a fact says, kept apart from facts to be searched as facts are partitioned
+    """
+
+    id = int
+    fact_id = int           # Fact the text is from
+    witness_id = int        # Witness of the fact
+    when = int              # When the fact happened
+    text = str              # Everything searchable in the what, made MEDIUMTEXT by search
+
+    UNIQUE = {
+        "fact_id": ["fact_id"]
+    }
+    INDEX = {
+        "witness_id-when": ["witness_id", "when"]
+    }
+    FULLTEXT = {
+        "text": ["text"]
+    }
+
+class Rollup(Base):
+    """
+    Rollup, how many facts a witness had in an hour or day, with whose it is so they can be summed up
+    """
+
+    id = int
+    witness_id = int        # Witness the facts are from
+    entity_id = int         # Entity the witness is witnessing
+    unum_id = int           # Unum the entity is a part of
+    origin_id = int         # Origin the witness is on
+    period = ["hour", "day"]
+    bucket = int            # Epoch time the hour or day started, UTC
+    count = int             # How many facts
+
+    UNIQUE = {
+        "witness_id-period-bucket": ["witness_id", "period", "bucket"]
+    }
+    INDEX = {
+        "entity_id-period-bucket": ["entity_id", "period", "bucket"],
+        "unum_id-period-bucket": ["unum_id", "period", "bucket"],
+        "origin_id-period-bucket": ["origin_id", "period", "bucket"]
+    }
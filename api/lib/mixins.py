@@ -0,0 +1,207 @@
+"""
+Module for Resource mixins, kept out of service so attach doesn't take them for Resources of models
+"""
+
+import json
+import hashlib
+
+import flask
+import werkzeug
+import redis
+
+import relations
+import relations_mysql
+import relations_restx
+
+class Cached(relations_restx.Resource):
+    """
+    Mixin for Resources of small, rarely changing models, caching reads in Redis until any of them change
+
+    All cached models share one generation, since formats include titles from the others.
+    """
+
+    KEY = "ledger/cache"
+    TTL = 60*60 # In case something changes them without going through us
+
+    @classmethod
+    def key(cls):
+        """
+        Key for the current request in the current generation
+        """
+
+        generation = flask.current_app.redis.get(cls.KEY) or 0
+        body = hashlib.sha256(flask.request.get_data()).hexdigest()
+
+        return f"{cls.KEY}/{generation}/{flask.request.full_path}/{body}"
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Moves to a new generation so nothing cached is read again
+        """
+
+        try:
+            flask.current_app.redis.incr(cls.KEY)
+        except redis.RedisError:
+            flask.current_app.logger.warning("invalidate", exc_info=True)
+
+    def get(self, id=None): # pylint: disable=redefined-builtin
+        """
+        Retrieves one or more models, from the cache if we can
+        """
+
+        try:
+            key = self.key()
+            cached = flask.current_app.redis.get(key)
+        except redis.RedisError:
+            return super().get(id)
+
+        if cached is not None:
+            return json.loads(cached), 200
+
+        response = super().get(id)
+        body, status = response if isinstance(response, tuple) else (response, 200)
+
+        if status == 200:
+            try:
+                flask.current_app.redis.set(key, json.dumps(body), ex=self.TTL)
+            except redis.RedisError:
+                pass
+
+        return body, status
+
+    def post(self):
+        """
+        Creates (or filters) models, invalidating if created
+        """
+
+        response = super().post()
+
+        if "filter" not in self.json():
+            self.invalidate()
+
+        return response
+
+    def patch(self, id=None): # pylint: disable=redefined-builtin
+        """
+        Updates models and invalidates
+        """
+
+        response = super().patch(id)
+        self.invalidate()
+
+        return response
+
+    def delete(self, id=None): # pylint: disable=redefined-builtin
+        """
+        Deletes models and invalidates
+        """
+
+        response = super().delete(id)
+        self.invalidate()
+
+        return response
+
+class Projected(relations_restx.Resource):
+    """
+    Mixin for Resources to list only the fields asked for, selecting and sending just those columns
+
+    Fields come as fields=a,b in the args or a fields list in the JSON. The id's always
+    included and formats are left out, since those are for showing whole models.
+    """
+
+    @classmethod
+    def criteria(cls, verify=False):
+        """
+        Gets criteria from the flask request, sans fields
+        """
+
+        criteria = super().criteria(verify)
+        criteria.pop("fields", None)
+
+        return criteria
+
+    def projection(self):
+        """
+        Gets the fields asked for from the flask request, None if all
+        """
+
+        fields = None
+
+        if flask.request.args and "fields" in flask.request.args:
+            fields = [field for field in flask.request.args["fields"].split(",") if field]
+
+        if "fields" in self.json():
+            fields = flask.request.json["fields"]
+
+        if fields is None:
+            return None
+
+        names = [field.name for field in self._model._fields._order] # pylint: disable=protected-access
+        unknown = [field for field in fields if field not in names]
+
+        if unknown:
+            raise werkzeug.exceptions.BadRequest(f"unknown fields {unknown}")
+
+        return [self._model._id] + [field for field in fields if field != self._model._id] # pylint: disable=protected-access
+
+    def select(self, models, fields):
+        """
+        Query retrieving only the columns for these fields
+        """
+
+        query = models.query()
+        query.FIELDS = relations_mysql.FIELDS([self._model._fields._names[field].store for field in fields]) # pylint: disable=protected-access
+
+        return query
+
+    def retrieve(self, models, query):
+        """
+        Retrieves rows as dicts by field name rather than models, which would fill in everything not selected
+        """
+
+        source = relations.source(self.MODEL.SOURCE)
+
+        query.generate()
+
+        cursor = source.connection.cursor()
+        cursor.execute(query.sql, tuple(query.args))
+
+        rows = [
+            {
+                field.name: row[field.store]
+                for field in self._model._fields._order # pylint: disable=protected-access
+                if field.store in row
+            }
+            for row in [source.values_retrieve(models, row) for row in cursor.fetchall()]
+        ]
+
+        cursor.close()
+
+        if models._limit is not None: # pylint: disable=protected-access
+            models.overflow = models.overflow or len(rows) >= models._limit # pylint: disable=protected-access
+
+        return rows
+
+    def project(self, rows, fields):
+        """
+        Keeps only these fields
+        """
+
+        return [{field: row[field] for field in fields} for row in rows]
+
+    @relations_restx.exceptions
+    def get(self, id=None): # pylint: disable=redefined-builtin
+        """
+        Retrieves one or more models, only the fields asked for if listing
+        """
+
+        fields = self.projection()
+
+        if id is not None or fields is None or self.count():
+            return super().get(id)
+
+        models = self.MODEL.many(**self.criteria()).sort(*self.sort()).limit(**self.limit())
+        rows = self.retrieve(models, self.select(models, fields))
+
+        return {self.PLURAL: self.project(rows, fields), "overflow": models.overflow}, 200
@@ -0,0 +1,192 @@
+"""
+Module for partitioning tables by month
+"""
+
+import re
+import datetime
+
+import schema
+
+FUTURE = "future" # Catch all partition that new months are split from
+PAST = "past"     # Partition for everything before we started partitioning
+
+def month(when, months=0):
+    """
+    Epoch time for the start of a month in UTC, optionally moved some months
+    """
+
+    at = datetime.datetime.fromtimestamp(when, tz=datetime.timezone.utc)
+
+    index = at.year * 12 + at.month - 1 + months
+
+    return int(datetime.datetime(index // 12, index % 12 + 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+
+def name(bound):
+    """
+    Name of the partition for the month before a bound
+    """
+
+    return datetime.datetime.fromtimestamp(month(bound, -1), tz=datetime.timezone.utc).strftime("p%Y%m")
+
+def keys(model):
+    """
+    Unique keys with the partition field added, as MySQL requires
+    """
+
+    thy = model.thy()
+
+    return {
+        unique: [schema.store(model, field) for field in fields] + [model.PARTITION]
+        for unique, fields in thy._unique.items() # pylint: disable=protected-access
+    }
+
+def define(sql, model):
+    """
+    Rewrites a model's CREATE TABLE to be partitioned
+    """
+
+    create = re.search(rf"CREATE TABLE IF NOT EXISTS {re.escape(schema.table(model))} \(\n.*?\n\);", sql, re.S)
+
+    if not create or "PARTITION BY" in create.group(0):
+        return sql
+
+    key = model.thy()._id # pylint: disable=protected-access
+
+    partitioned = create.group(0).replace(f"PRIMARY KEY (`{key}`)", f"PRIMARY KEY (`{key}`,`{model.PARTITION}`)")
+
+    for unique, stores in keys(model).items():
+        partitioned = re.sub(
+            rf"UNIQUE `{unique.replace('-', '_')}` \(.*?\)",
+            f"UNIQUE `{unique.replace('-', '_')}` ({','.join(f'`{store}`' for store in stores)})",
+            partitioned
+        )
+
+    partitioned = partitioned[:-1] + (
+        f"\nPARTITION BY RANGE (`{model.PARTITION}`) (\n"
+        f"  PARTITION `{FUTURE}` VALUES LESS THAN MAXVALUE\n"
+        ");"
+    )
+
+    return sql[:create.start()] + partitioned + sql[create.end():]
+
+def migration(model, when):
+    """
+    ALTERs to partition an existing table, everything before when's month going to past
+    """
+
+    uniques = "".join(
+        f"  DROP INDEX `{unique.replace('-', '_')}`,\n"
+        f"  ADD UNIQUE `{unique.replace('-', '_')}` ({','.join(f'`{store}`' for store in stores)}),\n"
+        for unique, stores in keys(model).items()
+    )
+
+    return (
+        f"ALTER TABLE {schema.table(model)}\n"
+        f"  DROP PRIMARY KEY,\n"
+        f"{uniques}"
+        f"  ADD PRIMARY KEY (`{model.thy()._id}`,`{model.PARTITION}`);\n" # pylint: disable=protected-access
+        f"ALTER TABLE {schema.table(model)}\n"
+        f"  PARTITION BY RANGE (`{model.PARTITION}`) (\n"
+        f"    PARTITION `{PAST}` VALUES LESS THAN ({month(when)}),\n"
+        f"    PARTITION `{FUTURE}` VALUES LESS THAN MAXVALUE\n"
+        "  );"
+    )
+
+def ddl(path, models, when, stamp):
+    """
+    Partitions the current definition, adding a migration for any table not yet partitioned
+    """
+
+    return schema.ddl(
+        path,
+        [model for model in models if getattr(model, "PARTITION", None)],
+        stamp,
+        define,
+        lambda model: migration(model, when),
+        lambda model: f"ALTER TABLE {schema.table(model)}\n  PARTITION BY"
+    )
+
+def partitions(source, model):
+    """
+    Lists a model's partitions and the bound each is less than, None for MAXVALUE
+    """
+
+    cursor = source.connection.cursor()
+
+    cursor.execute(
+        """
+        SELECT PARTITION_NAME AS `name`, PARTITION_DESCRIPTION AS `bound`
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA=%s AND TABLE_NAME=%s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+        """,
+        (model.thy().SCHEMA or source.schema, model.thy().STORE)
+    )
+
+    found = [
+        {"name": row["name"], "bound": None if row["bound"] == "MAXVALUE" else int(row["bound"])}
+        for row in cursor.fetchall()
+    ]
+
+    cursor.close()
+
+    return found
+
+def maintain(source, model, when, ahead=3, retain=0):
+    """
+    Splits months off future to stay ahead and drops months past retention
+
+    Dropping's a metadata operation, nothing like DELETEing the rows. A retain
+    of 0 keeps everything.
+    """
+
+    existing = partitions(source, model)
+
+    if not existing:
+        return {"added": [], "dropped": []}
+
+    bounds = [partition["bound"] for partition in existing if partition["bound"] is not None]
+
+    # Bounds are always the start of a month, so just keep going a month at a time
+
+    bound = month(bounds[-1], 1) if bounds else month(when, 1)
+    target = month(when, ahead + 1)
+
+    added = []
+
+    while bound <= target:
+        added.append({"name": name(bound), "bound": bound})
+        bound = month(bound, 1)
+
+    cursor = source.connection.cursor()
+
+    if added:
+
+        splits = "".join(f"  PARTITION `{add['name']}` VALUES LESS THAN ({add['bound']}),\n" for add in added)
+
+        cursor.execute(
+            f"ALTER TABLE {schema.table(model)} REORGANIZE PARTITION `{FUTURE}` INTO (\n"
+            f"{splits}"
+            f"  PARTITION `{FUTURE}` VALUES LESS THAN MAXVALUE\n"
+            ")"
+        )
+
+    dropped = []
+
+    if retain:
+
+        cutoff = month(when, -retain)
+
+        dropped = [
+            partition["name"] for partition in existing
+            if partition["bound"] is not None and partition["bound"] <= cutoff
+        ]
+
+        if dropped:
+            cursor.execute(
+                f"ALTER TABLE {schema.table(model)} DROP PARTITION {','.join(f'`{drop}`' for drop in dropped)}"
+            )
+
+    cursor.close()
+
+    return {"added": [add["name"] for add in added], "dropped": dropped}
@@ -0,0 +1,155 @@
+"""
+Module for pooling MySQL connections
+"""
+
+import os
+import time
+import threading
+
+import pymysql
+
+import relations_pymysql
+
+class Source(relations_pymysql.Source): # pylint: disable=too-many-instance-attributes
+    """
+    MySQL Source that checks connections out of a pool as threads need them and back in when they're done
+
+    Connections are only pinged on checkout if they've been idle a while, and are
+    replaced once they're old, so a request usually gets one without a round trip.
+    """
+
+    size = None     # Most connections out at once
+    check = None    # Ping connections idle longer than this on checkout
+    recycle = None  # Replace connections older than this
+    wait = None     # How long to wait for a connection when they're all out
+    idle = None     # Connections checked in, with when they were made and last used
+    born = None     # When connections checked out were made, by thread
+    slots = None
+    pid = None
+
+    def __init__(self, name, schema, size=10, check=30, recycle=60*60, wait=30, **kwargs): # pylint: disable=super-init-not-called,too-many-arguments
+
+        self.schema = schema
+        self.kwargs = {name: arg for name, arg in kwargs.items() if name not in ["name", "schema", "connection"]}
+        self.lock = threading.Lock()
+        self.created = True
+
+        self.size = size
+        self.check = check
+        self.recycle = recycle
+        self.wait = wait
+
+        self.reset()
+
+    def __getattr__(self, name):
+
+        if name == "connection":
+
+            thread = threading.get_ident()
+
+            if os.getpid() != self.pid:
+                self.reset()
+
+            if thread not in self.connections:
+                self.checkout()
+
+            return self.connections[thread]
+
+        raise AttributeError(f"'{self}' object has no attribute '{name}'")
+
+    def __del__(self):
+
+        if self.idle:
+            self.close()
+
+    def reset(self):
+        """
+        Starts with an empty pool, dropping any connections inherited from a parent process
+        """
+
+        self.connections = {}
+        self.idle = []
+        self.born = {}
+        self.slots = threading.BoundedSemaphore(self.size)
+        self.pid = os.getpid()
+
+    def connect(self):
+        """
+        Makes a new connection
+        """
+
+        return pymysql.connect(cursorclass=pymysql.cursors.DictCursor, **self.kwargs)
+
+    def checkout(self):
+        """
+        Gives this thread a connection, reusing an idle one if it's healthy
+        """
+
+        if not self.slots.acquire(timeout=self.wait): # pylint: disable=consider-using-with
+            raise TimeoutError(f"no connection available after {self.wait} seconds")
+
+        connection = None
+        now = time.time()
+
+        with self.lock:
+
+            while self.idle:
+
+                connection, born, used = self.idle.pop()
+
+                if now - born < self.recycle:
+                    break
+
+                connection.close()
+                connection = None
+
+        if connection is not None and now - used >= self.check:
+            try:
+                connection.ping(False)
+            except pymysql.err.Error:
+                connection = None
+
+        if connection is None:
+
+            try:
+                connection = self.connect()
+            except Exception:
+                self.slots.release()
+                raise
+
+            born = now
+
+        self.connections[threading.get_ident()] = connection
+        self.born[threading.get_ident()] = born
+
+    def checkin(self):
+        """
+        Returns this thread's connection to the pool, if it has one
+        """
+
+        thread = threading.get_ident()
+
+        if thread not in self.connections:
+            return
+
+        with self.lock:
+
+            connection = self.connections.pop(thread)
+            born = self.born.pop(thread)
+
+            if getattr(connection, "open", True):
+                self.idle.append((connection, born, time.time()))
+
+        self.slots.release()
+
+    def close(self):
+        """
+        Closes everything idle
+        """
+
+        with self.lock:
+
+            for connection, _, _ in self.idle:
+                connection.close()
+
+            self.idle = []
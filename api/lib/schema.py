@@ -0,0 +1,62 @@
+"""
+Module for adding what relations doesn't know about to the DDL it generates
+"""
+
+import glob
+
+def table(model):
+    """
+    Full table name for a model
+    """
+
+    thy = model.thy()
+
+    return f"`{thy.SCHEMA}`.`{thy.STORE}`" if thy.SCHEMA else f"`{thy.STORE}`"
+
+def store(model, field):
+    """
+    Column a model's field is stored in
+    """
+
+    return model.thy()._fields._names[field].store # pylint: disable=protected-access
+
+def ddl(path, models, stamp, define, migration, marker): # pylint: disable=too-many-arguments
+    """
+    Rewrites the current definition of each model with define, adding a migration for any table
+    that doesn't have one with its marker yet
+
+    The definition as it was is kept alongside the migration, the way relations does.
+    """
+
+    with open(f"{path}/definition.sql", "r") as definition_file:
+        original = definition_file.read()
+
+    done = []
+
+    for migration_path in glob.glob(f"{path}/migration-*.sql"):
+        with open(migration_path, "r") as migration_file:
+            done.append(migration_file.read())
+
+    current = original
+    migrations = []
+
+    for model in models:
+
+        current = define(current, model)
+
+        if not any(marker(model) in sql for sql in done):
+            migrations.append(migration(model))
+
+    if migrations:
+
+        with open(f"{path}/definition-{stamp}.sql", "w") as definition_file:
+            definition_file.write(original)
+
+        with open(f"{path}/migration-{stamp}.sql", "w") as migration_file:
+            migration_file.write(";\n".join(migration.rstrip(";") for migration in migrations) + ";")
+
+    if current != original:
+        with open(f"{path}/definition.sql", "w") as definition_file:
+            definition_file.write(current)
+
+    return bool(migrations)
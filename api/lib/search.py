@@ -0,0 +1,122 @@
+"""
+Module for full text searching what facts say
+"""
+
+import re
+
+import schema
+
+KIND = "MEDIUMTEXT" # What searchable columns are, as VARCHAR(255) is too short
+
+KEYS = [            # Keys in whats that hold what someone said, across origins
+    "text",             # bsky posts
+    "content",          # Discord messages
+    "meeting_topic",    # Zoom summaries
+    "summary_title",
+    "summary_overview",
+    "summary_details",
+    "label",
+    "summary",
+    "next_steps",
+    "summary_content"
+]
+
+LIMIT = 65535       # Characters of text to index per fact, plenty for a summary
+
+def strings(value):
+    """
+    Every string in a value, however nested
+    """
+
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from strings(item)
+
+def extract(what, keys=None):
+    """
+    The searchable text in a what, each string once in the order found
+
+    Looks for keys at any depth, so likes and replies find the text of their posts.
+    """
+
+    keys = KEYS if keys is None else keys
+
+    found = []
+
+    def walk(value):
+
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key in keys:
+                    found.extend(strings(item))
+                else:
+                    walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+
+    walk(what)
+
+    return "\n".join(dict.fromkeys(text.strip() for text in found if text.strip()))[:LIMIT]
+
+def columns(model):
+    """
+    Stores of every field in a FULLTEXT index
+    """
+
+    return sorted({schema.store(model, field) for fields in model.FULLTEXT.values() for field in fields})
+
+def define(sql, model):
+    """
+    Rewrites a model's CREATE TABLE so its searchable columns are long enough and indexed
+    """
+
+    create = re.search(rf"CREATE TABLE IF NOT EXISTS {re.escape(schema.table(model))} \(\n.*?\n\);", sql, re.S)
+
+    if not create or "FULLTEXT" in create.group(0):
+        return sql
+
+    searchable = create.group(0)
+
+    for column in columns(model):
+        searchable = searchable.replace(f"`{column}` VARCHAR(255)", f"`{column}` {KIND}", 1)
+
+    indexes = "".join(
+        f",\n  FULLTEXT `{index.replace('-', '_')}` ({','.join(f'`{schema.store(model, field)}`' for field in fields)})"
+        for index, fields in sorted(model.FULLTEXT.items())
+    )
+
+    searchable = searchable[:-3] + indexes + "\n);"
+
+    return sql[:create.start()] + searchable + sql[create.end():]
+
+def migration(model):
+    """
+    ALTERs to make an existing table searchable
+    """
+
+    changes = [f"  MODIFY `{column}` {KIND} NOT NULL" for column in columns(model)] + [
+        f"  ADD FULLTEXT `{index.replace('-', '_')}` ({','.join(f'`{schema.store(model, field)}`' for field in fields)})"
+        for index, fields in sorted(model.FULLTEXT.items())
+    ]
+
+    return f"ALTER TABLE {schema.table(model)}\n" + ",\n".join(changes) + ";"
+
+def ddl(path, models, stamp):
+    """
+    Makes the current definition searchable, adding a migration for any table not yet
+    """
+
+    return schema.ddl(
+        path,
+        [model for model in models if getattr(model, "FULLTEXT", None)],
+        stamp,
+        define,
+        migration,
+        lambda model: f"ALTER TABLE {schema.table(model)}\n  MODIFY"
+    )
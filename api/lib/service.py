@@ -4,22 +4,43 @@ Module for the OPenGUI API
 
 # pylint: disable=no-self-use
 
+import os
+import time
 import json
+import zlib
+import base64
+import heapq
+import uuid
+import hashlib
+import collections
 
 import micro_logger
 
 import flask
 import flask_restx
+import werkzeug
 import prometheus_flask_exporter
+import prometheus_flask_exporter.multiprocess
 import redis
+import pymysql
 
 import relations
-import relations_pymysql
+import relations_sql
+import relations_mysql
 import relations_restx
 
 import ledger
+import mixins
+import pool
+import partition
+import search
 
-metrics = prometheus_flask_exporter.PrometheusMetrics.for_app_factory()
+# Under multiple workers, metrics are collected across them all through files
+
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    metrics = prometheus_flask_exporter.multiprocess.GunicornInternalPrometheusMetrics.for_app_factory()
+else:
+    metrics = prometheus_flask_exporter.PrometheusMetrics.for_app_factory()
 
 def build():
     """
@@ -39,21 +60,1298 @@ def build():
     app.redis = redis.Redis(host='redis.ledger', encoding="utf-8", decode_responses=True)
 
     with open("/opt/service/secret/mysql.json", "r") as mysql_file:
-        app.source = relations_pymysql.Source(
-            "ledger", schema="ledger", autocommit=True, **json.loads(mysql_file.read())
+        app.source = pool.Source(
+            "ledger", schema="ledger", autocommit=True,
+            size=int(os.environ.get("MYSQL_POOL", 10)),
+            check=int(os.environ.get("MYSQL_CHECK", 30)),
+            recycle=int(os.environ.get("MYSQL_RECYCLE", 60*60)),
+            **json.loads(mysql_file.read())
         )
 
-    def ping():
-        app.source.connection.ping(True)
+    # Connections are checked out as a request first needs one, so give it back when it's done
+
+    def checkin(exception): # pylint: disable=unused-argument
+        app.source.checkin()
+
+    app.teardown_request(checkin)
+
+    # Whats with JSON this big or bigger are stored compressed as blobs, 0 for never
 
-    app.before_request(ping)
+    app.config["FACT_BLOB"] = int(os.environ.get("FACT_BLOB", 0))
 
     api.add_resource(Health, '/health')
+    api.add_resource(Partition, '/partition')
+    api.add_resource(FactExport, '/fact/export')
+    api.add_resource(FactMissing, '/fact/missing')
+    api.add_resource(FactSearch, '/fact/search')
+    api.add_resource(RollupSum, '/rollup/sum')
+    api.add_resource(UnumTimeline, '/unum/<int:id>/timeline')
 
-    relations_restx.attach(api, service, relations.models(ledger, ledger.Base))
+    # Claims, blobs, and texts are only kept up as facts change, so they're not for changing directly
+
+    relations_restx.attach(api, service, [
+        model for model in relations.models(ledger, ledger.Base)
+        if model not in [ledger.Claim, ledger.Blob, ledger.Text]
+    ])
 
     return app
 
+class Unum(mixins.Cached, mixins.Projected):
+    """
+    Unum Resource, cached
+    """
+
+    MODEL = ledger.Unum
+
+class Entity(mixins.Cached, mixins.Projected):
+    """
+    Entity Resource, cached
+    """
+
+    MODEL = ledger.Entity
+
+class Origin(mixins.Cached, mixins.Projected):
+    """
+    Origin Resource, cached
+    """
+
+    MODEL = ledger.Origin
+
+class Witness(mixins.Cached, mixins.Projected):
+    """
+    Witness Resource, cached
+    """
+
+    MODEL = ledger.Witness
+
+class Fact(mixins.Projected): # pylint: disable=too-many-public-methods
+    """
+    Fact Resource, creating many facts with a single INSERT, paging by cursor, and keeping large whats as blobs
+    """
+
+    MODEL = ledger.Fact
+
+    LIMIT = 100 # Page size when paging by cursor and no limit is sent
+
+    SEEN = "ledger/seen"    # Facts daemons have seen, by witness, see daemon/lib/seen.py
+    STREAM = "ledger/fact"  # Facts created, which daemons also read to know what to forget
+
+    @classmethod
+    def criteria(cls, verify=False):
+        """
+        Gets criteria from the flask request, sans cursor
+        """
+
+        criteria = super().criteria(verify)
+        criteria.pop("cursor", None)
+        criteria.pop("inflate", None)
+
+        return criteria
+
+    @classmethod
+    def inflating(cls):
+        """
+        Whether the flask request asks for whats stored as blobs
+        """
+
+        if flask.request.args and flask.request.args.get("inflate", "").lower() in ["1", "true", "yes"]:
+            return True
+
+        return bool(cls.json().get("inflate"))
+
+    @staticmethod
+    def blob(what):
+        """
+        Blob for a what, identified by the hash of its JSON
+        """
+
+        data = json.dumps(what, sort_keys=True, separators=(",", ":")).encode()
+
+        return {
+            "who": hashlib.sha256(data).hexdigest(),
+            "size": len(data),
+            "data": {"zlib": base64.b64encode(zlib.compress(data)).decode()}
+        }
+
+    @classmethod
+    def offload(cls, facts):
+        """
+        Stores large whats as blobs, each only once, leaving the facts referencing them in meta
+        """
+
+        threshold = flask.current_app.config.get("FACT_BLOB")
+
+        if not threshold:
+            return facts
+
+        blobs = {}
+        offloaded = []
+
+        for fact in facts:
+
+            if fact.get("what") and len(json.dumps(fact["what"])) >= threshold:
+                blob = cls.blob(fact["what"])
+                blobs[blob["who"]] = blob
+                fact = {**fact, "what": {}, "meta": {**(fact.get("meta") or {}), "blob": blob["who"]}}
+
+            offloaded.append(fact)
+
+        if blobs:
+
+            existing = set(ledger.Blob.many(who__in=sorted(blobs)).who)
+            missing = [blob for who, blob in blobs.items() if who not in existing]
+
+            if missing:
+
+                bulk = ledger.Blob.bulk(len(missing) + 1)
+
+                for blob in missing:
+                    bulk.add(**blob)
+
+                # Ignore in case another writer stored the same content first
+
+                query = bulk.query()
+                query.OPTIONS("IGNORE")
+                bulk.create(query=query)
+
+        return offloaded
+
+    @staticmethod
+    def inflate(facts):
+        """
+        Puts whats stored as blobs back, with a single lookup
+        """
+
+        whos = sorted({fact["meta"]["blob"] for fact in facts if (fact.get("meta") or {}).get("blob")})
+
+        if not whos:
+            return facts
+
+        whats = {
+            blob["who"]: json.loads(zlib.decompress(base64.b64decode(blob["data"]["zlib"])))
+            for blob in ledger.Blob.many(who__in=whos).export()
+        }
+
+        for fact in facts:
+            if (fact.get("meta") or {}).get("blob") in whats:
+                fact["what"] = whats[fact["meta"]["blob"]]
+
+        return facts
+
+    @classmethod
+    def cursor(cls):
+        """
+        Gets the cursor from the flask request, None if not paging by cursor
+        """
+
+        cursor = None
+
+        if flask.request.args and "cursor" in flask.request.args:
+            cursor = flask.request.args["cursor"]
+
+        if "cursor" in cls.json():
+            cursor = flask.request.json["cursor"] or ""
+
+        return cursor
+
+    @classmethod
+    def size(cls, default=None):
+        """
+        Gets the page size from the flask request, per_page if sent like the standard paging, else limit
+
+        Cursors page by position, so start and page are rejected rather than ignored.
+        """
+
+        limit = cls.limit()
+
+        if "start" in limit or "page" in limit:
+            raise werkzeug.exceptions.BadRequest("paging by cursor, not start or page")
+
+        return limit.get("per_page", limit.get("limit", cls.LIMIT if default is None else default))
+
+    @staticmethod
+    def encode(fact):
+        """
+        Encodes the (when, id) of a fact as an opaque cursor
+        """
+
+        return base64.urlsafe_b64encode(json.dumps([fact["when"], fact["id"]]).encode()).decode()
+
+    @staticmethod
+    def decode(cursor):
+        """
+        Decodes an opaque cursor back to (when, id)
+        """
+
+        when, id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode()) # pylint: disable=redefined-builtin
+
+        return int(when), int(id)
+
+    def select(self, models, fields):
+        """
+        Query retrieving only the columns for these fields, plus what paging and inflating need
+        """
+
+        extra = ["when"] + (["meta"] if "what" in fields else [])
+
+        return super().select(models, fields + [field for field in extra if field not in fields])
+
+    def project(self, rows, fields):
+        """
+        Keeps only these fields, inflating whats if asked
+        """
+
+        if "what" in fields and self.inflating():
+            self.inflate(rows)
+
+        return super().project(rows, fields)
+
+    def page(self, after=None):
+        """
+        Retrieves the page of facts after a (when, id), newest first
+
+        Seeks with the (witness_id, when, id) index so every page costs the same
+        """
+
+        limit = self.size()
+        fields = self.projection()
+
+        models = self.MODEL.many(**self.criteria()).sort("-when", "-id").limit(limit)
+
+        if after is not None:
+            models.filter(when__lte=after[0])
+
+        query = models.query() if fields is None else self.select(models, fields)
+
+        if after is not None:
+
+            when, id = after # pylint: disable=redefined-builtin
+
+            query.WHERE(relations_mysql.OR(relations_mysql.LT(when=when), relations_mysql.LT(id=id)))
+
+        if fields is None:
+
+            facts = models.retrieve(query=query).export()
+
+            if self.inflating():
+                self.inflate(facts)
+
+            last = facts[-1] if facts else None
+
+        else:
+
+            rows = self.retrieve(models, query)
+            facts = self.project(rows, fields)
+            last = rows[-1] if rows else None
+
+        body = {
+            self.PLURAL: facts,
+            "overflow": models.overflow,
+            "cursor": self.encode(last) if len(facts) >= limit else None
+        }
+
+        if fields is None:
+            body["formats"] = self.formats(models)
+
+        return body, 200
+
+    @relations_restx.exceptions
+    def get(self, id=None): # pylint: disable=redefined-builtin
+        """
+        Retrieves one or more facts, by cursor if one is sent (blank for the first page)
+
+        A single fact always has its what inflated, many only if asked.
+        """
+
+        cursor = self.cursor()
+
+        if id is not None or cursor is None or self.count():
+
+            response = super().get(id)
+            body, status = response if isinstance(response, tuple) else (response, 200)
+
+            if status == 200 and self.SINGULAR in body:
+                self.inflate([body[self.SINGULAR]])
+            elif status == 200 and isinstance(body.get(self.PLURAL), list) and self.inflating():
+                self.inflate(body[self.PLURAL])
+
+            return body, status
+
+        try:
+            after = self.decode(cursor) if cursor else None
+        except (ValueError, TypeError) as exception:
+            raise werkzeug.exceptions.BadRequest(f"invalid cursor {cursor}") from exception
+
+        return self.page(after)
+
+    def lookup(self, facts):
+        """
+        Looks up stored facts by the witness_id/who unique key
+        """
+
+        return {
+            (fact["witness_id"], fact["who"]): fact
+            for fact in self.MODEL.many(
+                witness_id__in=sorted({fact["witness_id"] for fact in facts}),
+                who__in=sorted({fact["who"] for fact in facts})
+            ).export()
+        }
+
+    @staticmethod
+    def claim(facts, upsert=False):
+        """
+        Claims the witness_id/who of facts, returning the keys claimed
+
+        Facts are partitioned by when, so their table can't keep them unique, and claims
+        do for each month. Claims are written in the same transaction as the facts, so another
+        writer claiming the same keys waits for ours to commit and then ignores them. They're
+        written in key order so writers waiting on each other's keys can't deadlock.
+        """
+
+        token = uuid.uuid4().hex
+
+        bulk = ledger.Claim.bulk(len(facts) + 1)
+
+        for fact in sorted(facts, key=lambda fact: (fact["witness_id"], fact["who"])):
+            bulk.add(witness_id=fact["witness_id"], who=fact["who"], when=partition.month(fact["when"]), token=token)
+
+        query = bulk.query()
+
+        if upsert:
+            query.OPTIONS("IGNORE")
+
+        bulk.create(query=query)
+
+        return {
+            (claim["witness_id"], claim["who"])
+            for claim in ledger.Claim.many(
+                witness_id__in=sorted({fact["witness_id"] for fact in facts}),
+                who__in=sorted({fact["who"] for fact in facts}),
+                token=token
+            ).export()
+        }
+
+    @staticmethod
+    def release(facts):
+        """
+        Releases the claims of facts no longer stored, so they can be created again
+        """
+
+        whos = collections.defaultdict(set)
+
+        for fact in facts:
+            whos[fact["witness_id"]].add(fact["who"])
+
+        for witness_id, who in whos.items():
+            ledger.Claim.many(witness_id=witness_id, who__in=sorted(who)).delete()
+
+    def take(self, facts, upsert=False):
+        """
+        Claims facts, taking over claims left without facts, like those of facts since patched
+        """
+
+        claimed = self.claim(facts, upsert)
+
+        stale = [fact for fact in facts if (fact["witness_id"], fact["who"]) not in claimed]
+
+        if stale:
+            stored = self.lookup(stale)
+            stale = [fact for fact in stale if (fact["witness_id"], fact["who"]) not in stored]
+
+        if stale:
+            self.release(stale)
+            claimed |= self.claim(stale, upsert)
+
+        return claimed
+
+    @classmethod
+    def forget(cls, facts=None):
+        """
+        Has daemons forget they've seen facts, all of them if None, so they're sent again
+        """
+
+        connection = flask.current_app.redis
+        pipeline = connection.pipeline(transaction=False)
+
+        try:
+
+            if facts is None:
+
+                for key in connection.scan_iter(match=f"{cls.SEEN}/*"):
+                    pipeline.delete(key)
+
+                pipeline.xadd(cls.STREAM, fields={"forget": "*"})
+
+            else:
+
+                whos = collections.defaultdict(set)
+
+                for fact in facts:
+                    whos[fact["witness_id"]].add(fact["who"])
+
+                for witness_id, who in whos.items():
+                    pipeline.zrem(f"{cls.SEEN}/{witness_id}", *sorted(who))
+
+                pipeline.xadd(cls.STREAM, fields={"forget": json.dumps([
+                    {"witness_id": fact["witness_id"], "who": fact["who"]} for fact in facts
+                ])})
+
+            pipeline.execute()
+
+        except redis.RedisError:
+            flask.current_app.logger.warning("forget", exc_info=True)
+
+    def insert(self, claiming, whats, upsert=False):
+        """
+        Claims, stores, counts, and indexes facts by index in one transaction, returning the indexes of those created
+
+        Counting and indexing with the facts means every one stored is counted and searchable
+        once, whoever retries.
+        """
+
+        connection = relations.source(self.MODEL.SOURCE).connection
+        connection.begin()
+
+        try:
+
+            claimed = self.take(list(claiming.values()), upsert)
+
+            created = {
+                index: fact for index, fact in claiming.items()
+                if (fact["witness_id"], fact["who"]) in claimed
+            }
+
+            if created:
+
+                # Size past the facts so add() doesn't create before we're ready
+
+                bulk = self.MODEL.bulk(len(created) + 1)
+
+                for fact in created.values():
+                    bulk.add(**fact)
+
+                bulk.create()
+
+                Rollup.increment(list(created.values()))
+
+                # Indexed from the whats sent, as stored ones may be blobs now
+
+                stored = self.lookup(list(created.values()))
+
+                FactSearch.index([
+                    {**stored[(fact["witness_id"], fact["who"])], "what": whats[index]}
+                    for index, fact in created.items()
+                ])
+
+            connection.commit()
+
+        except Exception:
+            connection.rollback()
+            raise
+
+        return set(created)
+
+    def create(self, facts, upsert=False):
+        """
+        Creates facts with one INSERT, returning them and whether each was new
+
+        When upserting, facts already stored are left as they are. Those new are counted into
+        their rollups and indexed for searching as they're stored.
+        """
+
+        if not facts:
+            return [], []
+
+        existing = set(self.lookup(facts)) if upsert else set()
+        claiming = {}
+
+        whats = [fact.get("what") or {} for fact in facts]
+        facts = self.offload(facts)
+
+        # Only claim the first of each key not already stored
+
+        for index, fact in enumerate(facts):
+
+            key = (fact["witness_id"], fact["who"])
+
+            if key not in existing:
+                claiming[index] = fact
+
+            if upsert:
+                existing.add(key)
+
+        inserted = self.insert(claiming, whats, upsert) if claiming else set()
+        created = [index in inserted for index in range(len(facts))]
+
+        # Bulk inserts don't give back ids so look them up by the unique key
+
+        stored = self.lookup(facts)
+        missing = sorted({(fact["witness_id"], fact["who"]) for fact in facts} - set(stored))
+
+        if missing:
+            raise werkzeug.exceptions.Conflict(f"claimed but not stored: {missing}")
+
+        facts = [stored[(fact["witness_id"], fact["who"])] for fact in facts]
+
+        return facts, created
+
+    @relations_restx.exceptions
+    def post(self):
+        """
+        Creates many facts in bulk, optionally only if absent, else falls back to the standard create
+        """
+
+        if "filter" in self.json():
+            return super().post()
+
+        upsert = self.json().get("upsert", False)
+
+        if self.SINGULAR in self.json():
+
+            facts, created = self.create([flask.request.json[self.SINGULAR]], upsert)
+
+            if upsert:
+                return {self.SINGULAR: facts[0], "created": created[0]}, 201
+
+            return {self.SINGULAR: facts[0]}, 201
+
+        if self.PLURAL in self.json():
+
+            facts, created = self.create(flask.request.json[self.PLURAL], upsert)
+
+            if upsert:
+                return {self.PLURAL: facts, "created": created}, 201
+
+            return {self.PLURAL: facts}, 201
+
+        return super().post()
+
+    @relations_restx.exceptions
+    def delete(self, id=None): # pylint: disable=redefined-builtin
+        """
+        Deletes one or more facts, releasing their claims and having daemons forget them
+        """
+
+        if id is not None:
+            facts = [self.MODEL.one(id=id).export()]
+        else:
+            facts = self.MODEL.many(**self.criteria(True)).export()
+
+        deleted = self.MODEL.many(id__in=[fact["id"] for fact in facts]).delete() if facts else 0
+        self.release(facts)
+
+        if facts:
+            self.forget(facts)
+
+        return {"deleted": deleted}, 202
+
+class FactExport(flask_restx.Resource):
+    """
+    Streams facts as newline delimited JSON, filtered like the Fact Resource
+    """
+
+    CHUNK = 1000 # Rows to read and send at a time
+
+    @relations_restx.exceptions
+    def get(self):
+        """
+        Streams every fact matching the criteria through an unbuffered cursor, inflating whats if asked
+        """
+
+        source = flask.current_app.source
+        inflate = Fact.inflating()
+
+        models = ledger.Fact.many(**Fact.criteria()).sort(*Fact.sort())
+        query = models.query()
+        query.generate()
+
+        def lines():
+
+            # Its own connection so the stream doesn't tie up the request's, made here so
+            # there's nothing to leak if the response is dropped before it's read
+
+            connection = pymysql.connect(cursorclass=pymysql.cursors.SSDictCursor, **source.kwargs)
+
+            try:
+
+                cursor = connection.cursor()
+                cursor.execute(query.sql, tuple(query.args))
+
+                while True:
+
+                    rows = cursor.fetchmany(self.CHUNK)
+
+                    if not rows:
+                        return
+
+                    facts = [ledger.Fact(_read=source.values_retrieve(models, row)).export() for row in rows]
+
+                    if inflate:
+                        Fact.inflate(facts)
+
+                    yield "".join(json.dumps(fact) + "\n" for fact in facts)
+
+            finally:
+
+                # Blobs are looked up on this thread's pooled connection after the request's given it back
+
+                connection.close()
+                source.checkin()
+
+        return flask.Response(lines(), mimetype="application/x-ndjson")
+
+    def post(self):
+        """
+        Streams every fact matching the criteria in the body
+        """
+
+        return self.get()
+
+class FactSearch(flask_restx.Resource):
+    """
+    Searches what facts say with a FULLTEXT index, filtered by witness, origin, and when
+    """
+
+    LIMIT = 100 # Facts to return when no limit is sent
+
+    @staticmethod
+    def index(facts):
+        """
+        Stores the searchable text of facts with a single INSERT, skipping those with none
+        """
+
+        texts = [
+            {"fact_id": fact["id"], "witness_id": fact["witness_id"], "when": fact["when"], "text": text}
+            for fact, text in [(fact, search.extract(fact["what"])) for fact in facts]
+            if text
+        ]
+
+        if not texts:
+            return
+
+        bulk = ledger.Text.bulk(len(texts) + 1)
+
+        for text in texts:
+            bulk.add(**text)
+
+        query = bulk.query()
+
+        # Ignore in case another writer indexed the same facts
+
+        query.OPTIONS("IGNORE")
+
+        bulk.create(query=query)
+
+    @staticmethod
+    def q():
+        """
+        Gets what to search for from the flask request, in MySQL's boolean mode
+        """
+
+        q = None
+
+        if flask.request.args and "q" in flask.request.args:
+            q = flask.request.args["q"]
+
+        if "q" in Fact.json():
+            q = flask.request.json["q"]
+
+        if not q or not q.strip():
+            raise werkzeug.exceptions.BadRequest("q required")
+
+        return q
+
+    @relations_restx.exceptions
+    def get(self):
+        """
+        Retrieves facts matching q, most relevant then newest first, inflating whats if asked
+
+        The FULLTEXT index finds the matches and the witness_id/when index narrows them.
+        """
+
+        q = self.q()
+
+        criteria = Fact.criteria()
+        criteria.pop("q", None)
+
+        if "origin_id" in criteria:
+
+            witness_ids = ledger.Witness.many(origin_id=criteria.pop("origin_id")).id
+
+            if not witness_ids:
+                return {"facts": []}
+
+            criteria["witness_id__in"] = witness_ids
+
+        match = relations_sql.SQL("MATCH(`text`) AGAINST (%s IN BOOLEAN MODE)", [q])
+
+        models = ledger.Text.many(**criteria).limit(Fact.size(self.LIMIT))
+
+        query = models.query()
+        query.FIELDS = relations_mysql.FIELDS(["fact_id", "when"])
+        query.FIELDS.add(score=match)
+        query.WHERE(match)
+        query.ORDER_BY = relations_mysql.ORDER_BY(score=relations_mysql.DESC, when=relations_mysql.DESC)
+        query.generate()
+
+        cursor = flask.current_app.source.connection.cursor()
+        cursor.execute(query.sql, tuple(query.args))
+        rows = cursor.fetchall()
+        cursor.close()
+
+        if not rows:
+            return {"facts": []}
+
+        # The when narrows the lookup to the partitions the facts are in
+
+        facts = {
+            fact["id"]: fact
+            for fact in ledger.Fact.many(
+                id__in=[row["fact_id"] for row in rows],
+                when__in=sorted({row["when"] for row in rows})
+            ).export()
+        }
+
+        found = [facts[row["fact_id"]] for row in rows if row["fact_id"] in facts]
+
+        if Fact.inflating():
+            Fact.inflate(found)
+
+        return {"facts": found}
+
+    def post(self):
+        """
+        Searches with what's in the body
+        """
+
+        return self.get()
+
+class FactMissing(flask_restx.Resource):
+    """
+    Checks which candidate facts aren't stored yet, a whole page of them at once
+    """
+
+    @staticmethod
+    def stored(facts):
+        """
+        The witness_id/who of those stored, read with a single query on the unique key
+        """
+
+        if not facts:
+            return set()
+
+        models = ledger.Fact.many(
+            witness_id__in=sorted({fact["witness_id"] for fact in facts}),
+            who__in=sorted({fact["who"] for fact in facts})
+        )
+
+        query = models.query()
+        query.FIELDS = relations_mysql.FIELDS(["witness_id", "who"])
+        query.generate()
+
+        cursor = flask.current_app.source.connection.cursor()
+        cursor.execute(query.sql, tuple(query.args))
+
+        stored = {(row["witness_id"], row["who"]) for row in cursor.fetchall()}
+
+        cursor.close()
+
+        return stored
+
+    @relations_restx.exceptions
+    def post(self):
+        """
+        Returns which whos for a witness_id, or which witness_id/who pairs, are missing
+        """
+
+        body = Fact.json()
+
+        if "whos" in body:
+
+            if "witness_id" not in body:
+                raise werkzeug.exceptions.BadRequest("witness_id required with whos")
+
+            facts = [{"witness_id": body["witness_id"], "who": who} for who in body["whos"]]
+
+        elif "facts" in body:
+
+            facts = [{"witness_id": fact["witness_id"], "who": fact["who"]} for fact in body["facts"]]
+
+        else:
+
+            raise werkzeug.exceptions.BadRequest("either whos or facts required")
+
+        stored = self.stored(facts)
+        missing = [fact for fact in facts if (fact["witness_id"], fact["who"]) not in stored]
+
+        if "whos" in body:
+            return {"whos": [fact["who"] for fact in missing]}
+
+        return {"facts": missing}
+
+class UnumTimeline(flask_restx.Resource):
+    """
+    Streams all the facts of a unum's witnesses as one timeline, newest first, merging witnesses on the fly
+    """
+
+    CHUNK = 10  # Least facts to read from a witness at once
+    BATCH = 100 # Facts to inflate and send at a time
+
+    @staticmethod
+    def witnesses(unum_id):
+        """
+        Ids of every witness of every entity of a unum
+        """
+
+        entity_ids = ledger.Entity.many(unum_id=unum_id).id
+
+        if not entity_ids:
+            return []
+
+        return sorted(ledger.Witness.many(entity_id__in=entity_ids).id)
+
+    @staticmethod
+    def union(afters, size):
+        """
+        SQL and args selecting the next size facts of each witness after its (when, id)
+
+        Each witness is its own derived table so each seeks the (witness_id, when, id) index
+        rather than sorting everything all the witnesses have.
+        """
+
+        selects = []
+        args = []
+
+        for index, (witness_id, after) in enumerate(sorted(afters.items())):
+
+            witness = ledger.Fact.many(witness_id=witness_id).sort("-when", "-id").limit(size)
+
+            if after is not None:
+                witness.filter(when__lte=after[0])
+
+            query = witness.query()
+
+            if after is not None:
+                query.WHERE(relations_mysql.OR(relations_mysql.LT(when=after[0]), relations_mysql.LT(id=after[1])))
+
+            query.generate()
+
+            selects.append(f"SELECT * FROM ({query.sql}) AS `witness{index}`")
+            args.extend(query.args)
+
+        return " UNION ALL ".join(selects), tuple(args)
+
+    @classmethod
+    def chunks(cls, source, afters, size):
+        """
+        The next size facts of each witness after its (when, id), newest first, in a single query
+        """
+
+        models = ledger.Fact.many()
+        chunks = {witness_id: [] for witness_id in afters}
+
+        if not afters:
+            return chunks
+
+        cursor = source.connection.cursor()
+        cursor.execute(*cls.union(afters, size))
+
+        for row in cursor.fetchall():
+            fact = ledger.Fact(_read=source.values_retrieve(models, row)).export()
+            chunks[fact["witness_id"]].append(fact)
+
+        cursor.close()
+
+        for facts in chunks.values():
+            facts.sort(key=lambda fact: (fact["when"], fact["id"]), reverse=True)
+
+        return chunks
+
+    def start(self, source, witness_ids, after, limit):
+        """
+        First chunk of every witness, read all at once, with the size each was read at and which have no more
+        """
+
+        size = min(limit, max(self.CHUNK, -(-limit // max(len(witness_ids), 1))))
+
+        chunks = self.chunks(source, {witness_id: after for witness_id in witness_ids}, size)
+
+        buffers = {witness_id: collections.deque(facts) for witness_id, facts in chunks.items()}
+        sizes = {witness_id: size for witness_id in witness_ids}
+        ended = {witness_id for witness_id, facts in chunks.items() if len(facts) < size}
+
+        return buffers, sizes, ended
+
+    def merge(self, source, witness_ids, after, limit):
+        """
+        Yields up to limit facts after a (when, id) across witnesses, newest first
+
+        Every witness starts with a small chunk, read all at once, so the first page costs a single
+        query however many witnesses there are. A witness only gets read again once its chunk's used
+        up, in bigger chunks each time, so busy witnesses catch up quickly.
+        """
+
+        buffers, sizes, ended = self.start(source, witness_ids, after, limit)
+
+        heads = [
+            (-facts[0]["when"], -facts[0]["id"], witness_id)
+            for witness_id, facts in buffers.items() if facts
+        ]
+        heapq.heapify(heads)
+
+        merged = 0
+
+        while heads and merged < limit:
+
+            _, _, witness_id = heapq.heappop(heads)
+            fact = buffers[witness_id].popleft()
+
+            yield fact
+            merged += 1
+
+            if not buffers[witness_id] and witness_id not in ended:
+
+                sizes[witness_id] = min(limit, sizes[witness_id] * 2)
+                facts = self.chunks(source, {witness_id: (fact["when"], fact["id"])}, sizes[witness_id])[witness_id]
+
+                buffers[witness_id].extend(facts)
+
+                if len(facts) < sizes[witness_id]:
+                    ended.add(witness_id)
+
+            if buffers[witness_id]:
+                head = buffers[witness_id][0]
+                heapq.heappush(heads, (-head["when"], -head["id"], witness_id))
+
+    @relations_restx.exceptions
+    def get(self, id): # pylint: disable=redefined-builtin
+        """
+        Streams the timeline as newline delimited JSON, each fact a line, the last line the cursor
+
+        The cursor's null once there's nothing more, else send it back for the next page.
+        """
+
+        source = flask.current_app.source
+        inflate = Fact.inflating()
+        limit = Fact.size()
+        cursor = Fact.cursor()
+
+        try:
+            after = Fact.decode(cursor) if cursor else None
+        except (ValueError, TypeError) as exception:
+            raise werkzeug.exceptions.BadRequest(f"invalid cursor {cursor}") from exception
+
+        witness_ids = self.witnesses(id)
+
+        def lines():
+
+            try:
+
+                batch = []
+                last = None
+                merged = 0
+
+                for fact in self.merge(source, witness_ids, after, limit):
+
+                    batch.append(fact)
+                    last = fact
+                    merged += 1
+
+                    if len(batch) >= self.BATCH:
+
+                        if inflate:
+                            Fact.inflate(batch)
+
+                        yield "".join(json.dumps(fact) + "\n" for fact in batch)
+                        batch = []
+
+                if inflate:
+                    Fact.inflate(batch)
+
+                yield "".join(json.dumps(fact) + "\n" for fact in batch)
+                yield json.dumps({"cursor": Fact.encode(last) if merged >= limit else None}) + "\n"
+
+            finally:
+
+                # Streamed after the request's given its connection back, so give back this one too
+
+                source.checkin()
+
+        return flask.Response(lines(), mimetype="application/x-ndjson")
+
+    def post(self, id): # pylint: disable=redefined-builtin
+        """
+        Streams the timeline with what's in the body
+        """
+
+        return self.get(id)
+
+class Rollup(mixins.Projected):
+    """
+    Rollup Resource, also counting facts into their rollups, for those stored before they were counted as created
+    """
+
+    MODEL = ledger.Rollup
+
+    PERIODS = {
+        "hour": 60*60,
+        "day": 24*60*60
+    }
+
+    @classmethod
+    def counts(cls, facts):
+        """
+        Counts facts by witness and the hour and day they're in, with whose the witness is
+        """
+
+        witnesses = {
+            witness.id: witness
+            for witness in ledger.Witness.many(id__in=sorted({fact["witness_id"] for fact in facts}))
+        }
+
+        unums = {
+            entity.id: entity.unum_id
+            for entity in ledger.Entity.many(id__in=sorted({witness.entity_id for witness in witnesses.values()}))
+        }
+
+        counts = collections.Counter()
+
+        for fact in facts:
+
+            # Witness may have been deleted since
+
+            if fact["witness_id"] not in witnesses:
+                continue
+
+            for period, seconds in cls.PERIODS.items():
+                counts[(fact["witness_id"], period, fact["when"] - fact["when"] % seconds)] += 1
+
+        return [
+            {
+                "witness_id": witness_id,
+                "entity_id": witnesses[witness_id].entity_id,
+                "unum_id": unums.get(witnesses[witness_id].entity_id),
+                "origin_id": witnesses[witness_id].origin_id,
+                "period": period,
+                "bucket": bucket,
+                "count": count
+            }
+            for (witness_id, period, bucket), count in sorted(counts.items())
+        ]
+
+    @classmethod
+    def stored(cls, rollups):
+        """
+        How many facts are actually stored in each rollup, by (witness_id, period, bucket), one query a period
+        """
+
+        stored = {}
+
+        cursor = flask.current_app.source.connection.cursor()
+
+        for period, seconds in cls.PERIODS.items():
+
+            buckets = [rollup for rollup in rollups if rollup["period"] == period]
+
+            if not buckets:
+                continue
+
+            models = ledger.Fact.many(
+                witness_id__in=sorted({rollup["witness_id"] for rollup in buckets}),
+                when__gte=min(rollup["bucket"] for rollup in buckets),
+                when__lt=max(rollup["bucket"] for rollup in buckets) + seconds
+            )
+
+            query = models.query()
+            query.FIELDS = relations_mysql.FIELDS(["witness_id"])
+            query.FIELDS.add(bucket=relations_sql.SQL(f"`when` - `when` %% {seconds}"))
+            query.FIELDS.add(count=relations_sql.SQL("COUNT(*)"))
+            query.GROUP_BY("witness_id", "bucket")
+            query.ORDER_BY = relations_mysql.ORDER_BY()
+            query.generate()
+
+            cursor.execute(query.sql, tuple(query.args))
+
+            for row in cursor.fetchall():
+                stored[(row["witness_id"], period, int(row["bucket"]))] = int(row["count"])
+
+        cursor.close()
+
+        return stored
+
+    @classmethod
+    def upsert(cls, rollups, count):
+        """
+        Upserts rollups with a single INSERT, count being how a rollup already there's updated
+        """
+
+        bulk = cls.MODEL.bulk(len(rollups) + 1)
+
+        for rollup in rollups:
+            bulk.add(**rollup)
+
+        query = bulk.query()
+        query.generate()
+
+        cursor = flask.current_app.source.connection.cursor()
+        cursor.execute(f"{query.sql} ON DUPLICATE KEY UPDATE `count`={count}", tuple(query.args))
+        cursor.close()
+
+    @classmethod
+    def increment(cls, facts):
+        """
+        Adds facts to their rollups with a single upsert, returning how many rollups changed
+        """
+
+        if not facts:
+            return 0
+
+        rollups = cls.counts(facts)
+
+        if not rollups:
+            return 0
+
+        cls.upsert(rollups, "`count`+VALUES(`count`)")
+
+        return len(rollups)
+
+    @classmethod
+    def recount(cls, facts):
+        """
+        Sets the rollups facts are in to how many facts are stored in them, returning how many rollups were set
+
+        Counts are recounted rather than added to, so backfilling the same facts again changes nothing.
+        """
+
+        if not facts:
+            return 0
+
+        rollups = cls.counts(facts)
+
+        if not rollups:
+            return 0
+
+        stored = cls.stored(rollups)
+
+        for rollup in rollups:
+            rollup["count"] = stored.get((rollup["witness_id"], rollup["period"], rollup["bucket"]), 0)
+
+        cls.upsert(rollups, "VALUES(`count`)")
+
+        return len(rollups)
+
+    @relations_restx.exceptions
+    def post(self):
+        """
+        Counts facts, just witness_id and when needed, into rollups, else creates (or filters) like normal
+
+        Facts are counted as they're created, so this is only for backfilling those that weren't.
+        """
+
+        if "facts" in self.json():
+            return {"counted": self.recount(flask.request.json["facts"])}, 202
+
+        return super().post()
+
+class RollupSum(flask_restx.Resource):
+    """
+    Sums rollups by whichever of witness, entity, unum and origin, filtered like the Rollup Resource
+    """
+
+    BY = ["witness_id", "entity_id", "unum_id", "origin_id"]
+
+    @staticmethod
+    def by():
+        """
+        Gets what to sum by from the flask request
+        """
+
+        by = []
+
+        if flask.request.args and "by" in flask.request.args:
+            by = [name for name in flask.request.args["by"].split(",") if name]
+
+        if "by" in Rollup.json():
+            by = flask.request.json["by"]
+
+        return by
+
+    @relations_restx.exceptions
+    def get(self):
+        """
+        Sums counts per period and bucket, oldest first
+        """
+
+        by = self.by()
+        unknown = [name for name in by if name not in self.BY]
+
+        if unknown:
+            raise werkzeug.exceptions.BadRequest(f"can only sum by {self.BY}, not {unknown}")
+
+        criteria = Rollup.criteria()
+        criteria.pop("by", None)
+
+        models = ledger.Rollup.many(**criteria).sort("bucket", "period", *by)
+
+        query = models.query()
+        query.FIELDS = relations_mysql.FIELDS(by + ["period", "bucket"])
+        query.FIELDS.add(count=relations_sql.SQL("SUM(`count`)"))
+        query.GROUP_BY(*by, "period", "bucket")
+        query.generate()
+
+        cursor = flask.current_app.source.connection.cursor()
+        cursor.execute(query.sql, tuple(query.args))
+
+        sums = [{**row, "count": int(row["count"])} for row in cursor.fetchall()]
+
+        cursor.close()
+
+        return {"sums": sums}
+
+    def post(self):
+        """
+        Sums by what's in the body
+        """
+
+        return self.get()
+
+class Partition(flask_restx.Resource):
+    """
+    Class for managing Fact partitions
+    """
+
+    @relations_restx.exceptions
+    def get(self):
+        """
+        Lists the partitions
+        """
+
+        return {"partitions": partition.partitions(flask.current_app.source, ledger.Fact)}
+
+    @relations_restx.exceptions
+    def post(self):
+        """
+        Adds partitions ahead and drops those past retention (in months)
+        """
+
+        body = flask.request.json or {}
+        now = time.time()
+        retain = int(body.get("retain", 0))
+
+        # Claims go with their facts' months, so facts dropped can be created again
+
+        maintained = [
+            partition.maintain(flask.current_app.source, model, now, ahead=int(body.get("ahead", 3)), retain=retain)
+            for model in [ledger.Fact, ledger.Claim]
+        ]
+
+        # Daemons can't tell which facts went, so they forget everything they've seen
+
+        if maintained[0]["dropped"]:
+            Fact.forget()
+
+        return maintained[0], 201
+
 class Health(flask_restx.Resource):
     """
     Class for Health checks
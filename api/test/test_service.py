@@ -1,14 +1,26 @@
 import unittest
 import unittest.mock
 
+import redis
+import pymysql
+
 import relations
 import relations.unittest
 
 import service
 import ledger
+import pool
+import schema
+import partition
+import search
 
 import os
 import sys
+import zlib
+import json
+import base64
+import hashlib
+import tempfile
 
 if not sys.warnoptions:
     import warnings
@@ -54,6 +66,11 @@ class TestAPI(Testrestx):
 
         self.assertEqual(app.name, "ledger-api")
 
+    def test_hidden(self):
+
+        for endpoint in ["/claim", "/blob", "/text"]:
+            self.assertEqual(self.api.get(endpoint).status_code, 404)
+
     def test_migrations(self):
 
         migrations = relations.Migrations()
@@ -72,8 +89,1243 @@ class TestAPI(Testrestx):
                 print(stamp)
                 raise exception
 
+class TestPool(unittest.TestCase):
+
+    @unittest.mock.patch("pymysql.connect")
+    def setUp(self, mock_connect):
+
+        self.source = pool.Source("pool", schema="ledger", size=2, check=30, recycle=60, wait=0, host="db")
+
+    def test___init__(self):
+
+        self.assertEqual(self.source.schema, "ledger")
+        self.assertEqual(self.source.kwargs, {"host": "db"})
+        self.assertEqual(self.source.size, 2)
+        self.assertEqual(self.source.check, 30)
+        self.assertEqual(self.source.recycle, 60)
+        self.assertEqual(self.source.connections, {})
+        self.assertEqual(self.source.idle, [])
+
+    @unittest.mock.patch("time.time")
+    @unittest.mock.patch("pymysql.connect")
+    def test_connection(self, mock_connect, mock_time):
+
+        mock_time.return_value = 100
+        mock_connect.side_effect = lambda **kwargs: unittest.mock.MagicMock(open=True)
+
+        connection = self.source.connection
+        self.assertIs(self.source.connection, connection)
+        self.assertEqual(mock_connect.call_count, 1)
+        mock_connect.assert_called_with(cursorclass=unittest.mock.ANY, host="db")
+
+        # Back in and out again without a ping as it's fresh
+
+        self.source.checkin()
+        self.assertEqual(self.source.idle, [(connection, 100, 100)])
+
+        self.assertIs(self.source.connection, connection)
+        connection.ping.assert_not_called()
+
+        # Idle a while gets a ping
+
+        self.source.checkin()
+        mock_time.return_value = 130
+
+        self.assertIs(self.source.connection, connection)
+        connection.ping.assert_called_once_with(False)
+
+        # Too old gets replaced
+
+        self.source.checkin()
+        mock_time.return_value = 160
+
+        self.assertIsNot(self.source.connection, connection)
+        connection.close.assert_called_once_with()
+        self.assertEqual(mock_connect.call_count, 2)
+
+    @unittest.mock.patch("pymysql.connect")
+    def test_checkout(self, mock_connect):
+
+        mock_connect.side_effect = lambda **kwargs: unittest.mock.MagicMock(open=True)
+
+        self.source.checkout()
+
+        # Only so many at once
+
+        self.source.slots.acquire()
+        self.assertRaisesRegex(TimeoutError, "no connection available after 0 seconds", self.source.checkout)
+        self.source.slots.release()
+
+        # Dead ones are replaced
+
+        self.source.checkin()
+        self.source.idle[0][0].ping.side_effect = pymysql.err.OperationalError("gone")
+        self.source.idle[0] = (self.source.idle[0][0], self.source.idle[0][1], 0)
+        dead = self.source.idle[0][0]
+
+        self.source.checkout()
+        self.assertIsNot(self.source.connection, dead)
+
+    @unittest.mock.patch("pymysql.connect")
+    def test_checkin(self, mock_connect):
+
+        mock_connect.return_value = unittest.mock.MagicMock(open=False)
+
+        self.source.checkin()
+        self.assertEqual(self.source.idle, [])
+
+        # Closed ones aren't kept
+
+        self.source.checkout()
+        self.source.checkin()
+
+        self.assertEqual(self.source.connections, {})
+        self.assertEqual(self.source.idle, [])
+        self.assertTrue(self.source.slots.acquire(blocking=False))
+        self.assertTrue(self.source.slots.acquire(blocking=False))
+
+    @unittest.mock.patch("os.getpid")
+    @unittest.mock.patch("pymysql.connect")
+    def test_reset(self, mock_connect, mock_getpid):
+
+        mock_getpid.return_value = 1
+        self.source.reset()
+
+        parent = self.source.connection
+
+        # A forked worker shouldn't share its parent's sockets
+
+        mock_getpid.return_value = 2
+        mock_connect.return_value = unittest.mock.MagicMock()
+
+        self.assertIsNot(self.source.connection, parent)
+        self.assertEqual(self.source.pid, 2)
+
+    def test_close(self):
+
+        connection = unittest.mock.MagicMock()
+        self.source.idle = [(connection, 0, 0)]
+
+        self.source.close()
+
+        connection.close.assert_called_once_with()
+        self.assertEqual(self.source.idle, [])
+
+class TestFactExport(Testrestx):
+
+    def setUp(self):
+
+        super().setUp()
+
+        ledger.Fact([
+            {"witness_id": 1, "who": "one", "when": 1, "what": {"a": 1}},
+            {"witness_id": 1, "who": "two", "when": 2},
+            {"witness_id": 2, "who": "three", "when": 3}
+        ]).create()
+
+    @unittest.mock.patch("service.FactExport.CHUNK", 1)
+    def test_get(self):
+
+        response = self.api.get("/fact/export?witness_id=1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+
+        facts = [json.loads(line) for line in response.data.decode().splitlines()]
+
+        self.assertEqual([fact["who"] for fact in facts], ["two", "one"])
+        self.assertEqual(facts[1]["what"], {"a": 1})
+
+        response = self.api.get("/fact/export?when__gt=1&sort=when")
+        self.assertEqual([json.loads(line)["who"] for line in response.data.decode().splitlines()], ["two", "three"])
+
+        response = self.api.get("/fact/export?nope=1")
+        self.assertStatusValue(response, 500, "message", "unknown criterion 'nope'")
+
+    def test_dropped(self):
+
+        # Nothing's connected for the stream until it's read
+
+        with self.app.test_request_context("/fact/export?witness_id=1"):
+            with unittest.mock.patch("pymysql.connect") as mock_connect:
+                service.FactExport().get().close()
+
+        self.assertFalse([
+            call for call in mock_connect.call_args_list
+            if call.kwargs.get("cursorclass") is pymysql.cursors.SSDictCursor
+        ])
+
+    def test_inflate(self):
+
+        self.app.config["FACT_BLOB"] = 50
+
+        big = {"summary": "x" * 100}
+
+        self.api.post("/fact", json={"fact": {"witness_id": 3, "who": "big", "when": 1, "what": big}})
+
+        response = self.api.get("/fact/export?witness_id=3")
+        self.assertEqual(json.loads(response.data.decode())["what"], {})
+
+        response = self.api.get("/fact/export?witness_id=3&inflate=true")
+        self.assertEqual(json.loads(response.data.decode())["what"], big)
+
+    def test_post(self):
+
+        response = self.api.post("/fact/export", json={"filter": {"who__in": ["one", "three"]}})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([json.loads(line)["who"] for line in response.data.decode().splitlines()], ["three", "one"])
+
+class TestFactSearch(Testrestx):
+
+    def setUp(self):
+
+        super().setUp()
+
+        origin = ledger.Origin("bsky").create()
+        other = ledger.Origin("discord").create()
+
+        self.witness_id = ledger.Witness(entity_id=1, origin_id=origin.id, who="me").create().id
+        self.other_id = ledger.Witness(entity_id=1, origin_id=other.id, who="me").create().id
+        self.origin_id = origin.id
+
+        self.api.post("/fact", json={"facts": [
+            {"witness_id": self.witness_id, "who": "one", "when": 1, "what": {"text": "hello world"}},
+            {"witness_id": self.witness_id, "who": "two", "when": 2, "what": {"post": {"text": "hello there"}}},
+            {"witness_id": self.witness_id, "who": "three", "when": 3, "what": {"cid": "nothing to see"}},
+            {"witness_id": self.other_id, "who": "four", "when": 4, "what": {"content": "hello world again"}}
+        ]})
+
+    def test_index(self):
+
+        self.assertEqual(
+            [(text.fact_id, text.when, text.text) for text in ledger.Text.many().sort("when")],
+            [
+                (ledger.Fact.one(who="one").id, 1, "hello world"),
+                (ledger.Fact.one(who="two").id, 2, "hello there"),
+                (ledger.Fact.one(who="four").id, 4, "hello world again")
+            ]
+        )
+
+        # Big whats are offloaded but indexed from what was sent
+
+        self.app.config["FACT_BLOB"] = 50
+
+        self.api.post("/fact", json={"fact": {"witness_id": self.witness_id, "who": "five", "when": 5, "what": {"text": "big " * 50}}})
+
+        self.assertEqual(ledger.Text.one(fact_id=ledger.Fact.one(who="five").id).text, ("big " * 50).strip())
+
+        # Already stored doesn't index twice
+
+        self.api.post("/fact", json={"facts": [{"witness_id": self.witness_id, "who": "one", "when": 1, "what": {"text": "hi"}}], "upsert": True})
+
+        self.assertEqual(ledger.Text.many(witness_id=self.witness_id).count(), 3)
+
+        # Failing to index stores nothing, so retrying indexes it
+
+        with unittest.mock.patch("service.FactSearch.index", side_effect=Exception("down")):
+            response = self.api.post("/fact", json={"facts": [{"witness_id": self.witness_id, "who": "six", "when": 6, "what": {"text": "again"}}], "upsert": True})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(ledger.Fact.many(who="six").count(), 0)
+        self.assertEqual(ledger.Claim.many(who="six").count(), 0)
+
+        self.api.post("/fact", json={"facts": [{"witness_id": self.witness_id, "who": "six", "when": 6, "what": {"text": "again"}}], "upsert": True})
+
+        self.assertEqual(ledger.Text.one(fact_id=ledger.Fact.one(who="six").id).text, "again")
+
+    def test_get(self):
+
+        response = self.api.get("/fact/search?q=hello")
+        self.assertStatusModels(response, 200, "facts", [{"who": "four"}, {"who": "two"}, {"who": "one"}])
+
+        response = self.api.get("/fact/search?q=%2Bhello %2Bworld")
+        self.assertStatusModels(response, 200, "facts", [{"who": "four"}, {"who": "one"}])
+
+        response = self.api.get(f"/fact/search?q=hello&witness_id={self.witness_id}&when__lt=2")
+        self.assertStatusModels(response, 200, "facts", [{"who": "one", "what": {"text": "hello world"}}])
+
+        response = self.api.get("/fact/search?q=hello&limit=1")
+        self.assertStatusModels(response, 200, "facts", [{"who": "four"}])
+
+        response = self.api.post("/fact/search", json={"q": "hello", "filter": {"origin_id": self.origin_id}})
+        self.assertStatusModels(response, 200, "facts", [{"who": "two"}, {"who": "one"}])
+
+        self.assertStatusValue(self.api.get("/fact/search?q=hello&origin_id=0"), 200, "facts", [])
+        self.assertStatusValue(self.api.get("/fact/search?q=goodbye"), 200, "facts", [])
+
+        self.assertStatusValue(self.api.get("/fact/search"), 400, "message", "q required")
+        self.assertStatusValue(self.api.get("/fact/search?q= "), 400, "message", "q required")
+
+class TestFactMissing(Testrestx):
+
+    def setUp(self):
+
+        super().setUp()
+
+        ledger.Fact([
+            {"witness_id": 1, "who": "one", "when": 1},
+            {"witness_id": 1, "who": "two", "when": 2},
+            {"witness_id": 2, "who": "three", "when": 3}
+        ]).create()
+
+    def test_stored(self):
+
+        with self.app.app_context():
+            self.assertEqual(service.FactMissing.stored([]), set())
+            self.assertEqual(service.FactMissing.stored([
+                {"witness_id": 1, "who": "one"},
+                {"witness_id": 2, "who": "one"},
+                {"witness_id": 2, "who": "three"}
+            ]), {(1, "one"), (2, "three")})
+
+    def test_post(self):
+
+        response = self.api.post("/fact/missing", json={"witness_id": 1, "whos": ["three", "two", "four", "one"]})
+        self.assertStatusValue(response, 200, "whos", ["three", "four"])
+
+        response = self.api.post("/fact/missing", json={"facts": [
+            {"witness_id": 1, "who": "three"},
+            {"witness_id": 2, "who": "three"},
+            {"witness_id": 2, "who": "one", "when": 4}
+        ]})
+        self.assertStatusValue(response, 200, "facts", [
+            {"witness_id": 1, "who": "three"},
+            {"witness_id": 2, "who": "one"}
+        ])
+
+        self.assertStatusValue(self.api.post("/fact/missing", json={"witness_id": 1, "whos": []}), 200, "whos", [])
+
+        response = self.api.post("/fact/missing", json={"whos": ["one"]})
+        self.assertStatusValue(response, 400, "message", "witness_id required with whos")
+
+        response = self.api.post("/fact/missing", json={})
+        self.assertStatusValue(response, 400, "message", "either whos or facts required")
+
+class TestUnumTimeline(Testrestx):
+
+    def setUp(self):
+
+        super().setUp()
+
+        unum = ledger.Unum("self").create()
+        me = ledger.Entity(unum_id=unum.id, who="me").create()
+        you = ledger.Entity(unum_id=unum.id, who="you").create()
+        origin = ledger.Origin("zoom").create()
+
+        self.unum_id = unum.id
+        self.witness_ids = [
+            ledger.Witness(entity_id=me.id, origin_id=origin.id, who="me").create().id,
+            ledger.Witness(entity_id=you.id, origin_id=origin.id, who="you").create().id,
+            ledger.Witness(entity_id=ledger.Entity(who="them").create().id, origin_id=origin.id, who="them").create().id
+        ]
+
+        one, two, three = self.witness_ids
+
+        ledger.Fact([
+            {"witness_id": one, "who": "a", "when": 1},
+            {"witness_id": two, "who": "b", "when": 2},
+            {"witness_id": one, "who": "c", "when": 3},
+            {"witness_id": one, "who": "d", "when": 3},
+            {"witness_id": one, "who": "e", "when": 4, "what": {"a": 1}},
+            {"witness_id": two, "who": "f", "when": 5},
+            {"witness_id": three, "who": "g", "when": 6}
+        ]).create()
+
+    def timeline(self, url, **kwargs):
+
+        response = self.api.get(url, **kwargs)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+
+        return [fact["who"] for fact in lines[:-1]], lines[-1]["cursor"]
+
+    def test_witnesses(self):
+
+        with self.app.app_context():
+            self.assertEqual(service.UnumTimeline.witnesses(self.unum_id), self.witness_ids[:2])
+            self.assertEqual(service.UnumTimeline.witnesses(0), [])
+
+    def test_union(self):
+
+        one, two, _ = self.witness_ids
+
+        sql, args = service.UnumTimeline.union({two: (2, 0), one: None}, 3)
+
+        self.assertEqual(sql.count(" UNION ALL "), 1)
+        self.assertLess(sql.index("`witness0`"), sql.index("`witness1`"))
+        self.assertEqual(args[0], one)
+        self.assertIn(two, args[1:])
+
+    def test_start(self):
+
+        one, two, _ = self.witness_ids
+
+        with self.app.app_context():
+
+            buffers, sizes, ended = service.UnumTimeline().start(self.app.source, [one, two], None, 4)
+
+        self.assertEqual({witness_id: [fact["who"] for fact in facts] for witness_id, facts in buffers.items()}, {
+            one: ["e", "d", "c", "a"],
+            two: ["f", "b"]
+        })
+        self.assertEqual(sizes, {one: 4, two: 4})
+        self.assertEqual(ended, {two})
+
+    def test_chunks(self):
+
+        one, two, _ = self.witness_ids
+
+        with self.app.app_context():
+
+            chunks = service.UnumTimeline.chunks(self.app.source, {one: None, two: None}, 2)
+            self.assertEqual({witness_id: [fact["who"] for fact in facts] for witness_id, facts in chunks.items()}, {
+                one: ["e", "d"],
+                two: ["f", "b"]
+            })
+
+            d = ledger.Fact.one(who="d")
+
+            chunks = service.UnumTimeline.chunks(self.app.source, {one: (d.when, d.id), two: (2, 0)}, 2)
+            self.assertEqual({witness_id: [fact["who"] for fact in facts] for witness_id, facts in chunks.items()}, {
+                one: ["c", "a"],
+                two: []
+            })
+
+            self.assertEqual(service.UnumTimeline.chunks(self.app.source, {}, 2), {})
+
+    @unittest.mock.patch("service.UnumTimeline.CHUNK", 1)
+    @unittest.mock.patch("service.UnumTimeline.BATCH", 2)
+    def test_get(self):
+
+        whos, cursor = self.timeline(f"/unum/{self.unum_id}/timeline")
+        self.assertEqual(whos, ["f", "e", "d", "c", "b", "a"])
+        self.assertIsNone(cursor)
+
+        whos, cursor = self.timeline(f"/unum/{self.unum_id}/timeline?limit=3")
+        self.assertEqual(whos, ["f", "e", "d"])
+
+        whos, cursor = self.timeline(f"/unum/{self.unum_id}/timeline?limit=3&cursor={cursor}")
+        self.assertEqual(whos, ["c", "b", "a"])
+
+        whos, cursor = self.timeline(f"/unum/{self.unum_id}/timeline", method="POST", json={"limit": {"limit": 3}, "cursor": cursor})
+        self.assertEqual(whos, [])
+        self.assertIsNone(cursor)
+
+        self.assertEqual(self.timeline("/unum/0/timeline"), ([], None))
+
+        self.app.config["FACT_BLOB"] = 5
+
+        self.api.post("/fact", json={"fact": {"witness_id": self.witness_ids[0], "who": "h", "when": 7, "what": {"b": 2}}})
+
+        response = self.api.get(f"/unum/{self.unum_id}/timeline?limit=1&inflate=true")
+        self.assertEqual(json.loads(response.data.decode().splitlines()[0])["what"], {"b": 2})
+
+        response = self.api.get(f"/unum/{self.unum_id}/timeline?cursor=nope")
+        self.assertStatusValue(response, 400, "message", "invalid cursor nope")
+
+class TestRollup(Testrestx):
+
+    def setUp(self):
+
+        super().setUp()
+
+        unum = ledger.Unum("self").create()
+        entity = ledger.Entity(unum_id=unum.id, who="me").create()
+        origin = ledger.Origin("zoom").create()
+
+        self.unum_id = unum.id
+        self.entity_id = entity.id
+        self.origin_id = origin.id
+        self.witness_id = ledger.Witness(entity_id=entity.id, origin_id=origin.id, who="me").create().id
+
+    def test_counts(self):
+
+        with self.app.app_context():
+            self.assertEqual(service.Rollup.counts([
+                {"witness_id": self.witness_id, "when": 3600},
+                {"witness_id": self.witness_id, "when": 7199},
+                {"witness_id": self.witness_id, "when": 7200},
+                {"witness_id": 0, "when": 7200}
+            ]), [
+                {
+                    "witness_id": self.witness_id, "entity_id": self.entity_id, "unum_id": self.unum_id, "origin_id": self.origin_id,
+                    "period": "day", "bucket": 0, "count": 3
+                },
+                {
+                    "witness_id": self.witness_id, "entity_id": self.entity_id, "unum_id": self.unum_id, "origin_id": self.origin_id,
+                    "period": "hour", "bucket": 3600, "count": 2
+                },
+                {
+                    "witness_id": self.witness_id, "entity_id": self.entity_id, "unum_id": self.unum_id, "origin_id": self.origin_id,
+                    "period": "hour", "bucket": 7200, "count": 1
+                }
+            ])
+
+    def test_create(self):
+
+        facts = [
+            {"witness_id": self.witness_id, "who": "one", "when": 3600},
+            {"witness_id": self.witness_id, "who": "two", "when": 7200}
+        ]
+
+        self.api.post("/fact", json={"facts": facts, "upsert": True})
+        self.api.post("/fact", json={"facts": facts + [{"witness_id": self.witness_id, "who": "three", "when": 3601}], "upsert": True})
+
+        self.assertStatusModels(self.api.get("/rollup", json={"filter": {"period": "hour"}}), 200, "rollups", [
+            {"bucket": 3600, "count": 2},
+            {"bucket": 7200, "count": 1}
+        ])
+
+        self.assertStatusModels(self.api.get("/rollup", json={"filter": {"period": "day"}}), 200, "rollups", [
+            {"bucket": 0, "count": 3}
+        ])
+
+    def test_stored(self):
+
+        ledger.Fact([
+            {"witness_id": self.witness_id, "who": "one", "when": 3600},
+            {"witness_id": self.witness_id, "who": "two", "when": 3601},
+            {"witness_id": self.witness_id, "who": "three", "when": 90000}
+        ]).create()
+
+        with self.app.app_context():
+            self.assertEqual(service.Rollup.stored([
+                {"witness_id": self.witness_id, "period": "hour", "bucket": 3600},
+                {"witness_id": self.witness_id, "period": "day", "bucket": 0}
+            ]), {
+                (self.witness_id, "hour", 3600): 2,
+                (self.witness_id, "day", 0): 2
+            })
+
+    def test_post(self):
+
+        # Stored without being counted, and one counted wrong
+
+        ledger.Fact([
+            {"witness_id": self.witness_id, "who": "one", "when": 3600},
+            {"witness_id": self.witness_id, "who": "two", "when": 3601},
+            {"witness_id": self.witness_id, "who": "three", "when": 7200}
+        ]).create()
+
+        ledger.Rollup(
+            witness_id=self.witness_id, entity_id=self.entity_id, unum_id=self.unum_id, origin_id=self.origin_id,
+            period="hour", bucket=7200, count=5
+        ).create()
+
+        facts = [{"witness_id": self.witness_id, "when": 3600}, {"witness_id": self.witness_id, "when": 7200}]
+
+        # Backfilling again changes nothing
+
+        self.assertStatusValue(self.api.post("/rollup", json={"facts": facts}), 202, "counted", 3)
+        self.assertStatusValue(self.api.post("/rollup", json={"facts": facts}), 202, "counted", 3)
+        self.assertStatusValue(self.api.post("/rollup", json={"facts": facts[:1]}), 202, "counted", 2)
+        self.assertStatusValue(self.api.post("/rollup", json={"facts": []}), 202, "counted", 0)
+
+        self.assertStatusModels(self.api.get("/rollup", json={"filter": {"period": "hour"}}), 200, "rollups", [
+            {"bucket": 3600, "count": 2},
+            {"bucket": 7200, "count": 1}
+        ])
+
+        self.assertStatusModels(self.api.get("/rollup", json={"filter": {"period": "day"}}), 200, "rollups", [
+            {"bucket": 0, "count": 3}
+        ])
+
+    def test_sum(self):
+
+        entity = ledger.Entity(unum_id=self.unum_id, who="you").create()
+        witness_id = ledger.Witness(entity_id=entity.id, origin_id=self.origin_id, who="you").create().id
+
+        facts = [
+            {"witness_id": self.witness_id, "who": "one", "when": 3600},
+            {"witness_id": self.witness_id, "who": "two", "when": 7200},
+            {"witness_id": witness_id, "who": "three", "when": 3600}
+        ]
+
+        ledger.Fact(facts).create()
+        self.api.post("/rollup", json={"facts": facts})
+
+        self.assertStatusValue(self.api.get("/rollup/sum?period=hour"), 200, "sums", [
+            {"period": "hour", "bucket": 3600, "count": 2},
+            {"period": "hour", "bucket": 7200, "count": 1}
+        ])
+
+        self.assertStatusValue(self.api.get("/rollup/sum?period=day&by=entity_id"), 200, "sums", [
+            {"entity_id": self.entity_id, "period": "day", "bucket": 0, "count": 2},
+            {"entity_id": entity.id, "period": "day", "bucket": 0, "count": 1}
+        ])
+
+        self.assertStatusValue(self.api.post("/rollup/sum", json={"filter": {"period": "day"}, "by": ["unum_id"]}), 200, "sums", [
+            {"unum_id": self.unum_id, "period": "day", "bucket": 0, "count": 3}
+        ])
+
+        response = self.api.get("/rollup/sum?by=who")
+        self.assertStatusValue(response, 400, "message", "can only sum by ['witness_id', 'entity_id', 'unum_id', 'origin_id'], not ['who']")
+
+class TestSchema(unittest.TestCase):
+
+    def test_table(self):
+
+        self.assertEqual(schema.table(ledger.Fact), "`ledger`.`fact`")
+
+    def test_store(self):
+
+        self.assertEqual(schema.store(ledger.Text, "text"), "text")
+
+class TestPartition(Testrestx):
+
+    OCTOBER = 1792000000 # 2026-10-14
+
+    def test_month(self):
+
+        self.assertEqual(partition.month(self.OCTOBER), 1790812800)
+        self.assertEqual(partition.month(self.OCTOBER, 3), 1798761600)
+        self.assertEqual(partition.month(self.OCTOBER, -10), 1764547200)
+
+    def test_name(self):
+
+        self.assertEqual(partition.name(1793491200), "p202610")
+        self.assertEqual(partition.name(1767225600), "p202512")
+
+    def test_keys(self):
+
+        self.assertEqual(partition.keys(ledger.Fact), {"witness_id-who": ["witness_id", "who", "when"]})
+
+    def test_define(self):
+
+        sql = """CREATE TABLE IF NOT EXISTS `ledger`.`fact` (
+  `id` BIGINT AUTO_INCREMENT,
+  `when` BIGINT NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE `witness_id_who` (`witness_id`,`who`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`origin` (
+  `id` BIGINT AUTO_INCREMENT,
+  PRIMARY KEY (`id`)
+);
+"""
+
+        partitioned = """CREATE TABLE IF NOT EXISTS `ledger`.`fact` (
+  `id` BIGINT AUTO_INCREMENT,
+  `when` BIGINT NOT NULL,
+  PRIMARY KEY (`id`,`when`),
+  UNIQUE `witness_id_who` (`witness_id`,`who`,`when`)
+)
+PARTITION BY RANGE (`when`) (
+  PARTITION `future` VALUES LESS THAN MAXVALUE
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`origin` (
+  `id` BIGINT AUTO_INCREMENT,
+  PRIMARY KEY (`id`)
+);
+"""
+
+        self.assertEqual(partition.define(sql, ledger.Fact), partitioned)
+        self.assertEqual(partition.define(partitioned, ledger.Fact), partitioned)
+
+    def test_migration(self):
+
+        self.assertEqual(partition.migration(ledger.Fact, self.OCTOBER), """ALTER TABLE `ledger`.`fact`
+  DROP PRIMARY KEY,
+  DROP INDEX `witness_id_who`,
+  ADD UNIQUE `witness_id_who` (`witness_id`,`who`,`when`),
+  ADD PRIMARY KEY (`id`,`when`);
+ALTER TABLE `ledger`.`fact`
+  PARTITION BY RANGE (`when`) (
+    PARTITION `past` VALUES LESS THAN (1790812800),
+    PARTITION `future` VALUES LESS THAN MAXVALUE
+  );""")
+
+    def test_ddl(self):
+
+        with tempfile.TemporaryDirectory() as path:
+
+            with open(f"{path}/definition.sql", "w") as definition_file:
+                definition_file.write("CREATE TABLE IF NOT EXISTS `ledger`.`fact` (\n  PRIMARY KEY (`id`)\n);\n")
+
+            self.assertTrue(partition.ddl(path, [ledger.Origin, ledger.Fact], self.OCTOBER, "stamp"))
+
+            with open(f"{path}/definition.sql", "r") as definition_file:
+                self.assertIn("PARTITION BY RANGE (`when`)", definition_file.read())
+
+            with open(f"{path}/definition-stamp.sql", "r") as definition_file:
+                self.assertNotIn("PARTITION BY", definition_file.read())
+
+            with open(f"{path}/migration-stamp.sql", "r") as migration_file:
+                self.assertEqual(migration_file.read(), partition.migration(ledger.Fact, self.OCTOBER))
+
+            self.assertFalse(partition.ddl(path, [ledger.Fact], self.OCTOBER, "again"))
+            self.assertFalse(os.path.exists(f"{path}/migration-again.sql"))
+
+    def test_get(self):
+
+        self.assertStatusValue(self.api.get("/partition"), 200, "partitions", [{"name": "future", "bound": None}])
+
+    @unittest.mock.patch("time.time")
+    def test_post(self, mock_time):
+
+        mock_time.return_value = self.OCTOBER
+
+        response = self.api.post("/partition", json={"ahead": 1})
+        self.assertStatusValue(response, 201, "added", ["p202610", "p202611"])
+        self.assertStatusValue(response, 201, "dropped", [])
+
+        self.api.post("/fact", json={"fact": {"witness_id": 1, "who": "one", "when": self.OCTOBER}})
+
+        self.assertStatusValue(self.api.post("/partition", json={"ahead": 1}), 201, "added", [])
+        self.assertEqual(ledger.Claim.many().count(), 1)
+
+        mock_time.return_value = 1799000000 # 2027-01-03
+
+        response = self.api.post("/partition", json={"ahead": 1, "retain": 1})
+        self.assertStatusValue(response, 201, "added", ["p202612", "p202701", "p202702"])
+        self.assertStatusValue(response, 201, "dropped", ["p202610", "p202611"])
+
+        self.assertEqual(ledger.Fact.many().count(), 0)
+        self.assertEqual(ledger.Claim.many().count(), 0)
+
+        self.assertStatusValue(self.api.get("/partition"), 200, "partitions", [
+            {"name": "p202612", "bound": 1798761600},
+            {"name": "p202701", "bound": 1801440000},
+            {"name": "p202702", "bound": 1803859200},
+            {"name": "future", "bound": None}
+        ])
+
+class TestSearch(unittest.TestCase):
+
+    def test_extract(self):
+
+        self.assertEqual(search.extract({"cid": "a", "author": "me", "text": "hi"}), "hi")
+        self.assertEqual(search.extract({"actor": "you", "post": {"text": "hi"}}), "hi")
+        self.assertEqual(search.extract({"reply": {"text": "yes"}, "post": {"text": "hi"}}), "yes\nhi")
+        self.assertEqual(search.extract({"content": "hi", "author": {"name": "me"}, "reference": {"content": "hi "}}), "hi")
+        self.assertEqual(search.extract({
+            "meeting_topic": "standup",
+            "summary_overview": "talked",
+            "summary_details": [{"label": "plans", "summary": "made"}],
+            "next_steps": ["do", "them"]
+        }), "standup\ntalked\nplans\nmade\ndo\nthem")
+        self.assertEqual(search.extract({"id": "1", "text": " "}), "")
+        self.assertEqual(search.extract({"text": "x" * 100000}), "x" * search.LIMIT)
+        self.assertEqual(search.extract({"text": "a", "name": "b"}, ["name"]), "b")
+
+    def test_columns(self):
+
+        self.assertEqual(search.columns(ledger.Text), ["text"])
+
+    def test_define(self):
+
+        sql = """CREATE TABLE IF NOT EXISTS `ledger`.`text` (
+  `id` BIGINT AUTO_INCREMENT,
+  `text` VARCHAR(255) NOT NULL,
+  PRIMARY KEY (`id`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`unum` (
+  `id` BIGINT AUTO_INCREMENT,
+  `who` VARCHAR(255) NOT NULL,
+  PRIMARY KEY (`id`)
+);
+"""
+
+        searchable = """CREATE TABLE IF NOT EXISTS `ledger`.`text` (
+  `id` BIGINT AUTO_INCREMENT,
+  `text` MEDIUMTEXT NOT NULL,
+  PRIMARY KEY (`id`),
+  FULLTEXT `text` (`text`)
+);
+
+CREATE TABLE IF NOT EXISTS `ledger`.`unum` (
+  `id` BIGINT AUTO_INCREMENT,
+  `who` VARCHAR(255) NOT NULL,
+  PRIMARY KEY (`id`)
+);
+"""
+
+        self.assertEqual(search.define(sql, ledger.Text), searchable)
+        self.assertEqual(search.define(searchable, ledger.Text), searchable)
+
+    def test_migration(self):
+
+        self.assertEqual(search.migration(ledger.Text), """ALTER TABLE `ledger`.`text`
+  MODIFY `text` MEDIUMTEXT NOT NULL,
+  ADD FULLTEXT `text` (`text`);""")
+
+    def test_ddl(self):
+
+        with tempfile.TemporaryDirectory() as path:
+
+            with open(f"{path}/definition.sql", "w") as definition_file:
+                definition_file.write("CREATE TABLE IF NOT EXISTS `ledger`.`text` (\n  `text` VARCHAR(255) NOT NULL\n);\n")
+
+            self.assertTrue(search.ddl(path, [ledger.Origin, ledger.Text], "stamp"))
+
+            with open(f"{path}/definition.sql", "r") as definition_file:
+                self.assertIn("FULLTEXT `text` (`text`)", definition_file.read())
+
+            with open(f"{path}/definition-stamp.sql", "r") as definition_file:
+                self.assertNotIn("FULLTEXT", definition_file.read())
+
+            with open(f"{path}/migration-stamp.sql", "r") as migration_file:
+                self.assertEqual(migration_file.read(), search.migration(ledger.Text))
+
+            self.assertFalse(search.ddl(path, [ledger.Text], "again"))
+            self.assertFalse(os.path.exists(f"{path}/migration-again.sql"))
+
+class MockRedis:
+
+    def __init__(self):
+
+        self.data = {}
+        self.expires = {}
+        self.down = False
+
+    def check(self):
+
+        if self.down:
+            raise redis.ConnectionError("down")
+
+    def get(self, key):
+
+        self.check()
+
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+
+        self.check()
+
+        self.data[key] = value
+        self.expires[key] = ex
+
+    def incr(self, key):
+
+        self.check()
+
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+
+        return int(self.data[key])
+
+    def pipeline(self, transaction=True):
+
+        return self
+
+    def execute(self):
+
+        self.check()
+
+    def scan_iter(self, match):
+
+        return [key for key in list(self.data) if key.startswith(match[:-1])]
+
+    def delete(self, key):
+
+        self.data.pop(key, None)
+
+    def zrem(self, key, *members):
+
+        self.data[key] = [member for member in self.data.get(key, []) if member not in members]
+
+    def xadd(self, stream, fields):
+
+        self.data.setdefault(stream, []).append(fields)
+
+class TestCached(Testrestx):
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.app.redis = MockRedis()
+
+    def test_get(self):
+
+        origin = ledger.Origin("zoom").create()
+
+        self.assertStatusModels(self.api.get("/origin"), 200, "origins", [{"who": "zoom"}])
+        self.assertEqual(len(self.app.redis.data), 1)
+        self.assertEqual(list(self.app.redis.expires.values()), [3600])
+
+        # Cached so changes behind our back aren't seen
+
+        ledger.Origin("bsky").create()
+
+        self.assertStatusModels(self.api.get("/origin"), 200, "origins", [{"who": "zoom"}])
+        self.assertStatusModel(self.api.get(f"/origin/{origin.id}"), 200, "origin", {"who": "zoom"})
+        self.assertStatusModels(self.api.post("/origin", json={"filter": {"who": "bsky"}}), 200, "origins", [{"who": "bsky"}])
+        self.assertEqual(len(self.app.redis.data), 3)
+
+        self.assertStatusValue(self.api.get("/origin/0"), 404, "message", "origin: none retrieved")
+        self.assertEqual(len(self.app.redis.data), 3)
+
+        self.app.redis.down = True
+
+        self.assertStatusModels(self.api.get("/origin"), 200, "origins", [{"who": "bsky"}, {"who": "zoom"}])
+
+    def test_post(self):
+
+        self.assertStatusValue(self.api.get("/unum"), 200, "unums", [])
+
+        self.assertStatusModel(self.api.post("/unum", json={"unum": {"who": "self"}}), 201, "unum", {"who": "self"})
+        self.assertEqual(self.app.redis.data["ledger/cache"], "1")
+
+        self.assertStatusModels(self.api.get("/unum"), 200, "unums", [{"who": "self"}])
+
+        self.app.redis.down = True
+
+        self.assertStatusModel(self.api.post("/unum", json={"unum": {"who": "other"}}), 201, "unum", {"who": "other"})
+
+    def test_patch(self):
+
+        unum = ledger.Unum("self").create()
+        entity = ledger.Entity(unum_id=unum.id, who="me").create()
+
+        self.assertStatusModel(self.api.get(f"/entity/{entity.id}"), 200, "entity", {"who": "me"})
+
+        self.assertStatusValue(self.api.patch(f"/entity/{entity.id}", json={"entity": {"who": "you"}}), 202, "updated", 1)
+        self.assertStatusModel(self.api.get(f"/entity/{entity.id}"), 200, "entity", {"who": "you"})
+
+    def test_delete(self):
+
+        unum = ledger.Unum("self").create()
+        entity = ledger.Entity(unum_id=unum.id, who="me").create()
+        origin = ledger.Origin("zoom").create()
+        witness = ledger.Witness(entity_id=entity.id, origin_id=origin.id, who="me").create()
+
+        self.assertStatusModels(self.api.get("/witness"), 200, "witnesss", [{"who": "me"}])
+
+        self.assertStatusValue(self.api.delete(f"/witness/{witness.id}"), 202, "deleted", 1)
+        self.assertStatusValue(self.api.get("/witness"), 200, "witnesss", [])
+
+class TestProjected(Testrestx):
+
+    def setUp(self):
+
+        super().setUp()
+
+        self.app.redis = MockRedis()
+
+    def test_get(self):
+
+        ledger.Origin("zoom", meta={"a": 1}).create()
+        ledger.Origin("bsky").create()
+
+        response = self.api.get("/origin?fields=who&sort=who")
+        self.assertStatusValue(response, 200, "origins", [
+            {"id": ledger.Origin.one(who="bsky").id, "who": "bsky"},
+            {"id": ledger.Origin.one(who="zoom").id, "who": "zoom"}
+        ])
+        self.assertNotIn("formats", response.json)
+
+        response = self.api.post("/origin", json={"filter": {"who": "zoom"}, "fields": ["meta", "id"]})
+        self.assertStatusValue(response, 200, "origins", [{"id": ledger.Origin.one(who="zoom").id, "meta": {"a": 1}}])
+
+        self.assertStatusValue(self.api.get("/origin?fields=who&count=true"), 200, "origins", 2)
+        self.assertStatusModel(self.api.get(f"/origin/{ledger.Origin.one(who='zoom').id}?fields=who"), 200, "origin", {"meta": {"a": 1}})
+
+        self.assertStatusValue(self.api.get("/origin?fields=who,nope"), 400, "message", "unknown fields ['nope']")
+
+    def test_options(self):
+
+        response = self.api.options("/origin")
+        self.assertEqual(response.status_code, 200, response.json)
+        self.assertEqual([field["name"] for field in response.json["fields"]], ["id", "who", "meta"])
+
 class TestHealth(Testrestx):
 
     def test_get(self):
 
         self.assertStatusValue(self.api.get("/health"), 200, "message", "OK")
+
+class TestFact(Testrestx):
+
+    def test_post(self):
+
+        response = self.api.post("/fact", json={"fact": {"witness_id": 1, "who": "one", "when": 1}})
+        self.assertStatusModel(response, 201, "fact", {"witness_id": 1, "who": "one", "when": 1})
+
+        response = self.api.post("/fact", json={"facts": []})
+        self.assertStatusValue(response, 201, "facts", [])
+
+        response = self.api.post("/fact", json={"facts": [
+            {"witness_id": 1, "who": "two", "when": 2, "what": {"a": 1}},
+            {"witness_id": 2, "who": "one", "when": 3}
+        ]})
+        self.assertStatusModels(response, 201, "facts", [
+            {"witness_id": 1, "who": "two", "when": 2, "what": {"a": 1}},
+            {"witness_id": 2, "who": "one", "when": 3}
+        ])
+
+        ids = [fact["id"] for fact in response.json["facts"]]
+        self.assertEqual(ids, [ledger.Fact.one(witness_id=1, who="two").id, ledger.Fact.one(witness_id=2, who="one").id])
+
+        self.assertEqual(ledger.Fact.many().count(), 3)
+
+    def test_post_upsert(self):
+
+        ledger.Fact(witness_id=1, who="one", when=1, what={"a": 1}).create()
+
+        response = self.api.post("/fact", json={"upsert": True, "fact": {"witness_id": 1, "who": "one", "when": 2}})
+        self.assertStatusModel(response, 201, "fact", {"witness_id": 1, "who": "one", "when": 1, "what": {"a": 1}})
+        self.assertFalse(response.json["created"])
+
+        response = self.api.post("/fact", json={"upsert": True, "facts": [
+            {"witness_id": 1, "who": "one", "when": 2},
+            {"witness_id": 1, "who": "two", "when": 3},
+            {"witness_id": 1, "who": "two", "when": 4}
+        ]})
+        self.assertStatusModels(response, 201, "facts", [
+            {"witness_id": 1, "who": "one", "when": 1},
+            {"witness_id": 1, "who": "two", "when": 3},
+            {"witness_id": 1, "who": "two", "when": 3}
+        ])
+        self.assertEqual(response.json["created"], [False, True, False])
+
+        response = self.api.post("/fact", json={"upsert": True, "facts": [{"witness_id": 1, "who": "two"}]})
+        self.assertEqual(response.json["created"], [False])
+
+        self.assertEqual(ledger.Fact.many().count(), 2)
+
+    def test_post_claimed(self):
+
+        # Another writer stored one after we looked, so only its claim stops us
+
+        ledger.Fact(witness_id=1, who="one", when=1).create()
+        ledger.Claim(witness_id=1, who="one", when=0, token="theirs").create()
+
+        lookup = service.Fact.lookup
+        looked = []
+
+        def late(self, facts):
+            looked.append(facts)
+            return {} if len(looked) == 1 else lookup(self, facts)
+
+        with unittest.mock.patch.object(service.Fact, "lookup", late):
+            response = self.api.post("/fact", json={"upsert": True, "facts": [
+                {"witness_id": 1, "who": "one", "when": 2},
+                {"witness_id": 1, "who": "two", "when": 3}
+            ]})
+
+        self.assertStatusModels(response, 201, "facts", [
+            {"witness_id": 1, "who": "one", "when": 1},
+            {"witness_id": 1, "who": "two", "when": 3}
+        ])
+        self.assertEqual(response.json["created"], [False, True])
+        self.assertEqual(ledger.Fact.many().count(), 2)
+
+        # Without upserting it's an error, and nothing's created
+
+        response = self.api.post("/fact", json={"facts": [
+            {"witness_id": 1, "who": "three", "when": 4},
+            {"witness_id": 1, "who": "one", "when": 5}
+        ]})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(ledger.Fact.many().count(), 2)
+        self.assertEqual(ledger.Claim.many().count(), 2)
+
+    def test_post_stale(self):
+
+        # Claimed by a fact since patched to another who, so nothing's stored for it
+
+        ledger.Claim(witness_id=1, who="one", when=0, token="theirs").create()
+
+        response = self.api.post("/fact", json={"upsert": True, "facts": [{"witness_id": 1, "who": "one", "when": 2}]})
+
+        self.assertStatusModels(response, 201, "facts", [{"witness_id": 1, "who": "one", "when": 2}])
+        self.assertEqual(response.json["created"], [True])
+        self.assertEqual(ledger.Claim.many().count(), 1)
+        self.assertNotEqual(ledger.Claim.one().token, "theirs")
+
+    def test_delete(self):
+
+        response = self.api.post("/fact", json={"facts": [
+            {"witness_id": 1, "who": "one", "when": 1},
+            {"witness_id": 1, "who": "two", "when": 2}
+        ]})
+
+        self.assertStatusValue(self.api.delete(f"/fact/{response.json['facts'][0]['id']}"), 202, "deleted", 1)
+        self.assertEqual(ledger.Claim.many().who, ["two"])
+
+        self.assertStatusValue(self.api.delete("/fact?witness_id=1"), 202, "deleted", 1)
+        self.assertEqual(ledger.Claim.many().count(), 0)
+
+        # Daemons are told to forget what's deleted
+
+        self.app.redis = MockRedis()
+        self.app.redis.data["ledger/seen/1"] = ["one", "three"]
+
+        response = self.api.post("/fact", json={"fact": {"witness_id": 1, "who": "three", "when": 4}})
+        self.assertStatusValue(self.api.delete(f"/fact/{response.json['fact']['id']}"), 202, "deleted", 1)
+
+        self.assertEqual(self.app.redis.data["ledger/seen/1"], ["one"])
+        self.assertEqual(self.app.redis.data["ledger/fact"], [{"forget": '[{"witness_id": 1, "who": "three"}]'}])
+
+        with self.app.app_context():
+            service.Fact.forget()
+
+        self.assertNotIn("ledger/seen/1", self.app.redis.data)
+        self.assertEqual(self.app.redis.data["ledger/fact"][-1], {"forget": "*"})
+
+        # Redis being down doesn't fail deletes
+
+        self.app.redis.down = True
+        response = self.api.post("/fact", json={"fact": {"witness_id": 1, "who": "four", "when": 5}})
+        self.assertStatusValue(self.api.delete(f"/fact/{response.json['fact']['id']}"), 202, "deleted", 1)
+
+        response = self.api.post("/fact", json={"fact": {"witness_id": 1, "who": "one", "when": 3}})
+        self.assertStatusModel(response, 201, "fact", {"witness_id": 1, "who": "one", "when": 3})
+
+    def test_get(self):
+
+        ledger.Fact([
+            {"witness_id": 1, "who": "one", "when": 1},
+            {"witness_id": 1, "who": "two", "when": 2},
+            {"witness_id": 1, "who": "three", "when": 2},
+            {"witness_id": 1, "who": "four", "when": 3},
+            {"witness_id": 2, "who": "one", "when": 4}
+        ]).create()
+
+        response = self.api.get("/fact?witness_id=1&cursor=&limit=2")
+        self.assertStatusModels(response, 200, "facts", [
+            {"witness_id": 1, "who": "four", "when": 3},
+            {"witness_id": 1, "who": "three", "when": 2}
+        ])
+
+        response = self.api.get(f"/fact?witness_id=1&cursor={response.json['cursor']}&limit=2")
+        self.assertStatusModels(response, 200, "facts", [
+            {"witness_id": 1, "who": "two", "when": 2},
+            {"witness_id": 1, "who": "one", "when": 1}
+        ])
+
+        response = self.api.get(f"/fact?witness_id=1&cursor={response.json['cursor']}&limit=2")
+        self.assertStatusValue(response, 200, "facts", [])
+        self.assertIsNone(response.json["cursor"])
+
+        response = self.api.post("/fact", json={"filter": {"witness_id": 1}, "cursor": None, "limit": {"limit": 3}})
+        self.assertEqual([fact["who"] for fact in response.json["facts"]], ["four", "three", "two"])
+
+        response = self.api.post("/fact", json={"filter": {"witness_id": 1}, "cursor": response.json["cursor"]})
+        self.assertEqual([fact["who"] for fact in response.json["facts"]], ["one"])
+        self.assertIsNone(response.json["cursor"])
+
+        response = self.api.get("/fact?witness_id=1&cursor=&limit__per_page=3")
+        self.assertEqual([fact["who"] for fact in response.json["facts"]], ["four", "three", "two"])
+
+        response = self.api.post("/fact", json={"filter": {"witness_id": 1}, "cursor": None, "limit": {"per_page": 1}})
+        self.assertEqual([fact["who"] for fact in response.json["facts"]], ["four"])
+
+        response = self.api.get("/fact?witness_id=1&cursor=&limit__page=2")
+        self.assertStatusValue(response, 400, "message", "paging by cursor, not start or page")
+
+        self.assertStatusValue(self.api.get("/fact?witness_id=1&cursor=&count=true"), 200, "facts", 4)
+        self.assertStatusValue(self.api.get("/fact?witness_id=1"), 200, "overflow", False)
+
+        response = self.api.get("/fact?cursor=nope")
+        self.assertStatusValue(response, 400, "message", "invalid cursor nope")
+
+    def test_get_fields(self):
+
+        self.app.config["FACT_BLOB"] = 50
+
+        big = {"summary": "x" * 100}
+
+        ids = [fact["id"] for fact in self.api.post("/fact", json={"facts": [
+            {"witness_id": 1, "who": "one", "when": 1, "what": big},
+            {"witness_id": 1, "who": "two", "when": 2, "what": {"small": True}},
+            {"witness_id": 2, "who": "one", "when": 3}
+        ]}).json["facts"]]
+
+        response = self.api.post("/fact", json={"filter": {"witness_id": 1, "who__in": ["one", "nope"]}, "fields": ["who"]})
+        self.assertStatusValue(response, 200, "facts", [{"id": ids[0], "who": "one"}])
+
+        response = self.api.get("/fact?witness_id=1&fields=who,what&inflate=true&sort=when")
+        self.assertStatusValue(response, 200, "facts", [
+            {"id": ids[0], "who": "one", "what": big},
+            {"id": ids[1], "who": "two", "what": {"small": True}}
+        ])
+
+        response = self.api.get("/fact?witness_id=1&fields=who&cursor=&limit=1")
+        self.assertStatusValue(response, 200, "facts", [{"id": ids[1], "who": "two"}])
+        self.assertNotIn("formats", response.json)
+
+        response = self.api.get(f"/fact?witness_id=1&fields=who,what&cursor={response.json['cursor']}&limit=1")
+        self.assertStatusValue(response, 200, "facts", [{"id": ids[0], "who": "one", "what": {}}])
+
+    def test_blob(self):
+
+        blob = service.Fact.blob({"b": 2, "a": 1})
+
+        self.assertEqual(blob["who"], hashlib.sha256(b'{"a":1,"b":2}').hexdigest())
+        self.assertEqual(blob["size"], 13)
+        self.assertEqual(json.loads(zlib.decompress(base64.b64decode(blob["data"]["zlib"]))), {"a": 1, "b": 2})
+
+        self.assertEqual(service.Fact.blob({"a": 1, "b": 2}), blob)
+
+    def test_offload(self):
+
+        big = {"summary": "x" * 100}
+
+        self.app.config["FACT_BLOB"] = 0
+
+        response = self.api.post("/fact", json={"fact": {"witness_id": 1, "who": "off", "when": 1, "what": big}})
+        self.assertStatusModel(response, 201, "fact", {"who": "off", "what": big, "meta": {}})
+
+        self.app.config["FACT_BLOB"] = 50
+
+        response = self.api.post("/fact", json={"upsert": True, "facts": [
+            {"witness_id": 1, "who": "one", "when": 1, "what": big},
+            {"witness_id": 2, "who": "one", "when": 1, "what": big, "meta": {"a": 1}},
+            {"witness_id": 1, "who": "two", "when": 2, "what": {"small": True}}
+        ]})
+
+        who = service.Fact.blob(big)["who"]
+
+        self.assertStatusModels(response, 201, "facts", [
+            {"who": "one", "what": {}, "meta": {"blob": who}},
+            {"who": "one", "what": {}, "meta": {"a": 1, "blob": who}},
+            {"who": "two", "what": {"small": True}, "meta": {}}
+        ])
+
+        self.assertEqual(ledger.Blob.many().who, [who])
+        self.assertEqual(ledger.Blob.one().size, len(json.dumps(big, separators=(",", ":"))))
+
+        response = self.api.post("/fact", json={"fact": {"witness_id": 3, "who": "one", "when": 1, "what": big}})
+        self.assertStatusModel(response, 201, "fact", {"what": {}, "meta": {"blob": who}})
+
+        self.assertEqual(ledger.Blob.many().count(), 1)
+
+    def test_inflate(self):
+
+        self.app.config["FACT_BLOB"] = 50
+
+        big = {"summary": "x" * 100}
+
+        id = self.api.post("/fact", json={"facts": [
+            {"witness_id": 1, "who": "one", "when": 1, "what": big},
+            {"witness_id": 1, "who": "two", "when": 2, "what": {"small": True}}
+        ]}).json["facts"][0]["id"]
+
+        self.assertStatusModel(self.api.get(f"/fact/{id}"), 200, "fact", {"who": "one", "what": big})
+
+        self.assertStatusModels(self.api.get("/fact?witness_id=1"), 200, "facts", [
+            {"who": "two", "what": {"small": True}},
+            {"who": "one", "what": {}}
+        ])
+
+        self.assertStatusModels(self.api.get("/fact?witness_id=1&inflate=true"), 200, "facts", [
+            {"who": "two", "what": {"small": True}},
+            {"who": "one", "what": big}
+        ])
+
+        self.assertStatusModels(self.api.get("/fact?witness_id=1&cursor=&inflate=1"), 200, "facts", [
+            {"who": "two", "what": {"small": True}},
+            {"who": "one", "what": big}
+        ])
+
+        response = self.api.post("/fact", json={"filter": {"witness_id": 1}, "inflate": True})
+        self.assertEqual(response.json["facts"][1]["what"], big)
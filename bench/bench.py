@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+"""
+Benchmarks facts end to end, cron → Redis streams → daemon → API → MySQL
+
+Runs the API in a subprocess against MYSQL_HOST, which is wiped, and everything else
+in this one. Redis and the Origins are stood in for unless --redis is given, which is
+flushed. Reports throughput, latency percentiles and API calls per fact, optionally
+saving them as a baseline or comparing them to one.
+"""
+
+# pylint: disable=import-outside-toplevel,wrong-import-position
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import importlib.util
+import unittest.mock
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "bench", "baseline")
+
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+import fakes
+
+# Which way is better for each metric, so comparisons know what a regression is
+
+HIGHER = ["facts_per_second"]
+LOWER = ["api_calls_per_fact", "origin_calls_per_fact", "api_p95", "cycle_p95", "handler_p95"]
+
+def percentiles(seconds):
+    """
+    p50, p95 and p99 in milliseconds
+    """
+
+    if not seconds:
+        return {"p50": None, "p95": None, "p99": None}
+
+    ordered = sorted(seconds)
+
+    return {
+        f"p{percent}": round(1000 * ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))], 3)
+        for percent in (50, 95, 99)
+    }
+
+def serve(args):
+    """
+    Serves a fresh API, called in the subprocess
+    """
+
+    sys.path.insert(0, os.path.join(ROOT, "api", "lib"))
+    os.chdir(os.path.join(ROOT, "api"))
+
+    import logging
+    import werkzeug.serving
+    import relations
+    import service
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    mysql = {"host": os.environ["MYSQL_HOST"], "user": os.environ.get("MYSQL_USER", "root")}
+
+    if os.environ.get("MYSQL_PASSWORD"):
+        mysql["password"] = os.environ["MYSQL_PASSWORD"]
+
+    with unittest.mock.patch("service.open", unittest.mock.mock_open(read_data=json.dumps(mysql)), create=True):
+        app = service.build()
+
+    if not args.redis:
+        app.redis = fakes.FakeRedis()
+
+    cursor = app.source.connection.cursor()
+    cursor.execute("DROP DATABASE IF EXISTS `ledger`")
+    cursor.execute("CREATE DATABASE IF NOT EXISTS `ledger`")
+    relations.Migrations().load(app.source.name, "definition.sql")
+    app.source.checkin()
+
+    werkzeug.serving.make_server("127.0.0.1", args.port, app, threaded=True).serve_forever()
+
+class Bench:
+    """
+    Runs scenarios against a local API and stand-ins
+    """
+
+    def __init__(self, args):
+
+        self.args = args
+
+        self.api = self.start()
+
+        sys.path[:0] = [os.path.join(ROOT, "daemon", "lib"), os.path.join(ROOT, "api", "lib")]
+        os.environ.setdefault("K8S_POD", "bench")
+
+        import redis
+
+        if args.redis:
+            self.redis = redis.Redis(host=args.redis, encoding="utf-8", decode_responses=True)
+            self.redis.flushdb()
+        else:
+            self.redis = fakes.FakeRedis()
+
+        with unittest.mock.patch("redis.Redis", lambda *args, **kwargs: self.redis):
+
+            import service
+            self.daemon = service.Daemon()
+
+            # Cron's module is also called service, so load it under another name
+
+            spec = importlib.util.spec_from_file_location("cron_service", os.path.join(ROOT, "cron", "lib", "service.py"))
+            cron_service = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(cron_service)
+            self.cron = cron_service.Cron()
+
+        self.timings = {"api": fakes.Timings(), "zoom": fakes.Timings(), "bsky": fakes.Timings()}
+
+        for source in (self.daemon.source, self.cron.source):
+            source.url = self.api["url"]
+            source.session.mount(self.api["url"], fakes.Counted(self.timings["api"]))
+
+        # Block for a millisecond rather than seconds when there's nothing left
+
+        self.daemon.sleep = 0.001
+
+        self.read = False
+        xreadgroup = self.redis.xreadgroup
+
+        def read(*args, **kwargs):
+            messages = xreadgroup(*args, **kwargs)
+            self.read = bool(messages)
+            return messages
+
+        self.daemon.redis.xreadgroup = read
+
+        self.zoom = fakes.Zoom(args.meetings)
+        self.daemon.clients.adapter = fakes.Adapter(self.zoom.answer, args.latency / 1000, self.timings["zoom"])
+
+        self.bsky = fakes.Bsky(
+            args.posts, [f"witness-{index}.bsky" for index in range(args.witnesses)],
+            args.latency / 1000, self.timings["bsky"]
+        )
+
+        self.discord = []
+
+    def start(self):
+        """
+        Starts the API and waits for it to be healthy
+        """
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            path for path in [os.path.join(ROOT, "api", "lib"), os.environ.get("PYTHONPATH")] if path
+        ))
+
+        command = [sys.executable, os.path.abspath(__file__), "api", "--port", str(port)]
+
+        if self.args.redis:
+            command.extend(["--redis", self.args.redis])
+
+        process = subprocess.Popen(command, env=env) # pylint: disable=consider-using-with
+
+        url = f"http://127.0.0.1:{port}"
+
+        for _ in range(300):
+
+            if process.poll() is not None:
+                raise Exception(f"api exited with {process.returncode}")
+
+            try:
+                if requests.get(f"{url}/health").ok:
+                    return {"process": process, "url": url}
+            except requests.exceptions.ConnectionError:
+                pass
+
+            time.sleep(0.1)
+
+        process.terminate()
+
+        raise Exception("api never became healthy")
+
+    def stop(self):
+        """
+        Stops the API
+        """
+
+        self.api["process"].terminate()
+        self.api["process"].wait()
+
+    def seed(self):
+        """
+        Creates an Origin for each of Zoom, BlueSky and Discord with Witnesses for each
+        """
+
+        import ledger
+
+        unum = ledger.Unum(who="bench").create()
+
+        origins = {who: ledger.Origin(who=who).create() for who in ["zoom", "bsky", "discord"]}
+
+        for index in range(self.args.accounts):
+            entity = ledger.Entity(unum_id=unum.id, who=f"zoom-{index}").create()
+            ledger.Witness(entity_id=entity.id, origin_id=origins["zoom"].id, who=f"zoom-{index}").create()
+
+        for index, handle in enumerate(self.bsky.handles):
+            entity = ledger.Entity(unum_id=unum.id, who=f"bsky-{index}").create()
+            ledger.Witness(entity_id=entity.id, origin_id=origins["bsky"].id, who=handle).create()
+
+        for index in range(self.args.witnesses):
+            entity = ledger.Entity(unum_id=unum.id, who=f"discord-{index}").create()
+            ledger.Witness(entity_id=entity.id, origin_id=origins["discord"].id, who=str(1000 + index)).create()
+            self.discord.append(1000 + index)
+
+    def measure(self, name, scenario):
+        """
+        Runs a scenario and works out its metrics
+        """
+
+        for timings in self.timings.values():
+            timings.reset()
+
+        facts = self.redis.xlen("ledger/fact") if self.redis.exists("ledger/fact") else 0
+
+        start = time.time()
+        latencies = scenario()
+        seconds = time.time() - start
+
+        facts = (self.redis.xlen("ledger/fact") if self.redis.exists("ledger/fact") else 0) - facts
+
+        origin_calls = self.timings["zoom"].calls + self.timings["bsky"].calls
+
+        result = {
+            "facts": facts,
+            "seconds": round(seconds, 3),
+            "facts_per_second": round(facts / seconds, 1) if facts else None,
+            "api_calls": self.timings["api"].calls,
+            "api_calls_per_fact": round(self.timings["api"].calls / facts, 3) if facts else None,
+            "origin_calls": origin_calls,
+            "origin_calls_per_fact": round(origin_calls / facts, 3) if facts else None
+        }
+
+        result.update({f"api_{key}": value for key, value in percentiles(self.timings["api"].seconds).items()})
+
+        for kind, seconds in latencies.items():
+            result.update({f"{kind}_{key}": value for key, value in percentiles(seconds).items()})
+
+        print(f"{name}: {json.dumps(result)}", file=sys.stderr)
+
+        return result
+
+    def drain(self):
+        """
+        Processes until the daemon reads nothing, timing each cycle
+        """
+
+        cycles = []
+
+        while True:
+
+            start = time.time()
+            self.daemon.process()
+            cycles.append(time.time() - start)
+
+            if not self.read:
+                return {"cycle": cycles}
+
+    def sync(self):
+        """
+        Cron kicking off every origin and the daemon working through it all
+        """
+
+        with unittest.mock.patch("origin.zoom.open", unittest.mock.mock_open(read_data=json.dumps({
+            "client_id": "bench", "client_secret": "bench", "account_id": "bench"
+        })), create=True), unittest.mock.patch("origin.bsky.open", unittest.mock.mock_open(read_data=json.dumps({
+            "url": "https://bsky.bench", "handle": "me", "password": "bench"
+        })), create=True), unittest.mock.patch("origin.bsky.atproto.Client", self.bsky):
+
+            self.cron.process()
+
+            return self.drain()
+
+    def gateway(self):
+        """
+        Discord events through the pipeline, timing how long each holds up the event loop
+        """
+
+        import asyncio
+        import discord
+        import pipeline
+        import origin.discord
+
+        handlers = []
+
+        async def run():
+
+            writes = pipeline.Pipeline(
+                self.daemon, batch=self.daemon.writer.size, latency=self.daemon.writer.latency, retry=1
+            )
+
+            client = origin.discord.OriginClient(daemon=self.daemon, writes=writes, intents=discord.Intents.default())
+
+            await client.setup_hook()
+
+            for index in range(self.args.messages):
+                start = time.time()
+                await client.on_message(fakes.discord_message(index, self.discord[index % len(self.discord)]))
+                handlers.append(time.time() - start)
+
+            await writes.stop()
+
+        asyncio.run(run())
+
+        return {"handler": handlers}
+
+    def run(self):
+        """
+        Runs every scenario
+        """
+
+        try:
+
+            self.seed()
+
+            return {
+                "sync": self.measure("sync", self.sync),
+                "resync": self.measure("resync", self.sync),
+                "discord": self.measure("discord", self.gateway)
+            }
+
+        finally:
+
+            self.stop()
+
+def compare(results, baseline, tolerance):
+    """
+    Lists metrics that got worse than the baseline by more than the tolerance
+    """
+
+    regressions = []
+
+    for scenario, metrics in results.items():
+
+        for metric, value in metrics.items():
+
+            was = baseline.get(scenario, {}).get(metric)
+
+            if value is None or not was:
+                continue
+
+            if (
+                (metric in HIGHER and value < was * (1 - tolerance)) or
+                (metric in LOWER and value > was * (1 + tolerance))
+            ):
+                regressions.append(f"{scenario} {metric}: {was} -> {value}")
+
+    return regressions
+
+def main():
+    """
+    Parses arguments and benchmarks
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", nargs="?", default="bench", choices=["bench", "api"])
+    parser.add_argument("--port", type=int, help="port to serve the api on, in api mode")
+    parser.add_argument("--redis", help="real Redis host to use, flushed, instead of a fake")
+    parser.add_argument("--accounts", type=int, default=5, help="Zoom accounts")
+    parser.add_argument("--meetings", type=int, default=200, help="Zoom meetings per account")
+    parser.add_argument("--witnesses", type=int, default=10, help="BlueSky and Discord witnesses")
+    parser.add_argument("--posts", type=int, default=50, help="BlueSky posts, each liked by every witness")
+    parser.add_argument("--messages", type=int, default=2000, help="Discord messages")
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds each Origin call takes")
+    parser.add_argument("--save", metavar="NAME", help="save results as a baseline")
+    parser.add_argument("--compare", metavar="NAME", help="compare results to a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="fraction worse before it's a regression")
+    args = parser.parse_args()
+
+    if args.mode == "api":
+        serve(args)
+        return 0
+
+    results = Bench(args).run()
+
+    print(json.dumps(results, indent=2))
+
+    if args.save:
+
+        os.makedirs(BASELINE, exist_ok=True)
+
+        with open(os.path.join(BASELINE, f"{args.save}.json"), "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+
+    if args.compare:
+
+        with open(os.path.join(BASELINE, f"{args.compare}.json"), "r") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+
+        for regression in regressions:
+            print(f"regression {regression}", file=sys.stderr)
+
+        return 1 if regressions else 0
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,674 @@
+"""
+Stand-ins for Redis and the Origins, so benchmarks don't depend on anything remote
+"""
+
+# pylint: disable=unused-argument,too-few-public-methods
+
+import time
+import json
+import types
+import fnmatch
+import datetime
+import threading
+import urllib.parse
+
+import requests
+import requests.adapters
+
+class Timings:
+    """
+    Counts calls and how long they took
+    """
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Starts counting over
+        """
+
+        with self.lock:
+            self.seconds = []
+
+    def record(self, seconds):
+        """
+        Records a call
+        """
+
+        with self.lock:
+            self.seconds.append(seconds)
+
+    @property
+    def calls(self):
+        """
+        How many calls
+        """
+
+        return len(self.seconds)
+
+class FakePipeline:
+    """
+    Queues commands and runs them all at once
+    """
+
+    def __init__(self, redis):
+
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+
+        return command
+
+    def execute(self):
+        """
+        Runs everything queued
+        """
+
+        with self.redis.lock:
+            results = [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+        self.commands = []
+
+        return results
+
+class FakeRedis:
+    """
+    Enough of Redis in memory for the daemon, cron and api, streams and all
+    """
+
+    def __init__(self, *args, **kwargs):
+
+        self.lock = threading.RLock()
+        self.values = {}
+        self.zsets = {}
+        self.streams = {}
+        self.groups = {}
+        self.last = (0, 0)
+
+    def pipeline(self, transaction=True):
+        """
+        Pipeline of commands
+        """
+
+        return FakePipeline(self)
+
+    # Keys
+
+    def exists(self, *keys):
+        """
+        How many keys exist
+        """
+
+        with self.lock:
+            return sum(key in self.values or key in self.zsets or key in self.streams for key in keys)
+
+    def expire(self, key, seconds):
+        """
+        Nothing expires during a benchmark
+        """
+
+        return True
+
+    def scan_iter(self, match=None, **kwargs):
+        """
+        Keys matching a pattern
+        """
+
+        with self.lock:
+            keys = list(self.values) + list(self.zsets) + list(self.streams)
+
+        return [key for key in keys if match is None or fnmatch.fnmatch(key, match)]
+
+    def get(self, key):
+        """
+        Gets a value
+        """
+
+        with self.lock:
+            return self.values.get(key)
+
+    def mget(self, keys):
+        """
+        Gets values
+        """
+
+        with self.lock:
+            return [self.values.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, nx=False, **kwargs):
+        """
+        Sets a value, only if it's not already if nx
+        """
+
+        with self.lock:
+
+            if nx and key in self.values:
+                return None
+
+            self.values[key] = str(value)
+
+        return True
+
+    def delete(self, *keys):
+        """
+        Deletes keys, how many there were
+        """
+
+        with self.lock:
+            return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def incr(self, key, amount=1):
+        """
+        Increments a value
+        """
+
+        with self.lock:
+            self.values[key] = str(int(self.values.get(key, 0)) + amount)
+            return int(self.values[key])
+
+    # Sorted sets
+
+    def zadd(self, key, mapping, **kwargs):
+        """
+        Adds members with scores
+        """
+
+        with self.lock:
+            self.zsets.setdefault(key, {}).update(mapping)
+
+        return len(mapping)
+
+    def zscore(self, key, member):
+        """
+        Score of a member
+        """
+
+        with self.lock:
+            return self.zsets.get(key, {}).get(member)
+
+    def zrange(self, key, start, end, **kwargs):
+        """
+        Members by score
+        """
+
+        with self.lock:
+            members = sorted(self.zsets.get(key, {}), key=self.zsets.get(key, {}).get)
+
+        return members[start:] if end == -1 else members[start:end + 1]
+
+    def zremrangebyscore(self, key, low, high):
+        """
+        Removes members within scores
+        """
+
+        with self.lock:
+
+            members = self.zsets.get(key, {})
+            removing = [member for member, score in members.items() if low <= score <= high]
+
+            for member in removing:
+                del members[member]
+
+        return len(removing)
+
+    # Streams
+
+    @staticmethod
+    def parse(message_id):
+        """
+        Stream id as something comparable
+        """
+
+        if message_id in ("$", ">"):
+            return None
+
+        milliseconds, _, sequence = str(message_id).partition("-")
+
+        return (int(milliseconds), int(sequence or 0))
+
+    def xadd(self, name, fields, id="*", **kwargs): # pylint: disable=redefined-builtin
+        """
+        Adds to a stream
+        """
+
+        with self.lock:
+
+            now = (int(time.time() * 1000), 0)
+            self.last = now if now > self.last else (self.last[0], self.last[1] + 1)
+
+            message_id = f"{self.last[0]}-{self.last[1]}"
+            self.streams.setdefault(name, []).append((message_id, {key: str(value) for key, value in fields.items()}))
+
+        return message_id
+
+    def xinfo_stream(self, name):
+        """
+        Length and newest id of a stream
+        """
+
+        with self.lock:
+
+            entries = self.streams.get(name, [])
+
+            return {"length": len(entries), "last-generated-id": entries[-1][0] if entries else "0-0"}
+
+    def xinfo_groups(self, name):
+        """
+        Groups on a stream
+        """
+
+        with self.lock:
+            return [
+                {"name": group, "pending": len(state["pending"]), "last-delivered-id": state["last"]}
+                for (stream, group), state in self.groups.items() if stream == name
+            ]
+
+    def xgroup_create(self, name, groupname, id="$", mkstream=False):
+        """
+        Creates a consumer group
+        """
+
+        with self.lock:
+
+            if mkstream:
+                self.streams.setdefault(name, [])
+
+            entries = self.streams.get(name, [])
+            last = entries[-1][0] if id == "$" and entries else ("0-0" if id == "$" else id)
+
+            self.groups[(name, groupname)] = {"last": last, "pending": {}}
+
+        return True
+
+    def xread(self, streams, count=None, block=None):
+        """
+        Reads entries after ids
+        """
+
+        with self.lock:
+
+            messages = []
+
+            for name, last in streams.items():
+
+                after = self.parse(last)
+                entries = [entry for entry in self.streams.get(name, []) if self.parse(entry[0]) > after][:count]
+
+                if entries:
+                    messages.append([name, entries])
+
+        return messages
+
+    def xrevrange(self, name, max="+", min="-", count=None): # pylint: disable=redefined-builtin
+        """
+        Reads entries newest first, down from max, exclusive if it starts with (
+        """
+
+        with self.lock:
+
+            entries = list(reversed(self.streams.get(name, [])))
+
+            if max.startswith("("):
+                entries = [entry for entry in entries if self.parse(entry[0]) < self.parse(max[1:])]
+
+        return entries[:count]
+
+    def xreadgroup(self, groupname, consumername, streams, count=None, block=None, noack=False):
+        """
+        Reads new entries for a group, tracking them as pending until acked
+        """
+
+        with self.lock:
+
+            messages = []
+
+            for name in streams:
+
+                state = self.groups[(name, groupname)]
+                after = self.parse(state["last"])
+
+                entries = [entry for entry in self.streams.get(name, []) if self.parse(entry[0]) > after][:count]
+
+                if not entries:
+                    continue
+
+                state["last"] = entries[-1][0]
+
+                for message_id, _ in entries:
+                    state["pending"][message_id] = {"consumer": consumername, "delivered": time.time(), "times": 1}
+
+                messages.append([name, entries])
+
+        return messages
+
+    def xpending_range(self, name, groupname, min, max, count, consumername=None): # pylint: disable=redefined-builtin,too-many-arguments
+        """
+        Entries read but not acked
+        """
+
+        with self.lock:
+
+            pending = self.groups[(name, groupname)]["pending"]
+
+            return [
+                {
+                    "message_id": message_id,
+                    "consumer": state["consumer"],
+                    "time_since_delivered": int((time.time() - state["delivered"]) * 1000),
+                    "times_delivered": state["times"]
+                }
+                for message_id, state in sorted(pending.items(), key=lambda item: self.parse(item[0]))
+                if consumername is None or state["consumer"] == consumername
+            ][:count]
+
+    def xclaim(self, name, groupname, consumername, min_idle_time, message_ids, **kwargs): # pylint: disable=too-many-arguments
+        """
+        Takes over entries pending long enough
+        """
+
+        with self.lock:
+
+            pending = self.groups[(name, groupname)]["pending"]
+            entries = dict(self.streams.get(name, []))
+            claimed = []
+
+            for message_id in message_ids:
+
+                state = pending.get(message_id)
+
+                if state is None or (time.time() - state["delivered"]) * 1000 < min_idle_time:
+                    continue
+
+                pending[message_id] = {"consumer": consumername, "delivered": time.time(), "times": state["times"] + 1}
+                claimed.append((message_id, entries.get(message_id)))
+
+        return claimed
+
+    def xack(self, name, groupname, *ids):
+        """
+        Acks entries
+        """
+
+        with self.lock:
+
+            pending = self.groups[(name, groupname)]["pending"]
+
+            return sum(pending.pop(message_id, None) is not None for message_id in ids)
+
+    def xlen(self, name):
+        """
+        Length of a stream
+        """
+
+        with self.lock:
+            return len(self.streams.get(name, []))
+
+class Adapter(requests.adapters.BaseAdapter):
+    """
+    Requests adapter answering with a function instead of the network
+
+    The function's given the request and returns status and a json body.
+    """
+
+    def __init__(self, answer, latency=0, timings=None):
+
+        super().__init__()
+
+        self.answer = answer
+        self.latency = latency
+        self.timings = timings if timings is not None else Timings()
+
+    def send(self, request, **kwargs): # pylint: disable=arguments-differ
+        """
+        Answers a request
+        """
+
+        start = time.time()
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        status, body = self.answer(request)
+
+        response = requests.Response()
+        response.status_code = status
+        response.url = request.url
+        response.request = request
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps(body).encode() # pylint: disable=protected-access
+
+        self.timings.record(time.time() - start)
+
+        return response
+
+    def close(self):
+        """
+        Nothing to close
+        """
+
+class Counted(requests.adapters.HTTPAdapter):
+    """
+    Requests adapter that times calls going over the network
+    """
+
+    def __init__(self, timings, **kwargs):
+
+        super().__init__(**kwargs)
+
+        self.timings = timings
+
+    def send(self, request, **kwargs): # pylint: disable=arguments-differ
+        """
+        Sends and times a request
+        """
+
+        start = time.time()
+
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            self.timings.record(time.time() - start)
+
+class Zoom:
+    """
+    Zoom's token and meeting summary APIs for a number of accounts' worth of meetings
+    """
+
+    def __init__(self, meetings, start=None):
+
+        self.meetings = meetings
+        self.start = start or time.time() - meetings * 60
+
+    def summary(self, index):
+        """
+        Summary for a meeting, a minute apart
+        """
+
+        return {
+            "meeting_uuid": f"meeting-{index}",
+            "summary_end_time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.start + index * 60))
+        }
+
+    def answer(self, request):
+        """
+        Answers a request to Zoom
+        """
+
+        url = urllib.parse.urlparse(request.url)
+        params = dict(urllib.parse.parse_qsl(url.query))
+
+        if url.path == "/oauth/token":
+            return 200, {"access_token": "token", "expires_in": 3600}
+
+        if url.path == "/v2/meetings/meeting_summaries":
+
+            summaries = [self.summary(index) for index in range(self.meetings)]
+
+            if "from" in params:
+                since = datetime.datetime.strptime(params["from"], "%Y-%m-%dT%H:%M:%SZ").replace(
+                    tzinfo=datetime.timezone.utc
+                ).timestamp()
+                summaries = [
+                    summary for index, summary in enumerate(summaries) if self.start + index * 60 >= since
+                ]
+
+            size = int(params.get("page_size", 30))
+            offset = int(params.get("next_page_token") or 0)
+
+            body = {"summaries": summaries[offset:offset + size]}
+
+            if offset + size < len(summaries):
+                body["next_page_token"] = str(offset + size)
+
+            return 200, body
+
+        if url.path.endswith("/meeting_summary"):
+            return 200, {
+                "meeting_uuid": url.path.split("/")[3],
+                "summary_overview": "Talked about things. " * 20,
+                "next_steps": ["Do things"] * 5
+            }
+
+        return 404, {"message": f"no {url.path}"}
+
+class Bsky:
+    """
+    Enough of atproto's Client for our posts and witnesses liking and replying to them
+    """
+
+    def __init__(self, posts, handles, latency=0, timings=None):
+
+        self.posts = posts
+        self.handles = handles
+        self.latency = latency
+        self.timings = timings if timings is not None else Timings()
+        self.start = time.time() - posts * 60
+
+        self.app = types.SimpleNamespace(bsky=types.SimpleNamespace(feed=types.SimpleNamespace(
+            get_author_feed=self.timed(self.get_author_feed)
+        )))
+        self.get_likes = self.timed(self.get_likes)
+        self.get_post_thread = self.timed(self.get_post_thread)
+
+    def __call__(self, url=None):
+
+        return self
+
+    def timed(self, call):
+        """
+        Wraps a call to add latency and time it
+        """
+
+        def wrapper(*args, **kwargs):
+
+            start = time.time()
+
+            if self.latency:
+                time.sleep(self.latency)
+
+            try:
+                return call(*args, **kwargs)
+            finally:
+                self.timings.record(time.time() - start)
+
+        return wrapper
+
+    def at(self, seconds):
+        """
+        Time like BlueSky formats it
+        """
+
+        return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.localtime(self.start + seconds))
+
+    def login(self, handle, password):
+        """
+        Logs in
+        """
+
+        return types.SimpleNamespace(handle=handle)
+
+    def post(self, index, author="me"):
+        """
+        One of our posts, a minute apart
+        """
+
+        return types.SimpleNamespace(
+            uri=f"at://{author}/post/{index}",
+            cid=f"cid-{index}",
+            author=types.SimpleNamespace(handle=author),
+            record=types.SimpleNamespace(created_at=self.at(index * 60), text=f"Post {index}")
+        )
+
+    @staticmethod
+    def page(items, cursor, limit):
+        """
+        Pages newest first
+        """
+
+        offset = int(cursor or 0)
+
+        return items[offset:offset + limit], (str(offset + limit) if offset + limit < len(items) else None)
+
+    def get_author_feed(self, params):
+        """
+        Our posts newest first
+        """
+
+        views = [types.SimpleNamespace(post=self.post(index)) for index in reversed(range(self.posts))]
+        feed, cursor = self.page(views, params.get("cursor"), params.get("limit", 50))
+
+        return types.SimpleNamespace(feed=feed, cursor=cursor)
+
+    def get_likes(self, uri, limit=50, cursor=None):
+        """
+        Every witness likes every post, a second apart after it
+        """
+
+        index = int(uri.rsplit("/", 1)[-1])
+
+        likes = [
+            types.SimpleNamespace(actor=types.SimpleNamespace(handle=handle), created_at=self.at(index * 60 + offset + 1))
+            for offset, handle in reversed(list(enumerate(self.handles)))
+        ]
+        page, cursor = self.page(likes, cursor, limit)
+
+        return types.SimpleNamespace(likes=page, cursor=cursor)
+
+    def get_post_thread(self, uri):
+        """
+        The first witness replies to every post
+        """
+
+        index = int(uri.rsplit("/", 1)[-1])
+        reply = self.post(index, self.handles[0]) if self.handles else None
+
+        return types.SimpleNamespace(thread=types.SimpleNamespace(
+            replies=[types.SimpleNamespace(post=reply)] if reply else []
+        ))
+
+def discord_message(index, user_id):
+    """
+    A guild message from a witness
+    """
+
+    author = types.SimpleNamespace(id=user_id, name=f"user-{user_id}", discriminator="0", bot=False, dm_channel=None)
+
+    return types.SimpleNamespace(
+        id=index,
+        content=f"Message {index}",
+        author=author,
+        channel=types.SimpleNamespace(id=1, name="general"),
+        guild=types.SimpleNamespace(id=1, name="guild"),
+        mentions=[],
+        attachments=[],
+        reference=None,
+        created_at=datetime.datetime.now()
+    )
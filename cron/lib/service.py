@@ -4,9 +4,14 @@ Module for the Subnet Queue
 
 # pylint: disable=no-self-use
 
+import os
+import time
+import random
+import urllib.parse
 import micro_logger
 import json
 import redis
+import requests
 
 import relations_rest
 
@@ -16,38 +21,189 @@ import prometheus_client
 
 REGISTRY = prometheus_client.CollectorRegistry()
 
-PROCESS = prometheus_client.Gauge("process_seconds", "Time to complete a processing task", registry=REGISTRY)
-ORIGINS = prometheus_client.Summary("origins_processed", "Origins processed", registry=REGISTRY)
+PROCESS = prometheus_client.Histogram("process_seconds", "Time to complete a processing task", ["task"], registry=REGISTRY)
+ORIGINS = prometheus_client.Counter("origins_processed", "Origins queued", ["origin"], registry=REGISTRY)
+SKIPPED = prometheus_client.Counter("origins_skipped", "Origins not queued", ["origin", "reason"], registry=REGISTRY)
+TRIMMED = prometheus_client.Counter("stream_trimmed", "Entries trimmed from streams", ["stream"], registry=REGISTRY)
+API = prometheus_client.Histogram("api_call_seconds", "Time calls to the ledger API take", ["method", "endpoint"], registry=REGISTRY)
 
-class Cron: # pylint: disable=too-few-public-methods
+class Cron: # pylint: disable=too-few-public-methods,too-many-instance-attributes
     """
     Cron class to run the processing
     """
 
+    SCHEDULE = "ledger/schedule/origin"    # Set until an origin's due again
+    INFLIGHT = "ledger/inflight/origin"    # Set until the daemon's fanned an origin out
+    FACT = "ledger/fact"                   # Stream of facts created, everything else being queues
+
     def __init__(self):
 
         self.logger = micro_logger.getLogger("ledger-cron")
 
-        self.source = relations_rest.Source("ledger", url="http://api.ledger")
+        self.ahead = int(os.environ.get("PARTITION_AHEAD", 3))   # Months of partitions to keep ready
+        self.retain = int(os.environ.get("PARTITION_RETAIN", 0)) # Months of facts to keep, 0 for forever
+
+        # Origins can override these in their meta
+
+        self.interval = int(os.environ.get("SCHEDULE_INTERVAL", 0))   # Seconds between syncs, 0 for every run
+        self.jitter = int(os.environ.get("SCHEDULE_JITTER", 0))       # Up to this many seconds more, to spread them out
+        self.inflight = int(os.environ.get("INFLIGHT_TTL", 60*60))    # Queue again after this even if never fanned out
+
+        # Streams are capped as they're written and trimmed by age, but never of what's still to be done
+
+        self.maxlen = int(os.environ.get("QUEUE_MAXLEN", 100000))        # Most origins to queue, about
+        self.keep = {
+            "fact": int(os.environ.get("FACT_RETAIN", 7*24*60*60)),     # Seconds to keep facts created
+            "queue": int(os.environ.get("QUEUE_RETAIN", 24*60*60))      # Seconds to keep work that's done
+        }
+
+        self.gateway = os.environ.get("PUSH_GATEWAY", "")   # Where to push metrics, blank to not
+
+        # Every call to the API is timed, whether through the models or directly
+
+        session = requests.Session()
+        session.hooks["response"].append(self.timed)
+
+        self.source = relations_rest.Source("ledger", url="http://api.ledger", session=session)
 
         self.redis = redis.Redis(host='redis.ledger', encoding="utf-8", decode_responses=True)
 
-    @PROCESS.time()
+    @staticmethod
+    def timed(response, *args, **kwargs): # pylint: disable=unused-argument
+        """
+        Records how long an API call took, by endpoint sans ids so there's only so many
+        """
+
+        path = urllib.parse.urlparse(response.request.url).path
+        endpoint = "/".join(part for part in path.strip("/").split("/") if not part.isdigit())
+
+        API.labels(response.request.method, endpoint).observe(response.elapsed.total_seconds())
+
+    def schedule(self, origin):
+        """
+        Marks an origin as not due until its interval, plus some jitter, has passed
+        """
+
+        meta = origin.meta or {}
+
+        delay = float(meta.get("interval", self.interval)) + random.uniform(0, float(meta.get("jitter", self.jitter)))
+
+        if delay > 0:
+            self.redis.set(f"{self.SCHEDULE}/{origin.id}", int(time.time()), px=int(delay*1000))
+
+    @PROCESS.labels("process").time()
     def process(self):
         """
-        Loads subnets and pushes onto the queue
+        Pushes origins that are due and not still being fanned out onto the queue
         """
 
         for origin in ledger.Origin.many():
+
+            if self.redis.exists(f"{self.SCHEDULE}/{origin.id}"):
+                SKIPPED.labels(origin.who, "scheduled").inc()
+                continue
+
+            if not self.redis.set(f"{self.INFLIGHT}/{origin.id}", int(time.time()), nx=True, ex=self.inflight):
+                self.logger.info("inflight", extra={"origin": origin.export()})
+                SKIPPED.labels(origin.who, "inflight").inc()
+                continue
+
             self.logger.info("origin", extra={"origin": origin.export()})
-            ORIGINS.observe(1)
-            self.redis.xadd("ledger/origin", fields={"origin": json.dumps(origin.export())})
+            ORIGINS.labels(origin.who).inc()
+            self.redis.xadd("ledger/origin", fields={"origin": json.dumps(origin.export())}, maxlen=self.maxlen, approximate=True)
 
-    def run(self):
+            self.schedule(origin)
+
+    @staticmethod
+    def parse(message_id):
         """
-        Runs through s process
+        Stream id as something comparable
         """
 
-        self.process()
+        milliseconds, _, sequence = message_id.partition("-")
+
+        return (int(milliseconds), int(sequence or 0))
+
+    def needed(self, stream):
+        """
+        Oldest id any consumer group still needs, pending or not yet read, None if none are reading
+        """
+
+        needed = None
+
+        for group in self.redis.xinfo_groups(stream):
+
+            # Without anything pending, the last read's done and everything after's still to come
+
+            oldest = group["last-delivered-id"]
+
+            if group["pending"]:
+                oldest = self.redis.xpending(stream, group["name"])["min"]
+
+            if needed is None or self.parse(oldest) < self.parse(needed):
+                needed = oldest
+
+        return needed
+
+    @PROCESS.labels("trim").time()
+    def trim(self):
+        """
+        Trims every stream of entries older than it keeps, but never any a consumer group still needs
+        """
+
+        now = time.time()
+
+        for stream in self.redis.scan_iter(match="ledger/*", _type="stream"):
+
+            keep = self.keep["fact" if stream == self.FACT else "queue"]
+            minid = f"{int((now - keep) * 1000)}-0"
+
+            needed = self.needed(stream)
+
+            if needed is not None and self.parse(needed) < self.parse(minid):
+                minid = needed
+
+            # Approximate trims whole nodes only so never goes past minid
+
+            trimmed = self.redis.execute_command("XTRIM", stream, "MINID", "~", minid)
+
+            self.logger.info("trim", extra={"stream": stream, "minid": minid, "trimmed": trimmed})
+            TRIMMED.labels(stream).inc(trimmed)
+
+    @PROCESS.labels("partition").time()
+    def partition(self):
+        """
+        Has the API add partitions ahead and drop those past retention
+        """
+
+        response = self.source.session.post(
+            f"{self.source.url}/partition", json={"ahead": self.ahead, "retain": self.retain}
+        )
+        response.raise_for_status()
+
+        self.logger.info("partition", extra={"partition": response.json()})
+
+    def push(self):
+        """
+        Pushes metrics to the gateway, if there is one, without failing the run if it's down
+        """
+
+        if not self.gateway:
+            return
+
+        try:
+            prometheus_client.push_to_gateway(self.gateway, "ledger/cron", registry=REGISTRY)
+        except Exception: # pylint: disable=broad-except
+            self.logger.warning("push", exc_info=True)
+
+    def run(self):
+        """
+        Runs through s process, pushing metrics even if something went wrong
+        """
 
-        #prometheus_client.push_to_gateway("push.prometheus:9091", "ledger/cron", registry=REGISTRY)
+        try:
+            self.process()
+            self.trim()
+            self.partition()
+        finally:
+            self.push()
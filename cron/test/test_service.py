@@ -4,10 +4,15 @@ import micro_logger_unittest
 import relations.unittest
 
 import json
+import datetime
 
 import service
 import ledger
 
+def sample(name, **labels):
+
+    return service.REGISTRY.get_sample_value(name, labels) or 0
+
 class MockRedis:
 
     host = None
@@ -17,11 +22,48 @@ class MockRedis:
 
         self.host = host
         self.queue = {}
+        self.values = {}
+        self.expires = {}
+        self.groups = {}
+        self.pending = {}
+        self.commands = []
+
+    def exists(self, key):
+
+        return int(key in self.values)
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+
+        if nx and key in self.values:
+            return None
 
-    def xadd(self, stream, fields):
+        self.values[key] = value
+        self.expires[key] = ex if ex is not None else px
+
+        return True
+
+    def xadd(self, stream, fields, maxlen=None, approximate=True):
 
         self.queue.setdefault(stream, [])
-        self.queue[stream].append({"fields": fields})
+        self.queue[stream].append({"fields": fields, "maxlen": maxlen, "approximate": approximate})
+
+    def scan_iter(self, match, _type=None):
+
+        return [stream for stream in self.queue if stream.startswith(match[:-1])]
+
+    def xinfo_groups(self, stream):
+
+        return self.groups.get(stream, [])
+
+    def xpending(self, stream, group):
+
+        return self.pending[(stream, group)]
+
+    def execute_command(self, *args):
+
+        self.commands.append(args)
+
+        return 0
 
 class TestCron(micro_logger_unittest.TestCase):
 
@@ -34,7 +76,18 @@ class TestCron(micro_logger_unittest.TestCase):
 
         self.cron = service.Cron()
 
-    @unittest.mock.patch.dict('os.environ', {"LOG_LEVEL": "INFO"})
+    @unittest.mock.patch.dict('os.environ', {
+        "LOG_LEVEL": "INFO",
+        "PARTITION_AHEAD": "2",
+        "PARTITION_RETAIN": "12",
+        "SCHEDULE_INTERVAL": "300",
+        "SCHEDULE_JITTER": "60",
+        "INFLIGHT_TTL": "600",
+        "QUEUE_MAXLEN": "1000",
+        "FACT_RETAIN": "3600",
+        "QUEUE_RETAIN": "60",
+        "PUSH_GATEWAY": "push.prometheus:9091"
+    })
     @unittest.mock.patch("micro_logger.getLogger", micro_logger_unittest.MockLogger)
     @unittest.mock.patch('relations_rest.Source', relations.unittest.MockSource)
     @unittest.mock.patch('redis.Redis', MockRedis)
@@ -44,24 +97,202 @@ class TestCron(micro_logger_unittest.TestCase):
 
         self.assertEqual(cron.logger.name, "ledger-cron")
 
+        self.assertEqual(cron.ahead, 2)
+        self.assertEqual(cron.retain, 12)
+
+        self.assertEqual(cron.interval, 300)
+        self.assertEqual(cron.jitter, 60)
+        self.assertEqual(cron.inflight, 600)
+
+        self.assertEqual(cron.maxlen, 1000)
+        self.assertEqual(cron.keep, {"fact": 3600, "queue": 60})
+
+        self.assertEqual(cron.gateway, "push.prometheus:9091")
+
         self.assertIsInstance(relations.source("ledger"), relations.unittest.MockSource)
 
         self.assertEqual(cron.redis.host, "redis.ledger")
 
+    def test_timed(self):
+
+        response = unittest.mock.MagicMock(elapsed=datetime.timedelta(seconds=0.5))
+        response.request.method = "POST"
+        response.request.url = "http://api.ledger/partition"
+
+        count = sample("api_call_seconds_count", method="POST", endpoint="partition")
+
+        service.Cron.timed(response)
+
+        self.assertEqual(sample("api_call_seconds_count", method="POST", endpoint="partition"), count + 1)
+
+    @unittest.mock.patch("random.uniform")
+    def test_schedule(self, mock_uniform):
+
+        mock_uniform.side_effect = lambda low, high: high / 2
+
+        origin = ledger.Origin("Tom").create()
+
+        self.cron.schedule(origin)
+        self.assertEqual(self.cron.redis.values, {})
+
+        self.cron.interval = 300
+        self.cron.jitter = 60
+
+        self.cron.schedule(origin)
+        self.assertEqual(self.cron.redis.expires, {f"ledger/schedule/origin/{origin.id}": 330000})
+
+        origin = ledger.Origin("Dick", meta={"interval": 3600, "jitter": 0}).create()
+
+        self.cron.schedule(origin)
+        self.assertEqual(self.cron.redis.expires[f"ledger/schedule/origin/{origin.id}"], 3600000)
+
     def test_process(self):
 
         origin = ledger.Origin("Tom").create()
 
+        queued = sample("origins_processed_total", origin="Tom")
+        inflight = sample("origins_skipped_total", origin="Tom", reason="inflight")
+        scheduled = sample("origins_skipped_total", origin="Tom", reason="scheduled")
+        processes = sample("process_seconds_count", task="process")
+
         self.cron.process()
 
         self.assertLogged(self.cron.logger, "info", "origin", extra={"origin": origin.export()})
 
         self.assertEqual(len(self.cron.redis.queue['ledger/origin']), 1)
         self.assertEqual(json.loads(self.cron.redis.queue['ledger/origin'][0]["fields"]["origin"]), origin.export())
+        self.assertEqual(self.cron.redis.queue['ledger/origin'][0]["maxlen"], 100000)
+        self.assertEqual(self.cron.redis.expires, {f"ledger/inflight/origin/{origin.id}": 3600})
+
+        # Still in flight
+
+        self.cron.process()
+
+        self.assertLogged(self.cron.logger, "info", "inflight", extra={"origin": origin.export()})
+        self.assertEqual(len(self.cron.redis.queue['ledger/origin']), 1)
+
+        # Fanned out but not due
+
+        self.cron.redis.values = {f"ledger/schedule/origin/{origin.id}": 1}
+
+        self.cron.process()
+        self.assertEqual(len(self.cron.redis.queue['ledger/origin']), 1)
+
+        # Due
+
+        self.cron.redis.values = {}
+
+        self.cron.process()
+        self.assertEqual(len(self.cron.redis.queue['ledger/origin']), 2)
+
+        self.assertEqual(sample("origins_processed_total", origin="Tom"), queued + 2)
+        self.assertEqual(sample("origins_skipped_total", origin="Tom", reason="inflight"), inflight + 1)
+        self.assertEqual(sample("origins_skipped_total", origin="Tom", reason="scheduled"), scheduled + 1)
+        self.assertEqual(sample("process_seconds_count", task="process"), processes + 4)
+
+    def test_parse(self):
+
+        self.assertEqual(self.cron.parse("5-1"), (5, 1))
+        self.assertEqual(self.cron.parse("5"), (5, 0))
+        self.assertLess(self.cron.parse("5-9"), self.cron.parse("10-0"))
+
+    def test_needed(self):
+
+        self.assertIsNone(self.cron.needed("ledger/fact"))
+
+        self.cron.redis.groups["ledger/origin"] = [
+            {"name": "daemon", "pending": 0, "last-delivered-id": "9000-0"},
+            {"name": "other", "pending": 2, "last-delivered-id": "9500-0"}
+        ]
+        self.cron.redis.pending[("ledger/origin", "other")] = {"pending": 2, "min": "8000-1", "max": "9500-0"}
+
+        self.assertEqual(self.cron.needed("ledger/origin"), "8000-1")
+
+        self.cron.redis.pending[("ledger/origin", "other")]["min"] = "10000-0"
+
+        self.assertEqual(self.cron.needed("ledger/origin"), "9000-0")
+
+    @unittest.mock.patch("time.time")
+    def test_trim(self, mock_time):
+
+        mock_time.return_value = 7*24*60*60 + 100
+
+        self.cron.redis.queue = {"ledger/fact": [], "ledger/origin": [], "ledger/origin/bsky": []}
+        self.cron.redis.groups = {
+            "ledger/origin": [{"name": "daemon", "pending": 0, "last-delivered-id": "5-0"}],
+            "ledger/origin/bsky": [{"name": "daemon", "pending": 0, "last-delivered-id": "604800000-3"}]
+        }
+
+        self.cron.trim()
+
+        self.assertEqual(self.cron.redis.commands, [
+            ("XTRIM", "ledger/fact", "MINID", "~", "100000-0"),
+            ("XTRIM", "ledger/origin", "MINID", "~", "5-0"),
+            ("XTRIM", "ledger/origin/bsky", "MINID", "~", "518500000-0")
+        ])
+        self.assertLogged(self.cron.logger, "info", "trim", extra={"stream": "ledger/fact", "minid": "100000-0", "trimmed": 0})
+
+    def test_partition(self):
+
+        self.cron.source.url = "http://api.ledger"
+        self.cron.source.session = unittest.mock.MagicMock()
+        self.cron.source.session.post.return_value.json.return_value = {"added": ["p202610"], "dropped": []}
+
+        self.cron.partition()
+
+        self.cron.source.session.post.assert_called_once_with(
+            "http://api.ledger/partition", json={"ahead": 3, "retain": 0}
+        )
+        self.cron.source.session.post.return_value.raise_for_status.assert_called_once_with()
+        self.assertLogged(self.cron.logger, "info", "partition", extra={"partition": {"added": ["p202610"], "dropped": []}})
 
     @unittest.mock.patch('prometheus_client.push_to_gateway')
-    def test_run(self, mock_push):
+    def test_push(self, mock_push):
+
+        self.cron.push()
+        mock_push.assert_not_called()
+
+        self.cron.gateway = "push.prometheus:9091"
+
+        self.cron.push()
+        mock_push.assert_called_once_with("push.prometheus:9091", "ledger/cron", registry=service.REGISTRY)
+
+        # Down doesn't fail the run
+
+        mock_push.side_effect = Exception("down")
+
+        self.cron.push()
+        self.assertLogged(self.cron.logger, "warning", "push")
+
+    def test_run(self):
+
+        self.cron.process = unittest.mock.MagicMock()
+        self.cron.trim = unittest.mock.MagicMock()
+        self.cron.partition = unittest.mock.MagicMock()
+        self.cron.push = unittest.mock.MagicMock()
 
         self.cron.run()
 
-        #mock_push.assert_called_once_with("push.prometheus:9091", "ledger/cron", registry=service.REGISTRY)
+        self.cron.process.assert_called_once_with()
+        self.cron.trim.assert_called_once_with()
+        self.cron.partition.assert_called_once_with()
+        self.cron.push.assert_called_once_with()
+
+        # Pushes whatever was measured even when something fails
+
+        self.cron.partition.side_effect = Exception("down")
+
+        self.assertRaisesRegex(Exception, "down", self.cron.run)
+        self.assertEqual(self.cron.push.call_count, 2)
+
+        # Even the first job, with nothing after it run
+
+        for job in [self.cron.process, self.cron.trim, self.cron.partition, self.cron.push]:
+            job.reset_mock()
+
+        self.cron.process.side_effect = Exception("broken")
+
+        self.assertRaisesRegex(Exception, "broken", self.cron.run)
+        self.cron.trim.assert_not_called()
+        self.cron.partition.assert_not_called()
+        self.cron.push.assert_called_once_with()
@@ -0,0 +1,97 @@
+"""
+Module for remembering how far we've synced
+"""
+
+import json
+
+class Checkpoints:
+    """
+    Keeps sync positions in Redis, per witness, post, or whatever an origin crawls
+    """
+
+    KEY = "ledger/checkpoint"
+
+    daemon = None
+    expire = None
+
+    def __init__(self, daemon, expire=30*24*60*60):
+
+        self.daemon = daemon
+        self.expire = expire
+
+    def key(self, scope):
+        """
+        Redis key for a scope
+        """
+
+        return f"{self.KEY}/{scope}"
+
+    def get(self, scope):
+        """
+        Gets a scope's checkpoint, empty if we've never synced it
+        """
+
+        value = self.daemon.redis.get(self.key(scope))
+
+        return json.loads(value) if value else {}
+
+    def set(self, scope, **checkpoint):
+        """
+        Sets a scope's checkpoint, letting it expire if we stop syncing it
+        """
+
+        self.daemon.redis.set(self.key(scope), json.dumps(checkpoint), ex=self.expire)
+
+    @staticmethod
+    def pages(page, when, cursor, stop):
+        """
+        Iterates through each page's items newer than stop, with the cursor for the next page, None once done
+        """
+
+        while True:
+
+            items, cursor = page(cursor)
+
+            fresh = [item for item in items if stop is None or when(item) >= stop]
+            done = not cursor or len(fresh) < len(items)
+
+            yield fresh, None if done else cursor
+
+            if done:
+                return
+
+    def crawl(self, scope, page, when, overlap=0):
+        """
+        Iterates through pages of items newer than a scope's checkpoint, checkpointing as we go
+
+        page(cursor) returns (items, cursor) newest first and when(item) an item's time. The
+        checkpoint only moves once the caller's asked for the next page, so whatever it does
+        with a page is done before we skip it. If a crawl's interrupted, the next catches up
+        to where that one started and then carries on from where it got to.
+        """
+
+        checkpoint = self.get(scope)
+
+        latest = checkpoint.get("when")
+        resume = checkpoint.get("cursor")
+        top = checkpoint.get("top") if resume else None
+
+        passes = [(None, top)] if resume else []
+        passes.append((resume, latest - overlap if latest is not None else None))
+
+        for index, (cursor, stop) in enumerate(passes):
+
+            for fresh, cursor in self.pages(page, when, cursor, stop):
+
+                if fresh:
+                    yield fresh
+                    top = max([when(item) for item in fresh] + ([top] if top is not None else []))
+
+                # Catching up doesn't get a cursor as resuming from one would skip where we were
+
+                if cursor and index == len(passes) - 1:
+                    self.set(scope, when=latest, top=top, cursor=cursor)
+
+        whens = [value for value in (top, latest) if value is not None]
+
+        self.set(scope, when=max(whens) if whens else None)
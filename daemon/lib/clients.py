@@ -0,0 +1,63 @@
+"""
+Module for keeping authenticated origin clients around
+"""
+
+import time
+
+import requests
+import requests.adapters
+
+class Clients:
+    """
+    Keeps authenticated clients until they expire, sharing a pool of HTTP connections
+    """
+
+    daemon = None
+    ttl = None
+    adapter = None
+    clients = None
+
+    def __init__(self, daemon, ttl=60*60, pool=10):
+
+        self.daemon = daemon
+        self.ttl = ttl
+        self.adapter = requests.adapters.HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+        self.clients = {}
+
+    def session(self):
+        """
+        New session that reuses the shared connection pool
+        """
+
+        session = requests.Session()
+        session.mount("http://", self.adapter)
+        session.mount("https://", self.adapter)
+
+        return session
+
+    def get(self, key, create):
+        """
+        Gets a client, creating it if we don't have one or it's expired
+
+        Clients can set their own expires, else they're kept for the ttl
+        """
+
+        if key in self.clients:
+
+            expires, client = self.clients[key]
+
+            if expires > time.time():
+                return client
+
+        client = create()
+
+        self.clients[key] = (getattr(client, "expires", None) or time.time() + self.ttl, client)
+
+        return client
+
+    def drop(self, key):
+        """
+        Forgets a client so the next get creates it anew
+        """
+
+        self.clients.pop(key, None)
@@ -0,0 +1,42 @@
+"""
+Module for keeping track of work already queued
+"""
+
+class InFlight:
+    """
+    Marks work as queued in Redis until whoever handles it says it's done
+
+    Marks expire in case the work's lost, like a daemon dying mid-crawl, so it's queued again eventually.
+    Cron marks origins the same way, with the same keys.
+    """
+
+    KEY = "ledger/inflight"
+
+    daemon = None
+    ttl = None
+
+    def __init__(self, daemon, ttl=60*60):
+
+        self.daemon = daemon
+        self.ttl = ttl
+
+    def key(self, name):
+        """
+        Redis key for a piece of work
+        """
+
+        return f"{self.KEY}/{name}"
+
+    def claim(self, name):
+        """
+        Marks work as queued, False if it already was
+        """
+
+        return bool(self.daemon.redis.set(self.key(name), 1, nx=True, ex=self.ttl))
+
+    def release(self, name):
+        """
+        Marks work as done so it can be queued again
+        """
+
+        self.daemon.redis.delete(self.key(name))
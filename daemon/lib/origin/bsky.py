@@ -2,8 +2,9 @@
 Handles everything for the BlueSky Origin
 """
 
-import time
+import calendar
 import datetime
+import functools
 
 import json
 import atproto
@@ -13,64 +14,73 @@ import ledger
 
 WHO = "bsky"
 
-def init(daemon):
-    """
-    Intialize the daemon for this Origin
-    """
-
-    if (
-        not daemon.redis.exists("ledger/origin/bsky") or
-        "daemon" not in [group["name"] for group in daemon.redis.xinfo_groups("ledger/origin/bsky")]
-    ):
-        daemon.redis.xgroup_create("ledger/origin/bsky", "daemon", mkstream=True)
-
-
 def origin(daemon, instance):
     """
     Handles this Origin
     """
 
-    daemon.redis.xadd("ledger/origin/bsky", fields={"posts": "posts"})
-    daemon.logger.info("likes", extra={"posts": "posts"})
+    # Whatever's still being synced from last time is skipped
+
+    if daemon.inflight.claim(f"{WHO}/posts"):
+        daemon.work.add("ledger/origin/bsky", "posts", posts="posts")
+        daemon.logger.info("likes", extra={"posts": "posts"})
 
     for witness in ledger.Witness.many(origin_id=instance["id"]):
 
+        if not daemon.inflight.claim(f"witness/{witness.id}"):
+            daemon.logger.info("inflight", extra={"witness": witness.export()})
+            continue
+
         daemon.logger.info("witness", extra={"witness": witness.export()})
-        service.WITNESSES.observe(1)
 
-        daemon.redis.xadd("ledger/origin/bsky", fields={"witness": json.dumps(witness.export())})
+        daemon.work.add("ledger/origin/bsky", witness.id, witness=json.dumps(witness.export()))
 
-def process(daemon):
+def handle(daemon, messages):
     """
-    Reads witnesses off the list, for posts and likes
+    Handles a batch of posts and witness messages
     """
 
-    client = Client(daemon)
+    client = daemon.clients.get(WHO, lambda: Client(daemon))
 
-    message = daemon.redis.xreadgroup("daemon", daemon.name, {
-        "ledger/origin/bsky": ">",
-    }, count=1, block=100*daemon.sleep)
+    # Witnesses may have been added since we last loaded
 
-    if not message:
-        return
+    if any(
+        "witness" in message and json.loads(message["witness"])["who"] not in client.witness_ids
+        for message in messages
+    ):
+        client.load()
 
-    print(message)
+    # Posts are the same sync no matter how many times it was asked for
+    # and whatever went wrong, start over with a fresh login next time
 
-    if "posts" in message[0][1][0][1]:
-        client.posts()
+    try:
 
-    if "witness" in message[0][1][0][1]:
-        client.witness(json.loads(message[0][1][0][1]["witness"]))
+        if any("posts" in message for message in messages):
+            client.posts()
+            daemon.inflight.release(f"{WHO}/posts")
 
-    daemon.redis.xack("ledger/origin/bsky", "daemon", message[0][1][0][0])
+        for message in messages:
+            if "witness" in message:
+                witness = json.loads(message["witness"])
+                service.WITNESSES.labels(WHO, witness["id"]).inc()
+                client.witness(witness)
+                daemon.inflight.release(f"witness/{witness['id']}")
+
+    except Exception:
+        daemon.clients.drop(WHO)
+        raise
+
+STREAMS = {
+    "ledger/origin/bsky": handle
+}
 
 class Client:
     """
     Class for interacting with BlueSky's API
     """
 
-    BACK = 10  # Cache DB back 100 facts
-    FINDS = 3   # Crawl back through history until you find 3 already existing
+    BACK = 10               # Page size when crawling back through history
+    ACTIVE = 7*24*60*60     # Keep checking our posts this recent for likes and replies
 
     daemon = None
     client = None
@@ -85,23 +95,34 @@ class Client:
         with open("/opt/service/secret/bsky.json", "r") as creds_file:
             creds = json.load(creds_file)
 
+        # The client refreshes its own session so we can keep it as long as we like
+
         self.client = atproto.Client(creds["url"])
-        self.profile = self.client.login(creds["handle"], creds["password"])
+
+        with service.CALLS.labels(WHO, "login").time():
+            self.profile = self.client.login(creds["handle"], creds["password"])
+
+        self.load()
+
+    def load(self):
+        """
+        Loads all our witnesses
+        """
+
         self.handles = []
         self.witness_ids = {}
 
         for witness in ledger.Witness.many(origin__who=WHO):
-            handle = witness.who
-            self.handles.append(handle)
-            self.witness_ids[handle] = witness.id
+            self.handles.append(witness.who)
+            self.witness_ids[witness.who] = witness.id
 
     @staticmethod
     def make_time(at):
         """
-        Makes a timestamp from a string
+        Makes a timestamp from a UTC string
         """
 
-        return time.mktime(
+        return calendar.timegm(
             datetime.datetime.strptime(
                 at.rsplit(".", 1)[0], "%Y-%m-%dT%H:%M:%S"
             ).timetuple()
@@ -142,13 +163,13 @@ class Client:
 
         return value
 
-    def like_to_dict(self, handle, post):
+    def like_to_dict(self, actor, post):
         """
         Converts a like to dict
         """
 
         value = {
-            "actor": handle,
+            "actor": actor,
             "post": self.post_to_dict(post)
         }
 
@@ -166,160 +187,132 @@ class Client:
 
         return value
 
-    def witness_posts(self, witness):
+    def author_feed(self, actor, cursor):
         """
-        Synchronizes posts
+        Gets a page of an author's feed
         """
 
-        facts = ledger.Fact.many(witness_id=witness["id"], who__start="post:").limit(self.BACK).who
-        finds = 0
-
-        cursor = None
-
-        while True:
-
+        with service.CALLS.labels(WHO, "get_author_feed").time():
             response = self.client.app.bsky.feed.get_author_feed(params={
-                "actor": witness["who"],
+                "actor": actor,
                 "limit": self.BACK,
                 "cursor": cursor,
                 "filter": "posts_with_replies"
             })
 
-            for view in response.feed:
+        return response.feed, response.cursor
 
-                if witness["who"] in self.post_handles(view.post):
+    def likes(self, uri, cursor):
+        """
+        Gets a page of likes on a post
+        """
 
-                    who = f"post:{view.post.uri}"
+        with service.CALLS.labels(WHO, "get_likes").time():
+            response = self.client.get_likes(
+                uri=uri,
+                limit=self.BACK,
+                cursor=cursor
+            )
 
-                    self.post_likes(view.post)
+        return response.likes, response.cursor
+
+    def witness_posts(self, witness):
+        """
+        Synchronizes posts since we last did
+        """
 
-                    if who in facts or ledger.Fact.many(witness_id=witness["id"], who=who).count():
+        for feed in self.daemon.checkpoints.crawl(
+            f"{WHO}/witness/{witness['id']}",
+            functools.partial(self.author_feed, witness["who"]),
+            lambda view: self.make_time(view.post.record.created_at)
+        ):
 
-                        finds += 1
+            facts = []
 
-                        if finds == self.FINDS:
-                            return
+            for view in feed:
 
-                        continue
+                if witness["who"] in self.post_handles(view.post):
 
-                    self.daemon.fact(
-                        witness_id=witness["id"],
-                        who=who,
-                        when=self.make_time(view.post.record.created_at),
-                        what=self.post_to_dict(view.post)
-                    )
+                    self.post_likes(view.post)
 
-            cursor = response.cursor
+                    facts.append({
+                        "witness_id": witness["id"],
+                        "who": f"post:{view.post.uri}",
+                        "when": self.make_time(view.post.record.created_at),
+                        "what": self.post_to_dict(view.post)
+                    })
 
-            if not cursor:
-                break
+            self.daemon.facts(facts)
 
     def post_likes(self, post):
         """
-        Synchronizes likes on followers posts
+        Synchronizes likes on followers posts since we last did
         """
 
-        facts = ledger.Fact.many(witness__origin__who=WHO, who__start="like:").limit(self.BACK).who
-        finds = 0
-
-        cursor = None
-
-        while True:
+        for likes in self.daemon.checkpoints.crawl(
+            f"{WHO}/likes/{post.uri}",
+            functools.partial(self.likes, post.uri),
+            lambda like: self.make_time(like.created_at)
+        ):
 
-            response = self.client.get_likes(
-                uri=post.uri,
-                limit=self.BACK,
-                cursor=cursor
-            )
+            facts = []
 
-            for like in response.likes:
+            for like in likes:
 
                 if like.actor.handle not in self.handles:
                     continue
 
-                who = f"like:{post.uri}:{like.actor.handle}"
+                facts.append({
+                    "witness_id": self.witness_ids[like.actor.handle],
+                    "who": f"like:{post.uri}:{like.actor.handle}",
+                    "when": self.make_time(like.created_at),
+                    "what": self.like_to_dict(like.actor.handle, post)
+                })
 
-                if who in facts or ledger.Fact.many(witness_id=self.witness_ids[like.actor.handle], who=who).count():
-
-                    finds += 1
-
-                    if finds == self.FINDS:
-                        return
-
-                    continue
-
-                self.daemon.fact(
-                    witness_id=self.witness_ids[like.actor.handle],
-                    who=who,
-                    when=self.make_time(like.created_at),
-                    what=self.like_to_dict(like.actor.handle, post)
-                )
-
-            cursor = response.cursor
-
-            if not cursor:
-                break
+            self.daemon.facts(facts)
 
     def post_replies(self, post):
         """
         Synchronizes likes on followers posts
         """
 
-        facts = ledger.Fact.many(witness__origin__who=WHO, who__start="reply:").limit(self.BACK).who
-        finds = 0
+        with service.CALLS.labels(WHO, "get_post_thread").time():
+            response = self.client.get_post_thread(
+                uri=post.uri
+            )
 
-        response = self.client.get_post_thread(
-            uri=post.uri
-        )
+        facts = []
 
         for reply in response.thread.replies:
 
             if reply.post.author.handle not in self.handles:
                 continue
 
-            who = f"reply:{post.uri}:{reply.post.uri}"
-
-            if who in facts or ledger.Fact.many(witness_id=self.witness_ids[reply.post.author.handle], who=who).count():
-
-                finds += 1
-
-                if finds == self.FINDS:
-                    return
-
-                continue
+            facts.append({
+                "witness_id": self.witness_ids[reply.post.author.handle],
+                "who": f"reply:{post.uri}:{reply.post.uri}",
+                "when": self.make_time(reply.post.record.created_at),
+                "what": self.reply_to_dict(reply, post)
+            })
 
-            self.daemon.fact(
-                witness_id=self.witness_ids[reply.post.author.handle],
-                who=who,
-                when=self.make_time(reply.post.record.created_at),
-                what=self.reply_to_dict(reply, post)
-            )
+        self.daemon.facts(facts)
 
     def posts(self):
         """
-        Synchronizes likes on our post
+        Synchronizes likes and replies on our recent posts
         """
 
-        cursor = None
-
-        while True:
+        for feed in self.daemon.checkpoints.crawl(
+            f"{WHO}/posts",
+            functools.partial(self.author_feed, self.profile.handle),
+            lambda view: self.make_time(view.post.record.created_at),
+            overlap=self.ACTIVE
+        ):
 
-            response = self.client.app.bsky.feed.get_author_feed(params={
-                "actor": self.profile.handle,
-                "limit": self.BACK,
-                "cursor": cursor,
-                "filter": "posts_with_replies"
-            })
-
-            for view in response.feed:
+            for view in feed:
                 self.post_likes(view.post)
                 self.post_replies(view.post)
 
-            cursor = response.cursor
-
-            if not cursor:
-                break
-
     def witness(self, witness):
         """
         Processes a witness, syncing all the feeds
@@ -4,12 +4,14 @@ Handles everything for the Discord Origin
 
 # pylint: disable=unsupported-membership-test
 
-import time
+import os
+import calendar
 import json
 
 import discord
 
 import ledger
+import pipeline
 
 WHO = "discord"
 
@@ -19,14 +21,19 @@ class OriginClient(discord.Client):
     """
 
     daemon = None
+    pipeline = None
     user_ids = []
     witness_ids = {}
 
-    def __init__(self, *args, daemon=daemon, **kwargs):
+    def __init__(self, *args, daemon=daemon, writes=pipeline, **kwargs):
 
         super(OriginClient, self).__init__(*args, **kwargs)
 
         self.daemon = daemon
+        self.pipeline = writes
+
+        self.user_ids = []
+        self.witness_ids = {}
 
         for witness in ledger.Witness.many(origin__who=WHO):
 
@@ -111,7 +118,7 @@ class OriginClient(discord.Client):
 
         if message.author.id in self.user_ids:
             yield message.author.id
-        elif message.channel.id == message.author.dm_channel.id:
+        elif message.author.dm_channel and message.channel.id == message.author.dm_channel.id:
             yield message.channel.recipient.id
         else:
             for user in message.mentions:
@@ -130,6 +137,23 @@ class OriginClient(discord.Client):
             if user_id != user.id:
                 yield user_id
 
+    async def setup_hook(self):
+        """
+        Called within the loop before connecting
+        """
+
+        self.pipeline.start()
+
+    async def close(self):
+        """
+        Writes whatever's queued before shutting down
+        """
+
+        if self.pipeline.task:
+            await self.pipeline.stop()
+
+        await super(OriginClient, self).close()
+
     async def on_ready(self):
         """
         Called when starting up
@@ -143,10 +167,10 @@ class OriginClient(discord.Client):
         """
 
         for user_id in self.message_user_ids(message):
-            self.daemon.fact(
+            await self.pipeline.add(
                 witness_id=self.witness_ids[user_id],
                 who=f"message:{message.id}",
-                when=time.mktime(message.created_at.timetuple()),
+                when=calendar.timegm(message.created_at.utctimetuple()),
                 what=self.message_to_dict(message, reference=True)
             )
 
@@ -156,10 +180,10 @@ class OriginClient(discord.Client):
         """
 
         for user_id in self.reaction_user_ids(reaction, user):
-            self.daemon.fact(
+            await self.pipeline.add(
                 witness_id=self.witness_ids[user_id],
                 who=f"reaction:{reaction.message.id}:{reaction.emoji}",
-                when=time.mktime(reaction.message.created_at.timetuple()),
+                when=calendar.timegm(reaction.message.created_at.utctimetuple()),
                 what=self.reaction_to_dict(reaction, user)
             )
 
@@ -174,5 +198,15 @@ def run(daemon):
     intents = discord.Intents.default()
     intents.message_content = True # pylint: disable=assigning-non-slot
 
-    client = OriginClient(daemon=daemon, intents=intents)
+    # Batch like the writer would, but queue up to DISCORD_QUEUE facts while a batch is being written
+
+    writes = pipeline.Pipeline(
+        daemon,
+        size=int(os.environ.get("DISCORD_QUEUE", 1000)),
+        batch=daemon.writer.size,
+        latency=daemon.writer.latency,
+        retry=daemon.sleep
+    )
+
+    client = OriginClient(daemon=daemon, writes=writes, intents=intents)
     client.run(token)
@@ -5,74 +5,131 @@ Handles everything for the Zoom Origin
 # pylint: disable=unsupported-membership-test
 
 import time
+import calendar
+import functools
 import datetime
+import threading
+import concurrent.futures
 
 import json
 import base64
-import requests
 
 import service
 import ledger
 
 WHO = "zoom"
 
-def init(daemon):
+def origin(daemon, instance):
     """
-    Intialize the daemon for this Origin
+    Handles this Origin
     """
 
-    if (
-        not daemon.redis.exists("ledger/origin/zoom/witness") or
-        "daemon" not in [group["name"] for group in daemon.redis.xinfo_groups("ledger/origin/zoom/witness")]
-    ):
-        daemon.redis.xgroup_create("ledger/origin/zoom/witness", "daemon", mkstream=True)
+    for witness in ledger.Witness.many(origin_id=instance["id"]):
 
+        # Still being synced from last time
 
-def origin(daemon, instance):
+        if not daemon.inflight.claim(f"witness/{witness.id}"):
+            daemon.logger.info("inflight", extra={"witness": witness.export()})
+            continue
+
+        daemon.logger.info("witness", extra={"witness": witness.export()})
+
+        daemon.work.add("ledger/origin/zoom/witness", witness.id, witness=json.dumps(witness.export()))
+
+
+def handle(daemon, messages):
     """
-    Handles this Origin
+    Handles a batch of witness messages
     """
 
-    for witness in ledger.Witness.many(origin_id=instance["id"]):
+    for message in messages:
 
-        daemon.logger.info("witness", extra={"witness": witness.export()})
-        service.WITNESSES.observe(1)
+        if "witness" not in message:
+            continue
+
+        witness = json.loads(message["witness"])
+        daemon.logger.info("witness", extra={"witness": witness})
+        service.WITNESSES.labels(WHO, witness["id"]).inc()
 
-        daemon.redis.xadd("ledger/origin/zoom/witness", fields={"witness": json.dumps(witness.export())})
+        key = f"{WHO}/{witness['entity_id']}"
+        client = daemon.clients.get(key, functools.partial(Client, daemon, witness["entity_id"]))
 
+        # Whatever went wrong, start over with a fresh token next time
 
-def process(daemon):
+        try:
+            client.witness(witness)
+        except Exception:
+            daemon.clients.drop(key)
+            raise
+
+        daemon.inflight.release(f"witness/{witness['id']}")
+
+STREAMS = {
+    "ledger/origin/zoom/witness": handle
+}
+
+class Limiter: # pylint: disable=too-few-public-methods
     """
-    Processes this Origin
+    Token bucket limiting calls a second across threads
     """
 
-    message = daemon.redis.xreadgroup("daemon", daemon.name, {"ledger/origin/zoom/witness": ">"}, count=1, block=1000*daemon.sleep)
+    rate = None
+    burst = None
+    tokens = None
+    updated = None
+    lock = None
+
+    def __init__(self, rate, burst=None):
 
-    if not message or "witness" not in message[0][1][0][1]:
-        return
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Waits until we can make a call
+        """
 
-    witness = json.loads(message[0][1][0][1]["witness"])
-    daemon.logger.info("witness", extra={"witness": witness})
-    service.WITNESSES.observe(1)
+        while True:
 
-    Client(daemon, witness["entity_id"]).witness(witness)
+            with self.lock:
 
-    daemon.redis.xack("ledger/origin/zoom/witness", "daemon", message[0][1][0][0])
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
 
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                delay = (1 - self.tokens) / self.rate
+
+            time.sleep(delay)
 
 class Client:
     """
     Class for interacting with Zoom's API
     """
 
-    WITNESS_BACK = 15*24*60*60 # 15 days back
+    EARLY = 60              # Refresh tokens this many seconds before they expire
+    OVERLAP = 24*60*60      # Look back this far before the mark for summaries created late
+    PAGE = 300              # Summaries to ask for at a time, Zoom's max
+    WORKERS = 8             # Details to fetch at once
+    RATE = 10               # Calls a second to Zoom, per account
+    RETRIES = 3             # Times to retry when Zoom says slow down
 
     daemon = None
     session = None
+    expires = None
+    limiter = None
 
     def __init__(self, daemon, entity_id):
 
         self.daemon = daemon
+        self.session = daemon.clients.session()
+        self.limiter = Limiter(self.RATE)
 
         with open(f"/opt/service/secret/zoom-{entity_id}.json", "r") as creds_file:
             creds = json.load(creds_file)
@@ -84,33 +141,69 @@ class Client:
         }
         data = {"grant_type": "account_credentials", "account_id": creds["account_id"]}
 
-        response = requests.post("https://zoom.us/oauth/token", headers=headers, data=data)
+        with service.CALLS.labels(WHO, "token").time():
+            response = self.session.post("https://zoom.us/oauth/token", headers=headers, data=data)
         response.raise_for_status()
-        access_token = response.json()["access_token"]
+        token = response.json()
+
+        self.expires = time.time() + token.get("expires_in", 60*60) - self.EARLY
 
-        self.session = requests.Session()
         self.session.headers.update({
-            "Authorization": f"Bearer {access_token}",
+            "Authorization": f"Bearer {token['access_token']}",
             "Content-Type": "application/json"
         })
 
-    def meeting_summaries(self):
+    @staticmethod
+    def timestamp(at):
         """
-        Iterates through all the summaries for this account (sans details)
+        Epoch time from a Zoom UTC time
         """
 
-        response = self.session.get("https://api.zoom.us/v2/meetings/meeting_summaries").json()
+        return calendar.timegm(datetime.datetime.strptime(at, "%Y-%m-%dT%H:%M:%SZ").timetuple())
+
+    def get(self, url, params=None):
+        """
+        Gets from Zoom within our rate, retrying if Zoom still says slow down
+        """
+
+        for attempt in range(self.RETRIES + 1):
+
+            self.limiter.wait()
+
+            with service.CALLS.labels(WHO, url.rsplit("/", 1)[-1]).time():
+                response = self.session.get(url, params=params)
+
+            if response.status_code != 429 or attempt == self.RETRIES:
+                break
+
+            time.sleep(float(response.headers.get("Retry-After", 1)))
+
+        response.raise_for_status()
+
+        return response.json()
+
+    def meeting_summaries(self, since=None):
+        """
+        Iterates through the pages of summaries for this account (sans details), optionally only since a time
+        """
+
+        params = {"page_size": self.PAGE}
+
+        if since is not None:
+            params["from"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(since))
+            params["to"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time()))
+
+        response = self.get("https://api.zoom.us/v2/meetings/meeting_summaries", params)
 
         while response:
 
-            for summary in response["summaries"]:
-                yield summary
+            yield response["summaries"]
 
             if response.get("next_page_token"):
-                response = self.session.get(
+                response = self.get(
                     "https://api.zoom.us/v2/meetings/meeting_summaries",
-                    json={"next_page_token": response["next_page_token"]}
-                ).json()
+                    {**params, "next_page_token": response["next_page_token"]}
+                )
             else:
                 response = None
 
@@ -119,25 +212,57 @@ class Client:
         Gets all the details for a summary
         """
 
-        return self.session.get(f"https://api.zoom.us/v2/meetings/{summary['meeting_uuid']}/meeting_summary").json()
+        return self.get(f"https://api.zoom.us/v2/meetings/{summary['meeting_uuid']}/meeting_summary")
 
     def witness(self, witness):
         """
-        Processes a witness, syncing all the meetings
+        Processes a witness, syncing the meetings since we last did
         """
 
-        facts = ledger.Fact.many(witness_id=witness["id"], when__gt=time.time()-self.WITNESS_BACK)["who"]
+        scope = f"{WHO}/witness/{witness['id']}"
+        latest = self.daemon.checkpoints.get(scope).get("when")
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+
+            for summaries in self.meeting_summaries(latest - self.OVERLAP if latest else None):
+
+                whos = {f"meeting_summary:{summary['meeting_uuid']}": summary for summary in summaries}
+                facts = [{"witness_id": witness["id"], "who": who} for who in whos]
+
+                missing = {
+                    fact["who"]: whos[fact["who"]]
+                    for fact, seen in zip(facts, self.daemon.seen.check(facts))
+                    if not seen
+                }
+
+                # Details cost a call to Zoom so check what we haven't seen a page at a time
+
+                if missing:
+
+                    absent = set(self.daemon.missing(witness["id"], sorted(missing)))
+                    found = [who for who in missing if who not in absent]
+                    self.daemon.seen.add([{"witness_id": witness["id"], "who": who} for who in found])
+
+                    for who in found:
+                        del missing[who]
+
+                # Fetch in the pool but create here as the writer isn't thread safe
+
+                for (who, summary), what in zip(missing.items(), pool.map(self.meeting_summary, missing.values())):
+
+                    self.daemon.fact(
+                        witness_id=witness["id"],
+                        who=who,
+                        when=self.timestamp(summary["summary_end_time"]),
+                        what=what
+                    )
 
-        for summary in self.meeting_summaries():
+                for summary in summaries:
+                    latest = max(latest or 0, self.timestamp(summary["summary_end_time"]))
 
-            who = f"meeting_summary:{summary['meeting_uuid']}"
+        # Only move the mark once everything before it is stored
 
-            if who in facts or ledger.Fact.many(witness_id=witness["id"], who=who).count():
-                continue
+        self.daemon.writer.flush()
 
-            self.daemon.fact(
-                witness_id=witness["id"],
-                who=who,
-                when=time.mktime(datetime.datetime.strptime(summary["summary_end_time"], "%Y-%m-%dT%H:%M:%SZ").timetuple()),
-                what=self.meeting_summary(summary)
-            )
+        if latest:
+            self.daemon.checkpoints.set(scope, when=latest)
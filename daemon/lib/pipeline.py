@@ -0,0 +1,123 @@
+"""
+Module for writing Facts from an event loop
+"""
+
+import asyncio
+
+import redis
+import requests
+
+class Pipeline:
+    """
+    Queues facts without blocking the event loop and writes them in batches in the background
+
+    The queue's bounded so if writing falls behind, whoever's adding waits rather than
+    us running out of memory. Writes go through the daemon's writer in a thread, one
+    batch at a time, so the loop's free for everything else while they're in flight.
+    """
+
+    daemon = None
+    size = None
+    batch = None
+    latency = None
+    retry = None
+    queue = None
+    task = None
+
+    def __init__(self, daemon, size=1000, batch=100, latency=1.0, retry=5):
+
+        self.daemon = daemon
+        self.size = size
+        self.batch = batch
+        self.latency = latency
+        self.retry = retry
+
+    def start(self):
+        """
+        Starts writing in the background, must be called from within the loop
+        """
+
+        self.queue = asyncio.Queue(maxsize=self.size)
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def add(self, **fact):
+        """
+        Queues a fact, waiting if the queue's full
+        """
+
+        await self.queue.put(fact)
+
+    async def collect(self):
+        """
+        Waits for a fact then collects more until we have a batch or it's been long enough
+        """
+
+        facts = [await self.queue.get()]
+
+        deadline = asyncio.get_running_loop().time() + self.latency
+
+        while len(facts) < self.batch:
+
+            remaining = deadline - asyncio.get_running_loop().time()
+
+            if remaining <= 0:
+                break
+
+            try:
+                facts.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return facts
+
+    @staticmethod
+    def transient(exception):
+        """
+        Whether a write might go through if tried again, so not something the API rejected
+        """
+
+        if isinstance(exception, requests.HTTPError):
+            return exception.response is None or exception.response.status_code >= 500 or exception.response.status_code == 429
+
+        return isinstance(exception, (requests.ConnectionError, requests.Timeout, redis.ConnectionError, redis.TimeoutError))
+
+    async def write(self, facts):
+        """
+        Writes a batch, retrying while the API's down so nothing's lost, but dropping what it rejects
+
+        Retrying a batch that'll never go through would back everything up behind it.
+        """
+
+        while True:
+
+            try:
+                await asyncio.to_thread(self.daemon.facts, facts)
+                break
+            except Exception as exception: # pylint: disable=broad-except
+
+                if not self.transient(exception):
+                    self.daemon.logger.error("write dropped", extra={"error": str(exception), "facts": len(facts)})
+                    break
+
+                self.daemon.logger.error("write failed", extra={"error": str(exception), "facts": len(facts)})
+                await asyncio.sleep(self.retry)
+
+        for _ in facts:
+            self.queue.task_done()
+
+    async def run(self):
+        """
+        Writes batches forever
+        """
+
+        while True:
+            await self.write(await self.collect())
+
+    async def stop(self):
+        """
+        Writes whatever's queued and stops
+        """
+
+        await self.queue.join()
+
+        self.task.cancel()
@@ -0,0 +1,260 @@
+"""
+Module for remembering which Facts we've already seen
+"""
+
+import time
+import json
+import hashlib
+import collections
+
+import service
+
+class Bloom:
+    """
+    Bloom filter, for knowing quickly what we've definitely never seen
+    """
+
+    bits = None
+    hashes = None
+    array = None
+
+    def __init__(self, bits, hashes=4):
+
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+
+    def positions(self, key):
+        """
+        Bit positions for a key
+        """
+
+        digest = hashlib.blake2b(key.encode(), digest_size=8*self.hashes).digest()
+
+        return [int.from_bytes(digest[index*8:(index+1)*8], "big") % self.bits for index in range(self.hashes)]
+
+    def add(self, key):
+        """
+        Adds a key
+        """
+
+        for position in self.positions(key):
+            self.array[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key):
+
+        return all(self.array[position // 8] & (1 << (position % 8)) for position in self.positions(key))
+
+class Seen:
+    """
+    Remembers (witness_id, who) keys already stored, locally with LRU/TTL eviction and shared through Redis
+    """
+
+    STREAM = "ledger/fact"
+    KEY = "ledger/seen"
+    WARM = 1000 # How many facts to read off the stream at a time
+
+    daemon = None
+    size = None
+    ttl = None
+    expire = None
+    keys = None
+    bloom = None
+    last = None
+
+    def __init__(self, daemon, size=100000, ttl=24*60*60, expire=30*24*60*60, bloom=0):
+
+        self.daemon = daemon
+        self.size = size
+        self.ttl = ttl
+        self.expire = expire
+        self.keys = collections.OrderedDict()
+        self.bloom = Bloom(bloom) if bloom else None
+        self.last = "0"
+
+    @staticmethod
+    def key(fact):
+        """
+        Local key for a fact
+        """
+
+        return f"{fact['witness_id']}:{fact['who']}"
+
+    def remember(self, fact):
+        """
+        Remembers a fact locally, evicting the oldest if we're full
+        """
+
+        key = self.key(fact)
+
+        self.keys[key] = time.time() + self.ttl
+        self.keys.move_to_end(key)
+
+        while len(self.keys) > self.size:
+            self.keys.popitem(last=False)
+
+        if self.bloom is not None:
+            self.bloom.add(key)
+
+    def cached(self, fact):
+        """
+        Whether a fact's remembered locally and not expired
+        """
+
+        key = self.key(fact)
+
+        if key not in self.keys:
+            return False
+
+        if self.keys[key] < time.time():
+            del self.keys[key]
+            return False
+
+        self.keys.move_to_end(key)
+
+        return True
+
+    def check(self, facts):
+        """
+        Which facts have been seen, checking locally and then Redis in one go
+        """
+
+        seen = [self.cached(fact) for fact in facts]
+
+        # The bloom filter can only say what's definitely not been seen, so skip Redis for those
+
+        lookups = [
+            index for index, fact in enumerate(facts)
+            if not seen[index] and (self.bloom is None or self.key(fact) in self.bloom)
+        ]
+
+        if lookups:
+
+            pipeline = self.daemon.redis.pipeline(transaction=False)
+
+            for index in lookups:
+                pipeline.zscore(f"{self.KEY}/{facts[index]['witness_id']}", facts[index]["who"])
+
+            for index, score in zip(lookups, pipeline.execute()):
+                if score is not None:
+                    seen[index] = True
+                    self.remember(facts[index])
+
+        hits = sum(seen)
+
+        service.DEDUP.labels("seen", "hit").inc(hits)
+        service.DEDUP.labels("seen", "miss").inc(len(seen) - hits)
+
+        return seen
+
+    def add(self, facts):
+        """
+        Remembers facts locally and in Redis, trimming what's expired there
+        """
+
+        if not facts:
+            return
+
+        now = time.time()
+        witnesses = collections.defaultdict(dict)
+
+        for fact in facts:
+            self.remember(fact)
+            witnesses[fact["witness_id"]][fact["who"]] = now
+
+        pipeline = self.daemon.redis.pipeline(transaction=False)
+
+        for witness_id, whos in witnesses.items():
+            key = f"{self.KEY}/{witness_id}"
+            pipeline.zadd(key, whos)
+            pipeline.zremrangebyscore(key, 0, now - self.expire)
+            pipeline.expire(key, self.expire)
+
+        pipeline.execute()
+
+    def forget(self, facts):
+        """
+        Forgets facts deleted, everything if "*", as the API's taken them out of Redis
+        """
+
+        if facts == "*":
+            self.keys.clear()
+            return
+
+        for fact in json.loads(facts):
+            self.keys.pop(self.key(fact), None)
+
+    def read(self, fields):
+        """
+        Remembers a fact created or forgets those deleted, from an entry on the stream
+        """
+
+        if "fact" in fields:
+            self.remember(json.loads(fields["fact"]))
+
+        if "forget" in fields:
+            self.forget(fields["forget"])
+
+    def warm(self):
+        """
+        Remembers everything created since we last looked
+        """
+
+        while True:
+
+            messages = self.daemon.redis.xread({self.STREAM: self.last}, count=self.WARM)
+
+            if not messages:
+                return
+
+            for message_id, fields in messages[0][1]:
+                self.last = message_id
+                self.read(fields)
+
+            if len(messages[0][1]) < self.WARM:
+                return
+
+    def recent(self):
+        """
+        Reads back the latest entries, only as many as we'd remember, so warming starts from there
+
+        Reading the whole stream would take the first loop far too long.
+        """
+
+        entries = []
+        newest = "+"
+
+        while len(entries) < self.size:
+
+            count = min(self.WARM, self.size - len(entries))
+            page = self.daemon.redis.xrevrange(self.STREAM, newest, "-", count=count)
+
+            entries.extend(page)
+
+            if len(page) < count:
+                break
+
+            newest = f"({page[-1][0]}"
+
+        if entries:
+            self.last = entries[0][0]
+
+        for _, fields in reversed(entries):
+            self.read(fields)
+
+    def load(self):
+        """
+        Remembers the latest facts created and fills the bloom filter with everything shared in Redis
+        """
+
+        self.recent()
+
+        if self.bloom is None:
+            return
+
+        for key in self.daemon.redis.scan_iter(f"{self.KEY}/*"):
+
+            witness_id = key.rsplit("/", 1)[-1]
+
+            for who in self.daemon.redis.zrange(key, 0, -1):
+                self.bloom.add(f"{witness_id}:{who}")
@@ -5,25 +5,39 @@ Module for the Daemon
 # pylint: disable=no-self-use
 
 import os
+import time
+import functools
+import urllib.parse
 import micro_logger
 import json
 import redis
+import requests
 
 import relations_rest
 
 import prometheus_client
 
-import ledger
+import seen
+import writer
+import clients
+import checkpoint
+import inflight
+import work
 
 import origin.zoom
 import origin.bsky
 
-PROCESS = prometheus_client.Gauge("process_seconds", "Time to complete a processing task")
-ORIGINS = prometheus_client.Summary("origins_processed", "Origins processed")
-WITNESSES = prometheus_client.Summary("witnesses_processed", "Witnesses processed")
-FACTS = prometheus_client.Summary("facts_created", "Facts created")
-
-class Daemon: # pylint: disable=too-few-public-methods
+PROCESS = prometheus_client.Histogram("process_seconds", "Time to complete a processing task")
+ORIGINS = prometheus_client.Counter("origins_processed", "Origins processed", ["origin"])
+WITNESSES = prometheus_client.Counter("witnesses_processed", "Witnesses processed", ["origin", "witness"])
+FACTS = prometheus_client.Counter("facts_created", "Facts created", ["witness"])
+DEDUP = prometheus_client.Counter("facts_deduped", "Facts checked for already being stored", ["check", "result"])
+CALLS = prometheus_client.Histogram("origin_call_seconds", "Time calls to origins take", ["origin", "call"])
+API = prometheus_client.Histogram("api_call_seconds", "Time calls to the ledger API take", ["method", "endpoint"])
+LAG = prometheus_client.Gauge("stream_lag_seconds", "How far behind the newest entry a group's read", ["stream", "group"])
+PENDING = prometheus_client.Gauge("stream_pending", "Entries a group's read but not acked", ["stream", "group"])
+
+class Daemon: # pylint: disable=too-few-public-methods,too-many-instance-attributes
     """
     Daemon class
     """
@@ -38,71 +52,237 @@ class Daemon: # pylint: disable=too-few-public-methods
         self.name = os.environ["K8S_POD"]
 
         self.sleep = int(os.environ.get("SLEEP", 5))
+        self.batch = int(os.environ.get("BATCH", 10))
 
         self.logger = micro_logger.getLogger("ledger-daemon")
 
-        self.source = relations_rest.Source("ledger", url="http://api.ledger")
+        # Every call to the API is timed, whether through the models or directly
+
+        session = requests.Session()
+        session.hooks["response"].append(self.timed)
+
+        self.source = relations_rest.Source("ledger", url="http://api.ledger", session=session)
+
+        self.writer = writer.Writer(
+            self,
+            size=int(os.environ.get("FACT_BATCH", 100)),
+            latency=float(os.environ.get("FACT_FLUSH", 1)),
+            maxlen=int(os.environ.get("FACT_MAXLEN", 1000000))
+        )
+
+        self.clients = clients.Clients(
+            self,
+            ttl=int(os.environ.get("CLIENT_TTL", 60*60)),
+            pool=int(os.environ.get("HTTP_POOL", 10))
+        )
 
         self.redis = redis.Redis(host='redis.ledger', encoding="utf-8", decode_responses=True)
 
+        self.seen = seen.Seen(
+            self,
+            size=int(os.environ.get("SEEN_SIZE", 100000)),
+            ttl=int(os.environ.get("SEEN_TTL", 24*60*60)),
+            expire=int(os.environ.get("SEEN_EXPIRE", 30*24*60*60)),
+            bloom=int(os.environ.get("SEEN_BLOOM", 0))
+        )
+        self.seen.load()
+
+        self.checkpoints = checkpoint.Checkpoints(
+            self,
+            expire=int(os.environ.get("CHECKPOINT_EXPIRE", 30*24*60*60))
+        )
+
+        self.inflight = inflight.InFlight(
+            self,
+            ttl=int(os.environ.get("INFLIGHT_TTL", 60*60))
+        )
+
+        self.work = work.Work(
+            self,
+            partitions=int(os.environ.get("WORK_PARTITIONS", 1)),
+            maxlen=int(os.environ.get("QUEUE_MAXLEN", 100000)),
+            lease=int(os.environ.get("WORK_LEASE", 30)),
+            idle=int(os.environ.get("WORK_IDLE", 60))
+        )
+
+        self.interval = int(os.environ.get("METRICS_INTERVAL", 15))   # Seconds between measuring streams
+        self.measured = 0
+
+        # Any daemon can fan out an origin but witness streams are partitioned
+
+        self.streams = {
+            "ledger/origin": self.origins
+        }
+
+        for handler in self.ORIGINS:
+            for stream, handle in getattr(handler, "STREAMS", {}).items():
+                for partition in self.work.streams(stream):
+                    self.streams[partition] = functools.partial(handle, self)
+
+        for stream in self.streams:
+            if (
+                not self.redis.exists(stream) or
+                "daemon" not in [group["name"] for group in self.redis.xinfo_groups(stream)]
+            ):
+                self.redis.xgroup_create(stream, "daemon", mkstream=True)
+
+        # The API counts facts as it creates them now, and a group left on them would stop cron trimming them
+
         if (
-            not self.redis.exists("ledger/origin") or
-            "daemon" not in [group["name"] for group in self.redis.xinfo_groups("ledger/origin")]
+            self.redis.exists("ledger/fact") and
+            "daemon" in [group["name"] for group in self.redis.xinfo_groups("ledger/fact")]
         ):
-            self.redis.xgroup_create("ledger/origin", "daemon", mkstream=True)
+            self.redis.xgroup_destroy("ledger/fact", "daemon")
 
-        for handler in self.ORIGINS:
-            if hasattr(handler, "init"):
-                handler.init(self)
+    @staticmethod
+    def timed(response, *args, **kwargs): # pylint: disable=unused-argument
+        """
+        Records how long an API call took, by endpoint sans ids so there's only so many
+        """
+
+        path = urllib.parse.urlparse(response.request.url).path
+        endpoint = "/".join(part for part in path.strip("/").split("/") if not part.isdigit())
+
+        API.labels(response.request.method, endpoint).observe(response.elapsed.total_seconds())
+
+    @staticmethod
+    def parse(message_id):
+        """
+        Stream id as something comparable
+        """
+
+        milliseconds, _, sequence = message_id.partition("-")
+
+        return (int(milliseconds), int(sequence or 0))
+
+    def measure(self, streams):
+        """
+        Records how far behind and how much is pending for every group on these streams, at most every interval
+        """
+
+        if time.time() - self.measured < self.interval:
+            return
+
+        self.measured = time.time()
+
+        for stream in streams:
+
+            last = self.parse(self.redis.xinfo_stream(stream)["last-generated-id"])
+
+            for group in self.redis.xinfo_groups(stream):
+
+                # Ids are when they were added, so the difference is how long ago what's next was added
+
+                read = self.parse(group["last-delivered-id"])
+
+                LAG.labels(stream, group["name"]).set(max(last[0] - read[0], 0) / 1000)
+                PENDING.labels(stream, group["name"]).set(group["pending"])
+
+    def api(self, method, endpoint, **body):
+        """
+        Calls the ledger API directly for what the models can't express
+        """
+
+        response = self.source.session.request(method, f"{self.source.url}/{endpoint}", json=body)
+        response.raise_for_status()
 
+        return response.json()
+
+    def missing(self, witness_id, whos):
+        """
+        Which of these whos a witness doesn't have facts for yet, checked in a single call
+        """
+
+        return self.api("post", "fact/missing", witness_id=witness_id, whos=whos)["whos"]
 
     def fact(self, **fact):
         """
-        Creates a fact if needed
+        Buffers a fact to be created in bulk if absent
         """
 
-        print(fact)
+        self.writer.add(**fact)
 
-        fact = ledger.Fact(**fact).create()
+    def facts(self, facts):
+        """
+        Creates facts now if absent, returning which were new
+        """
 
-        self.logger.info("fact", extra={"fact": {"id": fact.id}})
-        FACTS.observe(1)
-        self.redis.xadd("ledger/fact", fields={"fact": json.dumps(fact.export())})
+        return [created for _, created in self.writer.write(facts)]
+
+    def origins(self, messages):
+        """
+        Hands each origin off to its handler
+        """
+
+        for message in messages:
+
+            if "origin" not in message:
+                continue
+
+            instance = json.loads(message["origin"])
+            self.logger.info("origin", extra={"origin": instance})
+            ORIGINS.labels(instance["who"]).inc()
+
+            for handler in self.ORIGINS:
+                if handler.WHO == instance["who"] and hasattr(handler, "origin"):
+                    handler.origin(self, instance)
 
-        return fact
+            # Fanned out so cron can queue it again, each witness being tracked on its own
+
+            self.inflight.release(f"origin/{instance['id']}")
 
     @PROCESS.time()
     def process(self):
         """
-        Reads people off the queue and logs them
+        Reads every stream we own at once, hands batches to their handlers, and acks them all
+
+        Anything left pending too long by a daemon that's gone is handled before anything new.
         """
 
-        message = self.redis.xreadgroup("daemon", self.name, {"ledger/origin": ">"}, count=1, block=1000*self.sleep)
+        self.seen.warm()
+        self.work.balance()
+
+        streams = self.work.mine(self.streams)
+        self.measure(streams)
+
+        messages = self.work.reclaim(streams, self.batch) or self.redis.xreadgroup(
+            "daemon", self.name, {stream: ">" for stream in streams}, count=self.batch, block=1000*self.sleep
+        )
 
-        if not message or "origin" not in message[0][1][0][1]:
+        if not messages:
             return
 
-        instance = json.loads(message[0][1][0][1]["origin"])
-        self.logger.info("origin", extra={"origin": instance})
-        ORIGINS.observe(1)
+        for stream, entries in messages:
+            self.streams[stream]([fields for _, fields in entries])
 
-        for handler in self.ORIGINS:
-            if handler.WHO == instance["who"] and hasattr(handler, "origin"):
-                handler.origin(self, instance)
+        # Make sure everything from the batch is stored before we ack
+
+        self.writer.flush()
+
+        holding = self.work.holding([stream for stream, _ in messages])
+
+        pipeline = self.redis.pipeline(transaction=False)
 
-        self.redis.xack("ledger/origin", "daemon", message[0][1][0][0])
+        for stream, entries in messages:
+
+            # If our lease ran out another daemon has the partition, and it'll claim these
+
+            if stream not in holding:
+                self.logger.warning("lease lost", extra={"stream": stream, "entries": len(entries)})
+                continue
+
+            pipeline.xack(stream, "daemon", *[message_id for message_id, _ in entries])
+
+        pipeline.execute()
 
     def run(self):
         """
-        Main loop with sleep
+        Main loop
         """
 
         prometheus_client.start_http_server(80)
 
-        while True:
+        self.work.start()
 
+        while True:
             self.process()
-
-            for handler in self.ORIGINS:
-                if hasattr(handler, "process"):
-                    handler.process(self)
@@ -0,0 +1,287 @@
+"""
+Module for spreading stream work across daemons
+"""
+
+import time
+import zlib
+import threading
+
+class Work: # pylint: disable=too-many-instance-attributes
+    """
+    Splits witness work between daemons so each witness has one owner at a time
+
+    Witness streams are partitioned, messages going to a partition by witness id. Daemons
+    heartbeat, split the partitions evenly between whoever's alive, and hold a lease on each
+    they own. Heartbeats and leases are renewed in the background, so a batch can take as
+    long as it needs, and leases are only let go between batches, once everything read's
+    been acked, so a witness is never handled by two daemons at once. Whatever a dead daemon
+    left pending is claimed once it's been idle long enough.
+
+    Leases are checked and changed a batch of partitions at a time, and only rebalanced every
+    third of a lease, as heartbeats keep them in between.
+    """
+
+    KEY = "ledger/work"
+    GROUP = "daemon"
+
+    daemon = None
+    partitions = None
+    maxlen = None       # About how long streams can get before the oldest entries are dropped
+    lease = None        # Seconds a heartbeat and leases last without being renewed
+    idle = None         # Seconds an entry's pending before it's claimed from whoever read it
+    owned = None        # Partitions we hold leases on
+    partitioned = None  # Partition of every partitioned stream
+    reclaimed = None    # When we last looked for entries to claim
+    balanced = None     # When we last rebalanced
+    stopped = None      # Set to stop heartbeating
+    lock = None         # Guards owned, as heartbeating changes it in the background
+
+    def __init__(self, daemon, partitions=1, maxlen=100000, lease=30, idle=60): # pylint: disable=too-many-arguments
+
+        self.daemon = daemon
+        self.partitions = partitions
+        self.maxlen = maxlen
+        self.lease = lease
+        self.idle = idle
+
+        self.owned = set()
+        self.partitioned = {}
+        self.reclaimed = 0
+        self.balanced = 0
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def key(self, kind, name=None):
+        """
+        Redis key for the members or a lease
+        """
+
+        if name is None:
+            return f"{self.KEY}/{kind}"
+
+        return f"{self.KEY}/{kind}/{name}"
+
+    def stream(self, stream, key):
+        """
+        Partition of a stream to send a key's work to
+        """
+
+        if self.partitions < 2:
+            return stream
+
+        return f"{stream}/{zlib.crc32(str(key).encode()) % self.partitions}"
+
+    def add(self, stream, key, **fields):
+        """
+        Adds work to a key's partition of a stream, capped so a backlog can't take all of Redis
+
+        The cap's a last resort, well above any backlog we expect, as it'll drop work not yet done.
+        Cron trims what's done well before then.
+        """
+
+        self.daemon.redis.xadd(self.stream(stream, key), fields=fields, maxlen=self.maxlen, approximate=True)
+
+    def streams(self, stream):
+        """
+        All the partitions of a stream, remembering them as partitioned
+        """
+
+        if self.partitions < 2:
+            streams = {stream: 0}
+        else:
+            streams = {f"{stream}/{partition}": partition for partition in range(self.partitions)}
+
+        self.partitioned.update(streams)
+
+        return list(streams)
+
+    def members(self):
+        """
+        Names of the daemons alive, those that have heartbeat within a lease
+        """
+
+        key = self.key("members")
+
+        pipeline = self.daemon.redis.pipeline(transaction=False)
+        pipeline.zremrangebyscore(key, 0, time.time() - self.lease)
+        pipeline.zrange(key, 0, -1)
+
+        return sorted(pipeline.execute()[-1])
+
+    def held(self, partitions):
+        """
+        Which of these partitions we still hold the lease on, checked at once
+        """
+
+        partitions = sorted(partitions)
+
+        if not partitions:
+            return set()
+
+        leases = self.daemon.redis.mget([self.key("lease", partition) for partition in partitions])
+
+        return {partition for partition, lease in zip(partitions, leases) if lease == self.daemon.name}
+
+    def heartbeat(self):
+        """
+        Says we're alive and renews the leases we still hold, letting go of any we've lost
+        """
+
+        with self.lock:
+            owned = set(self.owned)
+
+        held = self.held(owned)
+
+        pipeline = self.daemon.redis.pipeline(transaction=False)
+
+        pipeline.zadd(self.key("members"), {self.daemon.name: time.time()})
+
+        for partition in held:
+            pipeline.expire(self.key("lease", partition), self.lease)
+
+        pipeline.execute()
+
+        with self.lock:
+            self.owned -= owned - held
+
+    def beat(self):
+        """
+        Heartbeats a few times a lease until stopped
+        """
+
+        while not self.stopped.wait(self.lease / 3):
+            try:
+                self.heartbeat()
+            except Exception: # pylint: disable=broad-except
+                self.daemon.logger.warning("heartbeat", exc_info=True)
+
+    def start(self):
+        """
+        Heartbeats in the background so leases outlast however long a batch takes
+        """
+
+        self.stopped.clear()
+
+        thread = threading.Thread(target=self.beat, daemon=True)
+        thread.start()
+
+        return thread
+
+    def stop(self):
+        """
+        Stops heartbeating
+        """
+
+        self.stopped.set()
+
+    def balance(self):
+        """
+        Heartbeats, then takes or renews leases on our share of partitions and lets go of the rest
+
+        A partition another daemon still holds is only ours once it lets go or its lease runs out.
+        """
+
+        if time.time() - self.balanced < self.lease / 3:
+            return
+
+        self.balanced = time.time()
+
+        self.heartbeat()
+
+        name = self.daemon.name
+        members = self.members() or [name]
+        index = members.index(name) if name in members else 0
+
+        held = self.held(range(self.partitions))
+        commands = []   # Partition each command's for, None for letting go
+
+        pipeline = self.daemon.redis.pipeline(transaction=False)
+
+        for partition in range(self.partitions):
+
+            key = self.key("lease", partition)
+
+            if partition % len(members) != index:
+                if partition in held:
+                    commands.append(None)
+                    pipeline.delete(key)
+                continue
+
+            commands.append(partition)
+
+            if partition in held:
+                pipeline.expire(key, self.lease)
+            else:
+                pipeline.set(key, name, nx=True, ex=self.lease)
+
+        # Ours are those renewed or taken
+
+        results = pipeline.execute() if commands else []
+
+        with self.lock:
+            self.owned = {
+                partition for partition, result in zip(commands, results)
+                if partition is not None and result
+            }
+
+    def holding(self, streams):
+        """
+        Which of these streams we can still ack what we read from, those that aren't partitioned or whose lease we've kept
+        """
+
+        held = self.held({self.partitioned[stream] for stream in streams if stream in self.partitioned})
+
+        return [stream for stream in streams if stream not in self.partitioned or self.partitioned[stream] in held]
+
+    def mine(self, streams):
+        """
+        Which streams we should read, those that aren't partitioned and partitions we own
+        """
+
+        with self.lock:
+            owned = set(self.owned)
+
+        return [stream for stream in streams if stream not in self.partitioned or self.partitioned[stream] in owned]
+
+    def reclaim(self, streams, count):
+        """
+        Claims entries pending longer than idle, checking at most every lease, in the same shape as xreadgroup
+
+        Only entries left by daemons no longer alive are claimed, or by us before we restarted, as
+        a daemon that's alive is still working on what it has. A partition's entries are also claimed
+        from whoever lost its lease, as it won't ack them.
+        """
+
+        if time.time() - self.reclaimed < self.lease:
+            return []
+
+        self.reclaimed = time.time()
+
+        alive = set(self.members()) - {self.daemon.name}
+
+        messages = []
+
+        for stream in streams:
+
+            stale = [
+                entry["message_id"]
+                for entry in self.daemon.redis.xpending_range(stream, self.GROUP, "-", "+", count)
+                if entry["time_since_delivered"] >= self.idle*1000
+                and (entry["consumer"] not in alive or stream in self.partitioned)
+            ]
+
+            if not stale:
+                continue
+
+            # Whoever else was looking may have claimed them first, and trimmed entries come back empty
+
+            entries = [
+                entry for entry in self.daemon.redis.xclaim(stream, self.GROUP, self.daemon.name, self.idle*1000, stale)
+                if entry and entry[1] is not None
+            ]
+
+            if entries:
+                self.daemon.logger.info("reclaimed", extra={"stream": stream, "entries": len(entries)})
+                messages.append([stream, entries])
+
+        return messages
@@ -0,0 +1,97 @@
+"""
+Module for writing Facts in bulk
+"""
+
+import time
+import json
+
+import service
+
+class Writer:
+    """
+    Buffers facts and creates them in bulk if absent, flushing by size or time
+    """
+
+    daemon = None
+    size = None
+    latency = None
+    maxlen = None
+    facts = None
+    results = None
+    flushed = None
+
+    def __init__(self, daemon, size=100, latency=1.0, maxlen=1000000):
+
+        self.daemon = daemon
+        self.size = size
+        self.latency = latency
+        self.maxlen = maxlen
+        self.facts = []
+        self.results = []
+        self.flushed = time.time()
+
+    def add(self, **fact):
+        """
+        Buffers a fact, writing if we've hit size or time
+        """
+
+        self.facts.append(fact)
+
+        if len(self.facts) >= self.size or time.time() - self.flushed >= self.latency:
+            self.results.extend(self.write(self.facts))
+            self.facts = []
+
+    def write(self, facts):
+        """
+        Creates facts if absent with one call and pipelines events for the new ones
+
+        Facts we've already seen are skipped and come back as not created
+        """
+
+        self.flushed = time.time()
+
+        if not facts:
+            return []
+
+        seen = self.daemon.seen.check(facts)
+        unseen = [fact for fact, known in zip(facts, seen) if not known]
+
+        if not unseen:
+            return [(fact, False) for fact in facts]
+
+        body = self.daemon.api("post", "fact", facts=unseen, upsert=True)
+
+        written = list(zip(body["facts"], body["created"]))
+
+        pipeline = self.daemon.redis.pipeline(transaction=False)
+
+        for fact, created in written:
+
+            service.DEDUP.labels("api", "miss" if created else "hit").inc()
+
+            if not created:
+                continue
+
+            self.daemon.logger.info("fact", extra={"fact": {"id": fact["id"]}})
+            service.FACTS.labels(fact["witness_id"]).inc()
+            pipeline.xadd("ledger/fact", fields={"fact": json.dumps(fact)}, maxlen=self.maxlen, approximate=True)
+
+        pipeline.execute()
+
+        self.daemon.seen.add([fact for fact, _ in written])
+
+        written = iter(written)
+
+        return [(fact, False) if known else next(written) for fact, known in zip(facts, seen)]
+
+    def flush(self):
+        """
+        Writes anything buffered, returning all results since the last flush
+        """
+
+        self.results.extend(self.write(self.facts))
+        self.facts = []
+
+        results, self.results = self.results, []
+
+        return results
@@ -4,10 +4,74 @@ import micro_logger_unittest
 import relations.unittest
 
 import json
+import time
+import types
+import asyncio
+import datetime
+
+import requests
+import prometheus_client
 
 import service
+import seen
+import writer
+import clients
+import checkpoint
+import inflight
+import work
+import pipeline
 import ledger
 
+import origin.zoom
+import origin.bsky
+import origin.discord
+
+def sample(name, **labels):
+
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+def mock_api(method, endpoint, facts, upsert=False):
+
+    stored = []
+    created = []
+
+    for fact in facts:
+
+        existing = ledger.Fact.many(witness_id=fact["witness_id"], who=fact["who"])
+
+        if existing.count():
+            stored.append(existing.export()[0])
+            created.append(False)
+        else:
+            stored.append(ledger.Fact(**fact).create().export())
+            created.append(True)
+
+    return {"facts": stored, "created": created}
+
+class MockPipeline:
+
+    def __init__(self, redis):
+
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+
+        return command
+
+    def execute(self):
+
+        self.redis.pipelined.append(self.commands)
+
+        results = [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+        self.commands = []
+
+        return results
+
 class MockRedis:
 
     host = None
@@ -20,25 +84,131 @@ class MockRedis:
         self.queue = {}
         self.groups = {}
         self.read = {}
-        self.ack = {}
+        self.acks = []
+        self.pipelined = []
+        self.zsets = {}
+        self.values = {}
+        self.expires = {}
+        self.ids = 0
+        self.pending = {}
+        self.claimable = {}
+        self.claims = []
+        self.maxlens = {}
 
     def exists(self, stream):
 
         return stream in self.queue
 
+    def pipeline(self, transaction=True):
+
+        return MockPipeline(self)
+
+    def xadd(self, stream, fields, maxlen=None, approximate=True):
+
+        self.queue.setdefault(stream, [])
+        self.queue[stream].append(fields)
+
+        if maxlen is not None:
+            self.maxlens[stream] = (maxlen, approximate)
+
+    def xread(self, streams, count=None, block=None):
+
+        stream, last = list(streams.items())[0]
+        start = int(last.split("-")[0])
+
+        entries = [
+            [f"{index + 1}-0", fields]
+            for index, fields in enumerate(self.queue.get(stream, []))
+        ][start:start + count]
+
+        return [[stream, entries]] if entries else []
+
+    def xrevrange(self, stream, max="+", min="-", count=None): # pylint: disable=redefined-builtin
+
+        entries = [[f"{index + 1}-0", fields] for index, fields in enumerate(self.queue.get(stream, []))]
+
+        if max.startswith("("):
+            entries = entries[:int(max[1:].split("-")[0]) - 1]
+
+        return list(reversed(entries))[:count]
+
+    def get(self, key):
+
+        return self.values.get(key)
+
+    def mget(self, keys):
+
+        return [self.values.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, nx=False):
+
+        if nx and key in self.values:
+            return None
+
+        self.values[key] = value
+
+        if ex is not None:
+            self.expires[key] = ex
+
+        return True
+
+    def delete(self, *keys):
+
+        for key in keys:
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+
+    def zadd(self, key, mapping):
+
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zscore(self, key, member):
+
+        return self.zsets.get(key, {}).get(member)
+
+    def zrange(self, key, start, end):
+
+        return sorted(self.zsets.get(key, {}), key=lambda member: self.zsets[key][member])
+
+    def zremrangebyscore(self, key, low, high):
+
+        for member, score in list(self.zsets.get(key, {}).items()):
+            if low <= score <= high:
+                del self.zsets[key][member]
+
+    def expire(self, key, seconds):
+
+        self.expires[key] = seconds
+
+        return key in self.values or key in self.zsets
+
+    def scan_iter(self, match):
+
+        return [key for key in list(self.zsets) + list(self.values) if key.startswith(match[:-1])]
+
+    def xinfo_stream(self, stream):
+
+        return {"length": len(self.queue[stream]), "last-generated-id": f"{self.ids}-0"}
+
     def xinfo_groups(self, stream):
 
         return self.groups[stream]
 
     def xgroup_create(self, stream, name, mkstream=False):
 
-        self.groups[stream] = {
-            "name": name
-        }
+        self.groups[stream] = [{
+            "name": name,
+            "pending": 0,
+            "last-delivered-id": "0-0"
+        }]
 
         if mkstream:
             self.queue[stream] = []
 
+    def xgroup_destroy(self, stream, name):
+
+        self.groups[stream] = [group for group in self.groups[stream] if group["name"] != name]
+
     def xreadgroup(self, group, consumer, streams, count=0, block=5000):
 
         self.read = {
@@ -49,27 +219,38 @@ class MockRedis:
             "block": block
         }
 
-        stream = list(streams.keys())[0]
-
-        return [
-            [
-                stream,
-                [
-                    [
-                        "id",
-                        self.queue[stream].pop(0)
-                    ]
-                ]
-            ]
-        ]
+        messages = []
+
+        for stream in streams:
+
+            entries = []
+
+            while self.queue[stream] and len(entries) < count:
+                self.ids += 1
+                entries.append([f"{self.ids}-0", self.queue[stream].pop(0)])
+
+            if entries:
+                messages.append([stream, entries])
+
+        return messages
+
+    def xpending_range(self, stream, group, low, high, count):
+
+        return self.pending.get(stream, [])[:count]
 
-    def xack(self, stream, group, id):
+    def xclaim(self, stream, group, consumer, idle, ids):
 
-        self.ack = {
+        self.claims.append({"stream": stream, "group": group, "consumer": consumer, "idle": idle, "ids": ids})
+
+        return [[message_id, self.claimable.get(message_id)] for message_id in ids]
+
+    def xack(self, stream, group, *ids):
+
+        self.acks.append({
             "stream": stream,
             "group": group,
-            "id": id
-        }
+            "ids": list(ids)
+        })
 
 
 class TestDaemon(micro_logger_unittest.TestCase):
@@ -83,8 +264,9 @@ class TestDaemon(micro_logger_unittest.TestCase):
     def setUp(self):
 
         self.daemon = service.Daemon()
+        self.daemon.api = unittest.mock.MagicMock(side_effect=mock_api)
 
-    @unittest.mock.patch.dict('os.environ', {"K8S_POD": "test", "SLEEP": "7", "LOG_LEVEL": "INFO"})
+    @unittest.mock.patch.dict('os.environ', {"K8S_POD": "test", "SLEEP": "7", "BATCH": "3", "LOG_LEVEL": "INFO"})
     @unittest.mock.patch("micro_logger.getLogger", micro_logger_unittest.MockLogger)
     @unittest.mock.patch('relations_rest.Source', relations.unittest.MockSource)
     @unittest.mock.patch('redis.Redis', MockRedis)
@@ -95,6 +277,7 @@ class TestDaemon(micro_logger_unittest.TestCase):
         self.assertEqual(daemon.name, "test")
 
         self.assertEqual(daemon.sleep, 7)
+        self.assertEqual(daemon.batch, 3)
 
         self.assertEqual(daemon.logger.name, "ledger-daemon")
 
@@ -102,24 +285,1590 @@ class TestDaemon(micro_logger_unittest.TestCase):
 
         self.assertEqual(daemon.redis.host, "redis.ledger")
         self.assertEqual(daemon.redis.queue["ledger/origin"], [])
+        self.assertEqual(daemon.redis.queue["ledger/origin/zoom/witness"], [])
+        self.assertEqual(daemon.redis.queue["ledger/origin/bsky"], [])
+        self.assertEqual(list(daemon.streams), [
+            "ledger/origin", "ledger/origin/zoom/witness", "ledger/origin/bsky"
+        ])
+
+        self.assertEqual(daemon.writer.size, 100)
+        self.assertEqual(daemon.writer.latency, 1)
+        self.assertEqual(daemon.writer.maxlen, 1000000)
+
+        self.assertEqual(daemon.seen.size, 100000)
+        self.assertEqual(daemon.seen.ttl, 86400)
+        self.assertEqual(daemon.seen.expire, 2592000)
+        self.assertIsNone(daemon.seen.bloom)
+
+        self.assertEqual(daemon.clients.ttl, 3600)
+        self.assertEqual(daemon.clients.adapter._pool_maxsize, 10)
+
+        self.assertEqual(daemon.checkpoints.expire, 2592000)
+
+        self.assertEqual(daemon.inflight.ttl, 3600)
+
+        self.assertEqual(daemon.interval, 15)
+        self.assertEqual(daemon.measured, 0)
+
+        self.assertEqual(daemon.work.partitions, 1)
+        self.assertEqual(daemon.work.maxlen, 100000)
+        self.assertEqual(daemon.work.lease, 30)
+        self.assertEqual(daemon.work.idle, 60)
+
+    @unittest.mock.patch.dict('os.environ', {"K8S_POD": "test", "LOG_LEVEL": "INFO"})
+    @unittest.mock.patch("micro_logger.getLogger", micro_logger_unittest.MockLogger)
+    @unittest.mock.patch('relations_rest.Source', relations.unittest.MockSource)
+    def test___init___fact(self):
+
+        class Counted(MockRedis):
+
+            def __init__(self, host, **kwargs):
+
+                super().__init__(host, **kwargs)
+
+                self.xgroup_create("ledger/fact", "daemon", mkstream=True)
+
+        with unittest.mock.patch('redis.Redis', Counted):
+            daemon = service.Daemon()
+
+        self.assertEqual(daemon.redis.groups["ledger/fact"], [])
+
+    def test_api(self):
+
+        daemon = self.daemon
+        del daemon.api
+
+        daemon.source.url = "http://api.ledger"
+        daemon.source.session = unittest.mock.MagicMock()
+        daemon.source.session.request.return_value.json.return_value = {"facts": []}
+
+        self.assertEqual(daemon.api("post", "fact", facts=[]), {"facts": []})
+
+        daemon.source.session.request.assert_called_once_with("post", "http://api.ledger/fact", json={"facts": []})
+        daemon.source.session.request.return_value.raise_for_status.assert_called_once_with()
+
+    def test_timed(self):
+
+        response = unittest.mock.MagicMock(elapsed=datetime.timedelta(seconds=0.25))
+        response.request.method = "GET"
+        response.request.url = "http://api.ledger/unum/12/timeline?limit=3"
+
+        count = sample("api_call_seconds_count", method="GET", endpoint="unum/timeline")
+        total = sample("api_call_seconds_sum", method="GET", endpoint="unum/timeline")
+
+        service.Daemon.timed(response)
+
+        self.assertEqual(sample("api_call_seconds_count", method="GET", endpoint="unum/timeline"), count + 1)
+        self.assertEqual(sample("api_call_seconds_sum", method="GET", endpoint="unum/timeline"), total + 0.25)
+
+    def test_parse(self):
+
+        self.assertEqual(service.Daemon.parse("5-1"), (5, 1))
+        self.assertEqual(service.Daemon.parse("5"), (5, 0))
+
+    @unittest.mock.patch("time.time")
+    def test_measure(self, mock_time):
+
+        mock_time.return_value = 100
+
+        self.daemon.redis.ids = 5000
+        self.daemon.redis.groups["ledger/origin"] = [
+            {"name": "daemon", "pending": 2, "last-delivered-id": "3000-0"},
+            {"name": "other", "pending": 0, "last-delivered-id": "6000-0"}
+        ]
+
+        self.daemon.measure(["ledger/origin"])
+
+        self.assertEqual(sample("stream_lag_seconds", stream="ledger/origin", group="daemon"), 2)
+        self.assertEqual(sample("stream_pending", stream="ledger/origin", group="daemon"), 2)
+        self.assertEqual(sample("stream_lag_seconds", stream="ledger/origin", group="other"), 0)
+        self.assertEqual(sample("stream_pending", stream="ledger/origin", group="other"), 0)
+
+        # Only every so often
+
+        self.daemon.redis.groups["ledger/origin"][0]["pending"] = 5
+
+        mock_time.return_value = 110
+        self.daemon.measure(["ledger/origin"])
+        self.assertEqual(sample("stream_pending", stream="ledger/origin", group="daemon"), 2)
+
+        mock_time.return_value = 115
+        self.daemon.measure(["ledger/origin"])
+        self.assertEqual(sample("stream_pending", stream="ledger/origin", group="daemon"), 5)
+
+    def test_missing(self):
+
+        self.daemon.api = unittest.mock.MagicMock(return_value={"whos": ["two"]})
+
+        self.assertEqual(self.daemon.missing(1, ["one", "two"]), ["two"])
+
+        self.daemon.api.assert_called_once_with("post", "fact/missing", witness_id=1, whos=["one", "two"])
+
+    def test_fact(self):
+
+        self.daemon.fact(witness_id=1, who="one", when=1, what={"a": 1})
+
+        self.assertEqual(ledger.Fact.many().count(), 0)
+        self.assertEqual(self.daemon.writer.facts, [{"witness_id": 1, "who": "one", "when": 1, "what": {"a": 1}}])
+
+    def test_facts(self):
+
+        self.assertEqual(self.daemon.facts([
+            {"witness_id": 1, "who": "one", "when": 1},
+            {"witness_id": 1, "who": "two", "when": 2}
+        ]), [True, True])
+
+        self.assertEqual(self.daemon.facts([
+            {"witness_id": 1, "who": "two", "when": 2},
+            {"witness_id": 1, "who": "three", "when": 3}
+        ]), [False, True])
+
+        self.assertEqual(ledger.Fact.many().count(), 3)
+
+        self.daemon.seen.keys.clear()
+
+        self.assertEqual(self.daemon.facts([
+            {"witness_id": 1, "who": "one", "when": 1},
+            {"witness_id": 1, "who": "four", "when": 4}
+        ]), [False, True])
+
+    def test_origins(self):
+
+        origin = ledger.Origin("Tom").create()
+        self.daemon.redis.set(f"ledger/inflight/origin/{origin.id}", 1)
+
+        processed = sample("origins_processed_total", origin="Tom")
+
+        self.daemon.origins([{}, {"origin": json.dumps(origin.export())}])
+
+        self.assertLogged(self.daemon.logger, "info", "origin", extra={"origin": origin.export()})
+        self.assertEqual(self.daemon.redis.values, {})
+        self.assertEqual(sample("origins_processed_total", origin="Tom"), processed + 1)
 
     def test_process(self):
 
-        self.daemon.redis.queue["ledger/origin"].append({})
+        handled = []
+        self.daemon.streams["ledger/origin/bsky"] = handled.extend
 
         self.daemon.process()
+        self.assertEqual(self.daemon.redis.read, {
+            "group": "daemon",
+            "consumer": "unit",
+            "streams": {
+                "ledger/origin": ">",
+                "ledger/origin/zoom/witness": ">",
+                "ledger/origin/bsky": ">"
+            },
+            "count": 10,
+            "block": 7000
+        })
+        self.assertEqual(self.daemon.redis.acks, [])
 
         origin = ledger.Origin("Tom").create()
-        self.daemon.redis.queue["ledger/origin"].append({"origin": json.dumps(origin.export())})
+        self.daemon.redis.queue["ledger/origin"].extend([{}, {"origin": json.dumps(origin.export())}])
+        self.daemon.redis.queue["ledger/origin/bsky"].extend([{"a": 1}])
+
+        self.daemon.fact(witness_id=1, who="one", when=1)
+        self.daemon.redis.queue["ledger/fact"] = [{"fact": json.dumps({"witness_id": 2, "who": "two", "when": 2})}]
 
         self.daemon.process()
         self.assertLogged(self.daemon.logger, "info", "origin", extra={"origin": origin.export()})
 
+        self.assertEqual(handled, [{"a": 1}])
+        self.assertEqual(self.daemon.redis.acks, [
+            {
+                "stream": "ledger/origin",
+                "group": "daemon",
+                "ids": ["1-0", "2-0"]
+            },
+            {
+                "stream": "ledger/origin/bsky",
+                "group": "daemon",
+                "ids": ["3-0"]
+            }
+        ])
+
+        self.assertEqual(ledger.Fact.many().who, ["one"])
+        self.assertEqual(self.daemon.writer.facts, [])
+        self.assertTrue(self.daemon.seen.cached({"witness_id": 2, "who": "two"}))
+
+        # Left pending by a daemon that's gone, handled before anything new
+
+        self.daemon.work.reclaimed = 0
+        self.daemon.redis.queue["ledger/origin/bsky"].extend([{"b": 2}])
+        self.daemon.redis.pending["ledger/origin/bsky"] = [
+            {"message_id": "9-0", "consumer": "gone", "time_since_delivered": 60000, "times_delivered": 1}
+        ]
+        self.daemon.redis.claimable["9-0"] = {"c": 3}
+
+        self.daemon.process()
+
+        self.assertEqual(handled, [{"a": 1}, {"c": 3}])
+        self.assertEqual(self.daemon.redis.acks[-1], {"stream": "ledger/origin/bsky", "group": "daemon", "ids": ["9-0"]})
+        self.assertEqual(self.daemon.redis.queue["ledger/origin/bsky"], [{"b": 2}])
+
+        # Lost the lease while handling, so whoever has it now will claim rather than us ack
+
+        acks = len(self.daemon.redis.acks)
+
+        def lose(messages):
+            handled.extend(messages)
+            self.daemon.redis.set("ledger/work/lease/0", "other")
+
+        self.daemon.streams["ledger/origin/bsky"] = lose
+
+        self.daemon.process()
+
+        self.assertEqual(handled, [{"a": 1}, {"c": 3}, {"b": 2}])
+        self.assertNotIn("ledger/origin/bsky", [ack["stream"] for ack in self.daemon.redis.acks[acks:]])
+        self.assertLogged(self.daemon.logger, "warning", "lease lost", extra={"stream": "ledger/origin/bsky", "entries": 1})
+
     @unittest.mock.patch('prometheus_client.start_http_server')
     def test_run(self, mock_prom):
 
         self.daemon.process = unittest.mock.MagicMock(side_effect=Exception("loop"))
+        self.daemon.work.start = unittest.mock.MagicMock()
 
         self.assertRaisesRegex(Exception, "loop", self.daemon.run)
 
         mock_prom.assert_called_once_with(80)
+        self.daemon.work.start.assert_called_once_with()
+
+
+class TestWriter(micro_logger_unittest.TestCase):
+
+    maxDiff = None
+
+    @unittest.mock.patch.dict('os.environ', {"K8S_POD": "unit", "LOG_LEVEL": "INFO"})
+    @unittest.mock.patch("micro_logger.getLogger", micro_logger_unittest.MockLogger)
+    @unittest.mock.patch('relations_rest.Source', relations.unittest.MockSource)
+    @unittest.mock.patch('redis.Redis', MockRedis)
+    def setUp(self):
+
+        self.daemon = service.Daemon()
+        self.daemon.api = unittest.mock.MagicMock(side_effect=mock_api)
+        self.writer = writer.Writer(self.daemon, size=2, latency=60, maxlen=1000)
+
+    def test___init__(self):
+
+        self.assertEqual(self.writer.daemon, self.daemon)
+        self.assertEqual(self.writer.size, 2)
+        self.assertEqual(self.writer.latency, 60)
+        self.assertEqual(self.writer.maxlen, 1000)
+        self.assertEqual(self.writer.facts, [])
+        self.assertEqual(self.writer.results, [])
+
+    def test_add(self):
+
+        self.writer.add(witness_id=1, who="one", when=1)
+        self.assertEqual(ledger.Fact.many().count(), 0)
+
+        self.writer.add(witness_id=1, who="two", when=2)
+        self.assertEqual(ledger.Fact.many().count(), 2)
+        self.assertEqual(self.writer.facts, [])
+        self.assertEqual([created for _, created in self.writer.results], [True, True])
+
+        self.writer.latency = 0
+
+        self.writer.add(witness_id=1, who="one", when=1)
+        self.assertEqual(ledger.Fact.many().count(), 2)
+        self.assertEqual([created for _, created in self.writer.results], [True, True, False])
+
+    @unittest.mock.patch("time.time")
+    def test_write(self, mock_time):
+
+        mock_time.return_value = 7
+
+        self.assertEqual(self.writer.write([]), [])
+        self.assertEqual(self.daemon.redis.pipelined, [])
+        self.assertEqual(self.writer.flushed, 7)
+
+        ledger.Fact(witness_id=1, who="one", when=1).create()
+
+        hits = sample("facts_deduped_total", check="api", result="hit")
+        misses = sample("facts_deduped_total", check="api", result="miss")
+        facts = sample("facts_created_total", witness="1")
+
+        results = self.writer.write([
+            {"witness_id": 1, "who": "one", "when": 1},
+            {"witness_id": 1, "who": "two", "when": 2}
+        ])
+
+        self.assertEqual([(fact["who"], created) for fact, created in results], [("one", False), ("two", True)])
+
+        self.assertEqual(sample("facts_deduped_total", check="api", result="hit"), hits + 1)
+        self.assertEqual(sample("facts_deduped_total", check="api", result="miss"), misses + 1)
+        self.assertEqual(sample("facts_created_total", witness="1"), facts + 1)
+
+        self.daemon.api.assert_called_with("post", "fact", facts=[
+            {"witness_id": 1, "who": "one", "when": 1},
+            {"witness_id": 1, "who": "two", "when": 2}
+        ], upsert=True)
+
+        self.assertLogged(self.daemon.logger, "info", "fact", extra={"fact": {"id": results[1][0]["id"]}})
+        self.assertEqual(len(self.daemon.redis.pipelined), 3)
+        self.assertEqual(
+            [json.loads(event["fact"]) for event in self.daemon.redis.queue["ledger/fact"]],
+            [results[1][0]]
+        )
+        self.assertEqual(self.daemon.redis.maxlens["ledger/fact"], (1000, True))
+
+        self.assertEqual(self.daemon.seen.check([{"witness_id": 1, "who": "one"}, {"witness_id": 1, "who": "two"}]), [True, True])
+
+        results = self.writer.write([
+            {"witness_id": 1, "who": "two", "when": 2},
+            {"witness_id": 1, "who": "three", "when": 3}
+        ])
+
+        self.assertEqual(results[0], ({"witness_id": 1, "who": "two", "when": 2}, False))
+        self.assertEqual(results[1][0]["who"], "three")
+        self.assertTrue(results[1][1])
+
+        self.daemon.api.assert_called_with("post", "fact", facts=[{"witness_id": 1, "who": "three", "when": 3}], upsert=True)
+
+        self.daemon.api.reset_mock()
+
+        self.assertEqual(self.writer.write([{"witness_id": 1, "who": "three", "when": 3}]), [
+            ({"witness_id": 1, "who": "three", "when": 3}, False)
+        ])
+
+        self.daemon.api.assert_not_called()
+
+    def test_flush(self):
+
+        self.writer.add(witness_id=1, who="one", when=1)
+        self.writer.add(witness_id=1, who="two", when=2)
+        self.writer.add(witness_id=1, who="three", when=3)
+
+        self.assertEqual([fact["who"] for fact, _ in self.writer.flush()], ["one", "two", "three"])
+        self.assertEqual(self.writer.facts, [])
+        self.assertEqual(self.writer.results, [])
+
+        self.assertEqual(self.writer.flush(), [])
+
+
+class TestBloom(unittest.TestCase):
+
+    def test_bloom(self):
+
+        bloom = seen.Bloom(1024)
+
+        self.assertEqual(len(bloom.array), 128)
+        self.assertEqual(len(bloom.positions("1:one")), 4)
+
+        self.assertNotIn("1:one", bloom)
+
+        bloom.add("1:one")
+
+        self.assertIn("1:one", bloom)
+        self.assertNotIn("1:two", bloom)
+
+
+class TestSeen(micro_logger_unittest.TestCase):
+
+    maxDiff = None
+
+    @unittest.mock.patch.dict('os.environ', {"K8S_POD": "unit", "LOG_LEVEL": "INFO"})
+    @unittest.mock.patch("micro_logger.getLogger", micro_logger_unittest.MockLogger)
+    @unittest.mock.patch('relations_rest.Source', relations.unittest.MockSource)
+    @unittest.mock.patch('redis.Redis', MockRedis)
+    def setUp(self):
+
+        self.daemon = service.Daemon()
+        self.seen = seen.Seen(self.daemon, size=2, ttl=60, expire=600)
+
+    def test___init__(self):
+
+        self.assertEqual(self.seen.daemon, self.daemon)
+        self.assertEqual(self.seen.size, 2)
+        self.assertEqual(self.seen.ttl, 60)
+        self.assertEqual(self.seen.expire, 600)
+        self.assertEqual(self.seen.last, "0")
+        self.assertIsNone(self.seen.bloom)
+
+        self.assertIsInstance(seen.Seen(self.daemon, bloom=64).bloom, seen.Bloom)
+
+    def test_key(self):
+
+        self.assertEqual(self.seen.key({"witness_id": 1, "who": "one"}), "1:one")
+
+    @unittest.mock.patch("time.time")
+    def test_remember(self, mock_time):
+
+        mock_time.return_value = 7
+
+        self.seen.bloom = seen.Bloom(64)
+
+        self.seen.remember({"witness_id": 1, "who": "one"})
+        self.seen.remember({"witness_id": 1, "who": "two"})
+        self.seen.remember({"witness_id": 1, "who": "one"})
+        self.seen.remember({"witness_id": 1, "who": "three"})
+
+        self.assertEqual(list(self.seen.keys.items()), [("1:one", 67), ("1:three", 67)])
+        self.assertIn("1:two", self.seen.bloom)
+
+    @unittest.mock.patch("time.time")
+    def test_cached(self, mock_time):
+
+        mock_time.return_value = 7
+
+        self.seen.remember({"witness_id": 1, "who": "one"})
+        self.seen.remember({"witness_id": 1, "who": "two"})
+
+        self.assertTrue(self.seen.cached({"witness_id": 1, "who": "one"}))
+        self.assertEqual(list(self.seen.keys), ["1:two", "1:one"])
+
+        self.assertFalse(self.seen.cached({"witness_id": 1, "who": "three"}))
+
+        mock_time.return_value = 100
+
+        self.assertFalse(self.seen.cached({"witness_id": 1, "who": "one"}))
+        self.assertEqual(list(self.seen.keys), ["1:two"])
+
+    def test_check(self):
+
+        self.seen.remember({"witness_id": 1, "who": "one"})
+        self.daemon.redis.zsets["ledger/seen/1"] = {"two": 1}
+
+        hits = sample("facts_deduped_total", check="seen", result="hit")
+        misses = sample("facts_deduped_total", check="seen", result="miss")
+
+        self.assertEqual(self.seen.check([
+            {"witness_id": 1, "who": "one"},
+            {"witness_id": 1, "who": "two"},
+            {"witness_id": 1, "who": "three"}
+        ]), [True, True, False])
+
+        self.assertEqual(sample("facts_deduped_total", check="seen", result="hit"), hits + 2)
+        self.assertEqual(sample("facts_deduped_total", check="seen", result="miss"), misses + 1)
+
+        self.assertEqual(len(self.daemon.redis.pipelined), 1)
+        self.assertTrue(self.seen.cached({"witness_id": 1, "who": "two"}))
+
+        self.assertEqual(self.seen.check([{"witness_id": 1, "who": "two"}]), [True])
+        self.assertEqual(len(self.daemon.redis.pipelined), 1)
+
+        self.seen.bloom = seen.Bloom(64)
+
+        self.assertEqual(self.seen.check([{"witness_id": 1, "who": "three"}]), [False])
+        self.assertEqual(len(self.daemon.redis.pipelined), 1)
+
+    @unittest.mock.patch("time.time")
+    def test_add(self, mock_time):
+
+        mock_time.return_value = 1000
+
+        self.seen.add([])
+        self.assertEqual(self.daemon.redis.pipelined, [])
+
+        self.daemon.redis.zsets["ledger/seen/1"] = {"old": 1}
+
+        self.seen.add([
+            {"witness_id": 1, "who": "one"},
+            {"witness_id": 2, "who": "two"}
+        ])
+
+        self.assertTrue(self.seen.cached({"witness_id": 1, "who": "one"}))
+        self.assertEqual(self.daemon.redis.zsets, {
+            "ledger/seen/1": {"one": 1000},
+            "ledger/seen/2": {"two": 1000}
+        })
+        self.assertEqual(self.daemon.redis.expires, {
+            "ledger/seen/1": 600,
+            "ledger/seen/2": 600
+        })
+
+    def test_warm(self):
+
+        self.seen.WARM = 2
+
+        self.seen.warm()
+        self.assertEqual(self.seen.last, "0")
+
+        self.daemon.redis.queue["ledger/fact"] = [
+            {"fact": json.dumps({"witness_id": 1, "who": "one"})},
+            {"nope": "nope"},
+            {"fact": json.dumps({"witness_id": 1, "who": "two"})}
+        ]
+
+        self.seen.warm()
+
+        self.assertEqual(self.seen.last, "3-0")
+        self.assertEqual(list(self.seen.keys), ["1:one", "1:two"])
+
+        # Deleted facts are forgotten, and everything when partitions are dropped
+
+        self.daemon.redis.queue["ledger/fact"].extend([
+            {"forget": json.dumps([{"witness_id": 1, "who": "one"}])}
+        ])
+
+        self.seen.warm()
+
+        self.assertEqual(self.seen.last, "4-0")
+        self.assertEqual(list(self.seen.keys), ["1:two"])
+
+        self.daemon.redis.queue["ledger/fact"].append({"forget": "*"})
+
+        self.seen.warm()
+
+        self.assertEqual(self.seen.last, "5-0")
+        self.assertEqual(list(self.seen.keys), [])
+
+    def test_recent(self):
+
+        self.seen.WARM = 1
+
+        self.seen.recent()
+        self.assertEqual(self.seen.last, "0")
+
+        self.daemon.redis.queue["ledger/fact"] = [
+            {"fact": json.dumps({"witness_id": 1, "who": "one"})},
+            {"fact": json.dumps({"witness_id": 1, "who": "two"})},
+            {"forget": json.dumps([{"witness_id": 1, "who": "two"}])},
+            {"fact": json.dumps({"witness_id": 1, "who": "three"})}
+        ]
+
+        # Only as many as we'd remember, the rest left to warm
+
+        self.seen.recent()
+
+        self.assertEqual(self.seen.last, "4-0")
+        self.assertEqual(list(self.seen.keys), ["1:three"])
+
+        self.seen.warm()
+        self.assertEqual(list(self.seen.keys), ["1:three"])
+
+    def test_load(self):
+
+        self.daemon.redis.zsets["ledger/seen/1"] = {"one": 1}
+
+        self.seen.load()
+
+        self.seen.bloom = seen.Bloom(64)
+        self.seen.load()
+
+        self.assertIn("1:one", self.seen.bloom)
+        self.assertNotIn("1:two", self.seen.bloom)
+
+
+class TestClients(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+
+        self.clients = clients.Clients("daemon", ttl=60, pool=2)
+
+    def test___init__(self):
+
+        self.assertEqual(self.clients.daemon, "daemon")
+        self.assertEqual(self.clients.ttl, 60)
+        self.assertEqual(self.clients.adapter._pool_connections, 2)
+        self.assertEqual(self.clients.clients, {})
+
+    def test_session(self):
+
+        one = self.clients.session()
+        two = self.clients.session()
+
+        self.assertIsNot(one, two)
+        self.assertIs(one.get_adapter("https://zoom.us"), self.clients.adapter)
+        self.assertIs(two.get_adapter("http://api.ledger"), self.clients.adapter)
+
+    @unittest.mock.patch("time.time")
+    def test_get(self, mock_time):
+
+        mock_time.return_value = 100
+
+        create = unittest.mock.MagicMock(side_effect=lambda: unittest.mock.MagicMock(expires=None))
+
+        client = self.clients.get("bsky", create)
+        self.assertIs(self.clients.get("bsky", create), client)
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(self.clients.clients["bsky"][0], 160)
+
+        mock_time.return_value = 160
+        self.assertIsNot(self.clients.get("bsky", create), client)
+        self.assertEqual(create.call_count, 2)
+
+        token = unittest.mock.MagicMock(expires=120)
+        self.assertIs(self.clients.get("zoom/1", lambda: token), token)
+        self.assertEqual(self.clients.clients["zoom/1"][0], 120)
+
+    def test_drop(self):
+
+        self.clients.clients["bsky"] = (0, "client")
+
+        self.clients.drop("bsky")
+        self.clients.drop("bsky")
+
+        self.assertEqual(self.clients.clients, {})
+
+
+class TestCheckpoints(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+
+        self.daemon = unittest.mock.MagicMock(redis=MockRedis("redis.ledger"))
+        self.checkpoints = checkpoint.Checkpoints(self.daemon, expire=60)
+
+    @staticmethod
+    def pager(items, size=2):
+
+        calls = []
+
+        def page(cursor):
+
+            calls.append(cursor)
+            older = [item for item in items if cursor is None or item < int(cursor)][:size]
+
+            return older, (str(older[-1]) if older and older[-1] != items[-1] else None)
+
+        return page, calls
+
+    def test___init__(self):
+
+        self.assertEqual(self.checkpoints.daemon, self.daemon)
+        self.assertEqual(self.checkpoints.expire, 60)
+
+    def test_key(self):
+
+        self.assertEqual(self.checkpoints.key("bsky/posts"), "ledger/checkpoint/bsky/posts")
+
+    def test_get(self):
+
+        self.assertEqual(self.checkpoints.get("bsky/posts"), {})
+
+        self.daemon.redis.values["ledger/checkpoint/bsky/posts"] = '{"when": 5}'
+
+        self.assertEqual(self.checkpoints.get("bsky/posts"), {"when": 5})
+
+    def test_set(self):
+
+        self.checkpoints.set("bsky/posts", when=5, cursor="a")
+
+        self.assertEqual(json.loads(self.daemon.redis.values["ledger/checkpoint/bsky/posts"]), {"when": 5, "cursor": "a"})
+        self.assertEqual(self.daemon.redis.expires["ledger/checkpoint/bsky/posts"], 60)
+
+    def test_pages(self):
+
+        page, calls = self.pager([5, 4, 3, 2, 1])
+
+        self.assertEqual(list(self.checkpoints.pages(page, lambda item: item, None, None)), [
+            ([5, 4], "4"),
+            ([3, 2], "2"),
+            ([1], None)
+        ])
+        self.assertEqual(calls, [None, "4", "2"])
+
+        # Stops at the first page that goes past stop
+
+        page, calls = self.pager([5, 4, 3, 2, 1])
+
+        self.assertEqual(list(self.checkpoints.pages(page, lambda item: item, "4", 2)), [([3, 2], "2"), ([], None)])
+        self.assertEqual(calls, ["4", "2"])
+
+    def test_crawl(self):
+
+        # First time through goes all the way back
+
+        page, calls = self.pager([5, 4, 3, 2, 1])
+
+        self.assertEqual(list(self.checkpoints.crawl("scope", page, lambda item: item)), [[5, 4], [3, 2], [1]])
+        self.assertEqual(calls, [None, "4", "2"])
+        self.assertEqual(self.checkpoints.get("scope"), {"when": 5})
+
+        # Then only as far as what's new
+
+        page, calls = self.pager([8, 7, 6, 5, 4, 3, 2, 1])
+
+        self.assertEqual(list(self.checkpoints.crawl("scope", page, lambda item: item)), [[8, 7], [6, 5]])
+        self.assertEqual(calls, [None, "7", "5"])
+        self.assertEqual(self.checkpoints.get("scope"), {"when": 8})
+
+        # Overlapping goes back a bit further
+
+        page, calls = self.pager([9, 8, 7, 6, 5])
+
+        self.assertEqual(list(self.checkpoints.crawl("scope", page, lambda item: item, overlap=2)), [[9, 8], [7, 6]])
+        self.assertEqual(self.checkpoints.get("scope"), {"when": 9})
+
+        # Nothing at all
+
+        page, calls = self.pager([])
+
+        self.assertEqual(list(self.checkpoints.crawl("empty", page, lambda item: item)), [])
+        self.assertEqual(self.checkpoints.get("empty"), {"when": None})
+
+    def test_crawl_interrupted(self):
+
+        page, calls = self.pager([5, 4, 3, 2, 1])
+
+        crawl = self.checkpoints.crawl("scope", page, lambda item: item)
+
+        self.assertEqual(next(crawl), [5, 4])
+        self.assertEqual(next(crawl), [3, 2])
+        self.assertEqual(self.checkpoints.get("scope"), {"when": None, "top": 5, "cursor": "4"})
+
+        crawl.close()
+
+        # Catches up to where the last started then resumes where it left off
+
+        page, calls = self.pager([7, 6, 5, 4, 3, 2, 1])
+
+        self.assertEqual(list(self.checkpoints.crawl("scope", page, lambda item: item)), [[7, 6], [5], [3, 2], [1]])
+        self.assertEqual(calls, [None, "6", "4", "2"])
+        self.assertEqual(self.checkpoints.get("scope"), {"when": 7})
+
+
+class TestBsky(unittest.TestCase):
+
+    maxDiff = None
+
+    @unittest.mock.patch("atproto.Client")
+    @unittest.mock.patch("builtins.open", unittest.mock.mock_open(
+        read_data='{"url": "https://bsky.social", "handle": "us", "password": "secret"}'
+    ))
+    @unittest.mock.patch.object(origin.bsky.Client, "load", unittest.mock.MagicMock())
+    def setUp(self, mock_atproto):
+
+        self.daemon = unittest.mock.MagicMock(redis=MockRedis("redis.ledger"))
+        self.daemon.checkpoints = checkpoint.Checkpoints(self.daemon)
+
+        mock_atproto.return_value.login.return_value = types.SimpleNamespace(handle="us")
+
+        self.client = origin.bsky.Client(self.daemon)
+        self.client.handles = ["one", "two"]
+        self.client.witness_ids = {"one": 1, "two": 2}
+
+    @staticmethod
+    def post(uri, author, at):
+
+        return types.SimpleNamespace(
+            uri=uri,
+            cid=f"cid:{uri}",
+            author=types.SimpleNamespace(handle=author),
+            record=types.SimpleNamespace(created_at=at, text=f"text:{uri}")
+        )
+
+    def pages(self, *pages):
+
+        return unittest.mock.MagicMock(side_effect=list(pages))
+
+    def test_make_time(self):
+
+        self.assertEqual(self.client.make_time("1970-01-02T00:00:10.123Z"), 24*60*60 + 10)
+
+    def test_handle(self):
+
+        client = unittest.mock.MagicMock(witness_ids={"one": 1})
+        self.daemon.clients.get.return_value = client
+
+        # Posts are synced once however many times they were asked for
+
+        origin.bsky.handle(self.daemon, [
+            {"posts": "posts"},
+            {"posts": "posts"},
+            {"witness": json.dumps({"id": 1, "who": "one"})}
+        ])
+
+        client.load.assert_not_called()
+        client.posts.assert_called_once_with()
+        client.witness.assert_called_once_with({"id": 1, "who": "one"})
+        self.assertEqual(self.daemon.inflight.release.call_args_list, [
+            unittest.mock.call("bsky/posts"),
+            unittest.mock.call("witness/1")
+        ])
+
+        # New witnesses reload them
+
+        origin.bsky.handle(self.daemon, [{"witness": json.dumps({"id": 2, "who": "two"})}])
+        client.load.assert_called_once_with()
+
+        # Failures drop the client and leave the witness in flight
+
+        self.daemon.inflight.release.reset_mock()
+        client.witness.side_effect = Exception("down")
+
+        self.assertRaisesRegex(Exception, "down", origin.bsky.handle, self.daemon, [{"witness": json.dumps({"id": 1, "who": "one"})}])
+        self.daemon.clients.drop.assert_called_once_with("bsky")
+        self.daemon.inflight.release.assert_not_called()
+
+    def test_witness_posts(self):
+
+        ours = self.post("ours", "one", "2026-10-14T17:00:00.000Z")
+        theirs = self.post("theirs", "three", "2026-10-14T16:00:00.000Z")
+        older = self.post("older", "one", "2026-10-13T17:00:00.000Z")
+
+        self.client.post_likes = unittest.mock.MagicMock()
+        self.client.author_feed = self.pages(
+            ([types.SimpleNamespace(post=ours), types.SimpleNamespace(post=theirs)], "next"),
+            ([types.SimpleNamespace(post=older)], None)
+        )
+
+        self.client.witness_posts({"id": 1, "who": "one"})
+
+        self.assertEqual(self.client.author_feed.call_args_list, [
+            unittest.mock.call("one", None),
+            unittest.mock.call("one", "next")
+        ])
+        self.assertEqual(self.client.post_likes.call_args_list, [unittest.mock.call(ours), unittest.mock.call(older)])
+        self.assertEqual(self.daemon.facts.call_args_list, [
+            unittest.mock.call([{
+                "witness_id": 1,
+                "who": "post:ours",
+                "when": self.client.make_time(ours.record.created_at),
+                "what": {"cid": "cid:ours", "author": "one", "created_at": ours.record.created_at, "text": "text:ours"}
+            }]),
+            unittest.mock.call([{
+                "witness_id": 1,
+                "who": "post:older",
+                "when": self.client.make_time(older.record.created_at),
+                "what": {"cid": "cid:older", "author": "one", "created_at": older.record.created_at, "text": "text:older"}
+            }])
+        ])
+        self.assertEqual(self.daemon.checkpoints.get("bsky/witness/1"), {"when": self.client.make_time(ours.record.created_at)})
+
+        # Next time stops at what we've already got
+
+        newer = self.post("newer", "one", "2026-10-15T17:00:00.000Z")
+
+        self.daemon.facts.reset_mock()
+        self.client.author_feed = self.pages(([types.SimpleNamespace(post=newer)], "next"), ([types.SimpleNamespace(post=older)], "more"))
+
+        self.client.witness_posts({"id": 1, "who": "one"})
+
+        self.assertEqual(self.client.author_feed.call_count, 2)
+        self.assertEqual([fact["who"] for call in self.daemon.facts.call_args_list for fact in call.args[0]], ["post:newer"])
+        self.assertEqual(self.daemon.checkpoints.get("bsky/witness/1"), {"when": self.client.make_time(newer.record.created_at)})
+
+    def test_post_likes(self):
+
+        post = self.post("ours", "us", "2026-10-14T17:00:00.000Z")
+
+        self.client.likes = self.pages(([
+            types.SimpleNamespace(actor=types.SimpleNamespace(handle="two"), created_at="2026-10-14T18:00:00.000Z"),
+            types.SimpleNamespace(actor=types.SimpleNamespace(handle="stranger"), created_at="2026-10-14T17:30:00.000Z")
+        ], None))
+
+        self.client.post_likes(post)
+
+        self.client.likes.assert_called_once_with("ours", None)
+        self.daemon.facts.assert_called_once_with([{
+            "witness_id": 2,
+            "who": "like:ours:two",
+            "when": self.client.make_time("2026-10-14T18:00:00.000Z"),
+            "what": {
+                "actor": "two",
+                "post": {"cid": "cid:ours", "author": "us", "created_at": "2026-10-14T17:00:00.000Z", "text": "text:ours"}
+            }
+        }])
+        self.assertEqual(self.daemon.checkpoints.get("bsky/likes/ours"), {"when": self.client.make_time("2026-10-14T18:00:00.000Z")})
+
+    def test_posts(self):
+
+        recent = self.post("recent", "us", "2026-10-14T17:00:00.000Z")
+        old = self.post("old", "us", "2026-10-01T17:00:00.000Z")
+
+        self.client.post_likes = unittest.mock.MagicMock()
+        self.client.post_replies = unittest.mock.MagicMock()
+
+        # Our recent posts are checked again each time for new likes and replies
+
+        self.daemon.checkpoints.set("bsky/posts", when=self.client.make_time(recent.record.created_at))
+
+        self.client.author_feed = self.pages(([types.SimpleNamespace(post=recent), types.SimpleNamespace(post=old)], "next"))
+
+        self.client.posts()
+
+        self.client.author_feed.assert_called_once_with("us", None)
+        self.client.post_likes.assert_called_once_with(recent)
+        self.client.post_replies.assert_called_once_with(recent)
+        self.assertEqual(self.daemon.checkpoints.get("bsky/posts"), {"when": self.client.make_time(recent.record.created_at)})
+
+
+class TestInFlight(unittest.TestCase):
+
+    def setUp(self):
+
+        self.daemon = unittest.mock.MagicMock(redis=MockRedis("redis.ledger"))
+        self.inflight = inflight.InFlight(self.daemon, ttl=60)
+
+    def test___init__(self):
+
+        self.assertEqual(self.inflight.daemon, self.daemon)
+        self.assertEqual(self.inflight.ttl, 60)
+
+    def test_key(self):
+
+        self.assertEqual(self.inflight.key("witness/1"), "ledger/inflight/witness/1")
+
+    def test_claim(self):
+
+        self.assertTrue(self.inflight.claim("witness/1"))
+        self.assertFalse(self.inflight.claim("witness/1"))
+        self.assertTrue(self.inflight.claim("witness/2"))
+
+        self.assertEqual(self.daemon.redis.expires, {"ledger/inflight/witness/1": 60, "ledger/inflight/witness/2": 60})
+
+    def test_release(self):
+
+        self.inflight.claim("witness/1")
+        self.inflight.release("witness/1")
+        self.inflight.release("witness/2")
+
+        self.assertEqual(self.daemon.redis.values, {})
+        self.assertTrue(self.inflight.claim("witness/1"))
+
+
+class TestWork(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+
+        self.daemon = unittest.mock.MagicMock(redis=MockRedis("redis.ledger"))
+        self.daemon.name = "one"
+        self.work = work.Work(self.daemon, partitions=4, maxlen=1000, lease=30, idle=60)
+
+    def test___init__(self):
+
+        self.assertEqual(self.work.daemon, self.daemon)
+        self.assertEqual(self.work.partitions, 4)
+        self.assertEqual(self.work.maxlen, 1000)
+        self.assertEqual(self.work.lease, 30)
+        self.assertEqual(self.work.idle, 60)
+        self.assertEqual(self.work.owned, set())
+        self.assertEqual(self.work.partitioned, {})
+
+    def test_key(self):
+
+        self.assertEqual(self.work.key("members"), "ledger/work/members")
+        self.assertEqual(self.work.key("lease", 1), "ledger/work/lease/1")
+
+    def test_stream(self):
+
+        self.assertEqual(self.work.stream("witness", 1), "witness/3")
+        self.assertEqual(self.work.stream("witness", 1), self.work.stream("witness", "1"))
+        self.assertEqual(
+            sorted({self.work.stream("witness", key) for key in range(100)}),
+            ["witness/0", "witness/1", "witness/2", "witness/3"]
+        )
+
+        self.work.partitions = 1
+        self.assertEqual(self.work.stream("witness", 1), "witness")
+
+    def test_streams(self):
+
+        self.assertEqual(self.work.streams("witness"), ["witness/0", "witness/1", "witness/2", "witness/3"])
+        self.assertEqual(self.work.partitioned["witness/2"], 2)
+
+        self.work.partitions = 1
+        self.assertEqual(self.work.streams("posts"), ["posts"])
+        self.assertEqual(self.work.partitioned["posts"], 0)
+
+    @unittest.mock.patch("time.time")
+    def test_members(self, mock_time):
+
+        mock_time.return_value = 100
+
+        self.daemon.redis.zsets["ledger/work/members"] = {"two": 90, "one": 100, "gone": 69}
+
+        self.assertEqual(self.work.members(), ["one", "two"])
+        self.assertEqual(self.daemon.redis.zsets["ledger/work/members"], {"two": 90, "one": 100})
+
+    def test_held(self):
+
+        self.assertEqual(self.work.held([]), set())
+        self.assertEqual(self.work.held([1, 2]), set())
+
+        self.daemon.redis.values["ledger/work/lease/1"] = "one"
+        self.daemon.redis.values["ledger/work/lease/2"] = "two"
+        self.assertEqual(self.work.held([1, 2]), {1})
+
+    @unittest.mock.patch("time.time")
+    def test_heartbeat(self, mock_time):
+
+        mock_time.return_value = 100
+
+        self.work.owned = {0, 1}
+        self.daemon.redis.values = {"ledger/work/lease/0": "one", "ledger/work/lease/1": "two"}
+
+        self.work.heartbeat()
+
+        self.assertEqual(self.daemon.redis.zsets["ledger/work/members"], {"one": 100})
+        self.assertEqual(self.daemon.redis.expires, {"ledger/work/lease/0": 30})
+        self.assertEqual(self.work.owned, {0})
+        self.assertEqual(len(self.daemon.redis.pipelined), 1)
+
+    def test_beat(self):
+
+        self.work.heartbeat = unittest.mock.MagicMock(side_effect=[Exception("down"), None])
+        self.work.stopped = unittest.mock.MagicMock()
+        self.work.stopped.wait.side_effect = [False, False, True]
+
+        self.work.beat()
+
+        self.work.stopped.wait.assert_called_with(10)
+        self.assertEqual(self.work.heartbeat.call_count, 2)
+        self.daemon.logger.warning.assert_called_once_with("heartbeat", exc_info=True)
+
+    def test_start(self):
+
+        self.work.lease = 0.003
+        self.work.heartbeat = unittest.mock.MagicMock()
+
+        thread = self.work.start()
+        self.assertTrue(thread.daemon)
+
+        while not self.work.heartbeat.called:
+            thread.join(0.001)
+
+        self.work.stop()
+        thread.join(1)
+
+        self.assertFalse(thread.is_alive())
+
+    @unittest.mock.patch("time.time")
+    def test_balance(self, mock_time):
+
+        mock_time.return_value = 100
+
+        self.work.balance()
+
+        self.assertEqual(self.work.owned, {0, 1, 2, 3})
+        self.assertEqual(self.work.members(), ["one"])
+        self.assertEqual(self.daemon.redis.values["ledger/work/lease/3"], "one")
+        self.assertEqual(self.daemon.redis.expires["ledger/work/lease/3"], 30)
+
+        # Not again until a third of a lease has passed
+
+        self.daemon.redis.values.clear()
+
+        mock_time.return_value = 109
+        self.work.balance()
+        self.assertEqual(self.daemon.redis.values, {})
+
+        mock_time.return_value = 110
+        self.work.balance()
+        self.assertEqual(len(self.daemon.redis.values), 4)
+
+        # Another joins, we let go of half and it can only take them after
+
+        other = work.Work(unittest.mock.MagicMock(redis=self.daemon.redis), partitions=4)
+        other.daemon.name = "two"
+
+        other.balance()
+        self.assertEqual(other.owned, set())
+
+        mock_time.return_value = 120
+        self.work.balance()
+        self.assertEqual(self.work.owned, {0, 2})
+        self.assertNotIn("ledger/work/lease/1", self.daemon.redis.values)
+
+        other.balanced = 0
+        other.balance()
+        self.assertEqual(other.owned, {1, 3})
+
+    def test_holding(self):
+
+        self.work.streams("witness")
+        self.daemon.redis.values["ledger/work/lease/1"] = "one"
+
+        self.assertEqual(
+            self.work.holding(["origin", "witness/1", "witness/2"]),
+            ["origin", "witness/1"]
+        )
+
+    def test_add(self):
+
+        self.work.maxlen = 50
+        self.work.add("witness", 1, witness="{}")
+
+        self.assertEqual(self.daemon.redis.queue["witness/3"], [{"witness": "{}"}])
+        self.assertEqual(self.daemon.redis.maxlens["witness/3"], (50, True))
+
+    def test_mine(self):
+
+        self.work.streams("witness")
+        self.work.owned = {1, 3}
+
+        self.assertEqual(
+            self.work.mine(["origin", "witness/0", "witness/1", "witness/2", "witness/3"]),
+            ["origin", "witness/1", "witness/3"]
+        )
+
+    @unittest.mock.patch("time.time")
+    def test_reclaim(self, mock_time):
+
+        mock_time.return_value = 100
+
+        self.work.streams("witness")
+        self.daemon.redis.zsets["ledger/work/members"] = {"one": 100, "two": 100}
+
+        self.daemon.redis.pending = {
+            "origin": [
+                {"message_id": "1-0", "consumer": "gone", "time_since_delivered": 90000, "times_delivered": 1},
+                {"message_id": "2-0", "consumer": "two", "time_since_delivered": 90000, "times_delivered": 1},
+                {"message_id": "3-0", "consumer": "one", "time_since_delivered": 90000, "times_delivered": 1},
+                {"message_id": "4-0", "consumer": "gone", "time_since_delivered": 1000, "times_delivered": 1}
+            ],
+            "witness/1": [
+                {"message_id": "5-0", "consumer": "two", "time_since_delivered": 90000, "times_delivered": 1}
+            ],
+            "witness/3": [
+                {"message_id": "6-0", "consumer": "gone", "time_since_delivered": 1000, "times_delivered": 1}
+            ]
+        }
+        self.daemon.redis.claimable = {"1-0": {"origin": "{}"}, "5-0": {"witness": "{}"}}
+
+        # Only from the dead or us, unless it's a partition another lost the lease on
+
+        self.assertEqual(self.work.reclaim(["origin", "witness/1", "witness/3"], 10), [
+            ["origin", [["1-0", {"origin": "{}"}]]],
+            ["witness/1", [["5-0", {"witness": "{}"}]]]
+        ])
+        self.assertEqual(self.daemon.redis.claims, [
+            {"stream": "origin", "group": "daemon", "consumer": "one", "idle": 60000, "ids": ["1-0", "3-0"]},
+            {"stream": "witness/1", "group": "daemon", "consumer": "one", "idle": 60000, "ids": ["5-0"]}
+        ])
+        self.daemon.logger.info.assert_any_call("reclaimed", extra={"stream": "origin", "entries": 1})
+
+        # Not again until a lease has passed
+
+        mock_time.return_value = 129
+        self.assertEqual(self.work.reclaim(["witness/1"], 10), [])
+
+        mock_time.return_value = 130
+        self.assertEqual(len(self.work.reclaim(["witness/1"], 10)), 1)
+
+
+class TestPipeline(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+
+        self.daemon = unittest.mock.MagicMock()
+        self.written = []
+        self.daemon.facts.side_effect = lambda facts: self.written.append([fact["who"] for fact in facts])
+        self.pipeline = pipeline.Pipeline(self.daemon, size=3, batch=2, latency=0.01, retry=0)
+
+    def test___init__(self):
+
+        self.assertEqual(self.pipeline.daemon, self.daemon)
+        self.assertEqual(self.pipeline.size, 3)
+        self.assertEqual(self.pipeline.batch, 2)
+        self.assertEqual(self.pipeline.latency, 0.01)
+        self.assertEqual(self.pipeline.retry, 0)
+
+    def test_add(self):
+
+        async def add():
+
+            self.pipeline.start()
+            self.pipeline.task.cancel()
+
+            for who in ["one", "two", "three"]:
+                await self.pipeline.add(witness_id=1, who=who)
+
+            # Full so the next has to wait
+
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(self.pipeline.add(witness_id=1, who="four"), 0.01)
+
+            return self.pipeline.queue.qsize()
+
+        self.assertEqual(asyncio.run(add()), 3)
+
+    def test_collect(self):
+
+        async def collect():
+
+            self.pipeline.queue = asyncio.Queue()
+
+            for who in ["one", "two", "three"]:
+                await self.pipeline.add(witness_id=1, who=who)
+
+            return [
+                [fact["who"] for fact in await self.pipeline.collect()],
+                [fact["who"] for fact in await self.pipeline.collect()]
+            ]
+
+        self.assertEqual(asyncio.run(collect()), [["one", "two"], ["three"]])
+
+    def test_transient(self):
+
+        self.assertTrue(pipeline.Pipeline.transient(requests.ConnectionError("down")))
+        self.assertTrue(pipeline.Pipeline.transient(requests.HTTPError("busy", response=unittest.mock.MagicMock(status_code=503))))
+        self.assertTrue(pipeline.Pipeline.transient(requests.HTTPError("slow down", response=unittest.mock.MagicMock(status_code=429))))
+        self.assertFalse(pipeline.Pipeline.transient(requests.HTTPError("bad", response=unittest.mock.MagicMock(status_code=400))))
+        self.assertFalse(pipeline.Pipeline.transient(KeyError("who")))
+
+    def test_write(self):
+
+        self.daemon.facts.side_effect = [requests.ConnectionError("down"), None]
+
+        async def write():
+
+            self.pipeline.queue = asyncio.Queue()
+
+            await self.pipeline.add(witness_id=1, who="one")
+            await self.pipeline.write([await self.pipeline.queue.get()])
+
+            return self.pipeline.queue._unfinished_tasks
+
+        self.assertEqual(asyncio.run(write()), 0)
+        self.assertEqual(self.daemon.facts.call_count, 2)
+        self.daemon.logger.error.assert_called_once_with("write failed", extra={"error": "down", "facts": 1})
+
+        # Rejected batches are dropped rather than holding everything up
+
+        self.daemon.facts.reset_mock()
+        self.daemon.facts.side_effect = requests.HTTPError("bad", response=unittest.mock.MagicMock(status_code=400))
+
+        self.assertEqual(asyncio.run(write()), 0)
+        self.assertEqual(self.daemon.facts.call_count, 1)
+        self.daemon.logger.error.assert_called_with("write dropped", extra={"error": "bad", "facts": 1})
+
+    def test_stop(self):
+
+        async def run():
+
+            self.pipeline.start()
+
+            for who in ["one", "two", "three", "four", "five"]:
+                await self.pipeline.add(witness_id=1, who=who)
+
+            await self.pipeline.stop()
+
+            await asyncio.sleep(0)
+
+            return self.pipeline.task.cancelled()
+
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual(self.written, [["one", "two"], ["three", "four"], ["five"]])
+
+
+class TestDiscord(unittest.TestCase):
+
+    maxDiff = None
+
+    CREATED = datetime.datetime(2026, 10, 18, 12, tzinfo=datetime.timezone.utc)
+
+    @unittest.mock.patch("ledger.Witness.many")
+    def setUp(self, mock_many):
+
+        mock_many.return_value = [types.SimpleNamespace(id=10, who="1"), types.SimpleNamespace(id=20, who="2")]
+
+        self.daemon = unittest.mock.MagicMock()
+        self.writes = unittest.mock.MagicMock(task=None)
+        self.writes.add = unittest.mock.AsyncMock()
+        self.writes.stop = unittest.mock.AsyncMock()
+
+        self.client = origin.discord.OriginClient(
+            daemon=self.daemon, writes=self.writes, intents=origin.discord.discord.Intents.default()
+        )
+
+        mock_many.assert_called_once_with(origin__who="discord")
+
+    @staticmethod
+    def user(id, name): # pylint: disable=redefined-builtin
+
+        return types.SimpleNamespace(id=id, name=name, discriminator="0", bot=False, dm_channel=None)
+
+    def message(self, author, mentions=None):
+
+        return types.SimpleNamespace(
+            id=5,
+            content="hi",
+            author=author,
+            channel=types.SimpleNamespace(id=3, name="general"),
+            guild=types.SimpleNamespace(id=7, name="guild"),
+            mentions=mentions or [],
+            attachments=[],
+            created_at=self.CREATED,
+            reference=None
+        )
+
+    def test___init__(self):
+
+        self.assertEqual(self.client.daemon, self.daemon)
+        self.assertEqual(self.client.pipeline, self.writes)
+        self.assertEqual(self.client.user_ids, [1, 2])
+        self.assertEqual(self.client.witness_ids, {1: 10, 2: 20})
+
+    def test_setup_hook(self):
+
+        asyncio.run(self.client.setup_hook())
+
+        self.writes.start.assert_called_once_with()
+
+    @unittest.mock.patch("discord.Client.close", new_callable=unittest.mock.AsyncMock)
+    def test_close(self, mock_close):
+
+        # Never started, so nothing to write
+
+        asyncio.run(self.client.close())
+
+        self.writes.stop.assert_not_awaited()
+        mock_close.assert_awaited_once_with()
+
+        self.writes.task = unittest.mock.MagicMock()
+
+        asyncio.run(self.client.close())
+
+        self.writes.stop.assert_awaited_once_with()
+        self.assertEqual(mock_close.await_count, 2)
+
+    def test_on_message(self):
+
+        message = self.message(self.user(1, "one"))
+
+        asyncio.run(self.client.on_message(message))
+
+        self.writes.add.assert_awaited_once_with(
+            witness_id=10,
+            who="message:5",
+            when=self.CREATED.timestamp(),
+            what={
+                "id": "5",
+                "content": "hi",
+                "author": {"id": "1", "name": "one", "discriminator": "0", "bot": False},
+                "channel": {"id": "3", "type": "guild", "name": "general", "guild": {"id": "7", "name": "guild"}},
+                "attachments": [],
+                "created_at": str(self.CREATED)
+            }
+        )
+
+        # Only for those we're witnessing
+
+        self.writes.add.reset_mock()
+
+        asyncio.run(self.client.on_message(self.message(self.user(3, "three"), mentions=[self.user(4, "four")])))
+
+        self.writes.add.assert_not_awaited()
+
+    def test_on_reaction_add(self):
+
+        reaction = types.SimpleNamespace(emoji="+1", message=self.message(self.user(2, "two")))
+
+        asyncio.run(self.client.on_reaction_add(reaction, self.user(1, "one")))
+
+        self.assertEqual([call.kwargs["witness_id"] for call in self.writes.add.await_args_list], [10, 20])
+
+        for call in self.writes.add.await_args_list:
+            self.assertEqual(call.kwargs["who"], "reaction:5:+1")
+            self.assertEqual(call.kwargs["when"], self.CREATED.timestamp())
+            self.assertEqual(call.kwargs["what"]["user"]["id"], "1")
+            self.assertEqual(call.kwargs["what"]["message"]["author"]["id"], "2")
+
+
+class TestLimiter(unittest.TestCase):
+
+    @unittest.mock.patch("time.sleep")
+    @unittest.mock.patch("time.monotonic")
+    def test_wait(self, mock_monotonic, mock_sleep):
+
+        clock = [100.0]
+
+        mock_monotonic.side_effect = lambda: clock[0]
+        mock_sleep.side_effect = lambda delay: clock.__setitem__(0, clock[0] + delay)
+
+        limiter = origin.zoom.Limiter(2)
+
+        self.assertEqual(limiter.burst, 2)
+
+        # Bursts right away, then waits its rate
+
+        limiter.wait()
+        limiter.wait()
+        mock_sleep.assert_not_called()
+
+        limiter.wait()
+        mock_sleep.assert_called_once_with(0.5)
+        self.assertEqual(clock[0], 100.5)
+
+        # Idle time refills, but only up to the burst
+
+        clock[0] += 10
+
+        for _ in range(2):
+            limiter.wait()
+
+        self.assertEqual(mock_sleep.call_count, 1)
+
+
+class TestZoom(unittest.TestCase):
+
+    def setUp(self):
+
+        self.daemon = unittest.mock.MagicMock(redis=MockRedis("redis.ledger"))
+        self.daemon.inflight = inflight.InFlight(self.daemon)
+        self.daemon.clients = clients.Clients(self.daemon)
+
+    @unittest.mock.patch("ledger.Witness.many")
+    def test_origin(self, mock_many):
+
+        mock_many.return_value = [
+            unittest.mock.MagicMock(id=1, **{"export.return_value": {"id": 1}}),
+            unittest.mock.MagicMock(id=2, **{"export.return_value": {"id": 2}})
+        ]
+
+        # Still being synced, so not queued again
+
+        self.daemon.inflight.claim("witness/2")
+
+        origin.zoom.origin(self.daemon, {"id": 3})
+
+        mock_many.assert_called_once_with(origin_id=3)
+        self.daemon.work.add.assert_called_once_with("ledger/origin/zoom/witness", 1, witness='{"id": 1}')
+        self.daemon.logger.info.assert_any_call("inflight", extra={"witness": {"id": 2}})
+
+        self.assertFalse(self.daemon.inflight.claim("witness/1"))
+
+    @unittest.mock.patch("origin.zoom.Client")
+    def test_handle(self, mock_client):
+
+        mock_client.return_value.expires = None
+
+        witness = {"id": 1, "entity_id": 5}
+        self.daemon.inflight.claim("witness/1")
+
+        # One client per account, reused across witnesses
+
+        origin.zoom.handle(self.daemon, [{}, {"witness": json.dumps(witness)}, {"witness": json.dumps(witness)}])
+
+        mock_client.assert_called_once_with(self.daemon, 5)
+        self.assertEqual(mock_client.return_value.witness.call_args_list, [unittest.mock.call(witness)] * 2)
+        self.assertTrue(self.daemon.inflight.claim("witness/1"))
+
+        # Failures drop the client and leave the witness in flight
+
+        mock_client.return_value.witness.side_effect = Exception("down")
+
+        self.assertRaisesRegex(Exception, "down", origin.zoom.handle, self.daemon, [{"witness": json.dumps(witness)}])
+        self.assertNotIn("zoom/5", self.daemon.clients.clients)
+        self.assertFalse(self.daemon.inflight.claim("witness/1"))
+
+        mock_client.return_value.witness.side_effect = None
+
+        origin.zoom.handle(self.daemon, [{"witness": json.dumps(witness)}])
+        self.assertEqual(mock_client.call_count, 2)
+
+
+class TestZoomClient(unittest.TestCase):
+
+    maxDiff = None
+
+    @unittest.mock.patch("time.time", unittest.mock.MagicMock(return_value=100))
+    @unittest.mock.patch("builtins.open", unittest.mock.mock_open(
+        read_data='{"client_id": "id", "client_secret": "secret", "account_id": "account"}'
+    ))
+    def setUp(self):
+
+        self.daemon = unittest.mock.MagicMock()
+        self.session = self.daemon.clients.session.return_value
+        self.session.headers = {}
+        self.session.post.return_value.json.return_value = {"access_token": "token", "expires_in": 3600}
+
+        self.client = origin.zoom.Client(self.daemon, 1)
+
+    def response(self, status, body=None, headers=None):
+
+        response = unittest.mock.MagicMock(status_code=status, headers=headers or {})
+        response.json.return_value = body
+
+        if status >= 400:
+            response.raise_for_status.side_effect = Exception(status)
+
+        return response
+
+    def test___init__(self):
+
+        self.assertEqual(self.client.expires, 100 + 3600 - 60)
+        self.assertEqual(self.session.headers["Authorization"], "Bearer token")
+        self.assertEqual(self.session.post.call_args.kwargs["data"], {"grant_type": "account_credentials", "account_id": "account"})
+
+    def test_timestamp(self):
+
+        self.assertEqual(origin.zoom.Client.timestamp("2026-10-14T17:46:40Z"), 1792000000)
+
+    @unittest.mock.patch("time.sleep")
+    def test_get(self, mock_sleep):
+
+        self.client.limiter = unittest.mock.MagicMock()
+
+        self.session.get.side_effect = [
+            self.response(429, headers={"Retry-After": "2"}),
+            self.response(200, {"summaries": []})
+        ]
+
+        self.assertEqual(self.client.get("https://api.zoom.us/v2/meetings/meeting_summaries", {"a": 1}), {"summaries": []})
+        mock_sleep.assert_called_once_with(2.0)
+        self.assertEqual(self.client.limiter.wait.call_count, 2)
+        self.session.get.assert_called_with("https://api.zoom.us/v2/meetings/meeting_summaries", params={"a": 1})
+
+        # Gives up after so many retries
+
+        mock_sleep.reset_mock()
+        self.session.get.side_effect = None
+        self.session.get.return_value = self.response(429)
+
+        self.assertRaisesRegex(Exception, "429", self.client.get, "https://api.zoom.us/v2/users")
+        self.assertEqual(mock_sleep.call_count, self.client.RETRIES)
+        mock_sleep.assert_called_with(1.0)
+
+    @unittest.mock.patch("time.time", unittest.mock.MagicMock(return_value=1792000000))
+    def test_meeting_summaries(self):
+
+        self.client.get = unittest.mock.MagicMock(side_effect=[
+            {"summaries": [1, 2], "next_page_token": "next"},
+            {"summaries": [3], "next_page_token": ""}
+        ])
+
+        self.assertEqual(list(self.client.meeting_summaries(1790812800)), [[1, 2], [3]])
+
+        params = {"page_size": 300, "from": "2026-10-01T00:00:00Z", "to": "2026-10-14T17:46:40Z"}
+
+        self.assertEqual(self.client.get.call_args_list, [
+            unittest.mock.call("https://api.zoom.us/v2/meetings/meeting_summaries", params),
+            unittest.mock.call("https://api.zoom.us/v2/meetings/meeting_summaries", {**params, "next_page_token": "next"})
+        ])
+
+        # Everything when there's no mark yet
+
+        self.client.get = unittest.mock.MagicMock(return_value={"summaries": [1]})
+
+        self.assertEqual(list(self.client.meeting_summaries()), [[1]])
+        self.client.get.assert_called_once_with("https://api.zoom.us/v2/meetings/meeting_summaries", {"page_size": 300})
+
+    def test_witness(self):
+
+        self.daemon.checkpoints.get.return_value = {"when": 1792000000}
+        self.daemon.seen.check.return_value = [False, False, True]
+        self.daemon.missing.return_value = ["meeting_summary:new"]
+
+        self.client.meeting_summaries = unittest.mock.MagicMock(return_value=iter([[
+            {"meeting_uuid": "new", "summary_end_time": "2026-10-14T17:46:40Z"},
+            {"meeting_uuid": "stored", "summary_end_time": "2026-10-14T18:00:00Z"},
+            {"meeting_uuid": "seen", "summary_end_time": "2026-10-13T00:00:00Z"}
+        ]]))
+        self.client.meeting_summary = unittest.mock.MagicMock(return_value={"summary_title": "new"})
+
+        self.client.witness({"id": 1})
+
+        self.client.meeting_summaries.assert_called_once_with(1792000000 - self.client.OVERLAP)
+        self.daemon.missing.assert_called_once_with(1, ["meeting_summary:new", "meeting_summary:stored"])
+        self.daemon.seen.add.assert_called_once_with([{"witness_id": 1, "who": "meeting_summary:stored"}])
+
+        # When is UTC, the same as the mark
+
+        self.daemon.fact.assert_called_once_with(
+            witness_id=1, who="meeting_summary:new", when=1792000000, what={"summary_title": "new"}
+        )
+        self.daemon.writer.flush.assert_called_once_with()
+        self.daemon.checkpoints.set.assert_called_once_with("zoom/witness/1", when=1792000800)
+